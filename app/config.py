@@ -3,6 +3,18 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+def _parse_stage_routes(value: str) -> dict:
+    """解析 "default:ollama,sql:openai>ollama"，没有冒号的项视为 default 路由"""
+    routes = {}
+    for item in value.split(","):
+        stage, sep, backends = item.partition(":")
+        if not sep:
+            stage, backends = "default", stage
+        names = [name.strip() for name in backends.split(">") if name.strip()]
+        if names:
+            routes[stage.strip() or "default"] = names
+    return routes
+
 class Settings:
     # PostgreSQL 配置
     POSTGRES_USER = os.getenv("POSTGRES_USER", "postgres")
@@ -11,14 +23,146 @@ class Settings:
     POSTGRES_PORT = os.getenv("POSTGRES_PORT", "5432")
     POSTGRES_DB = os.getenv("POSTGRES_DB", "text2sql")
     
+    # PostgreSQL 连接池与查询执行配置
+    DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+    DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "5"))
+    DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+    DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+    DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+    SQL_STATEMENT_TIMEOUT_MS = int(os.getenv("SQL_STATEMENT_TIMEOUT_MS", "30000"))
+    SQL_STATEMENT_TIMEOUT_MAX_MS = int(os.getenv("SQL_STATEMENT_TIMEOUT_MAX_MS", "120000"))
+    SQL_STREAM_BATCH_SIZE = int(os.getenv("SQL_STREAM_BATCH_SIZE", "1000"))
+    SQL_STREAM_MAX_ROWS = int(os.getenv("SQL_STREAM_MAX_ROWS", "1000000"))
+    SQL_STREAM_MAX_BYTES = int(os.getenv("SQL_STREAM_MAX_BYTES", str(512 * 1024 * 1024)))
+    
+    # 执行前代价检查配置：估算行数超出上限时自动加 LIMIT，估算代价超出上限时拒绝
+    SQL_GUARD_ENABLED = os.getenv("SQL_GUARD_ENABLED", "true").lower() == "true"
+    SQL_GUARD_MAX_COST = float(os.getenv("SQL_GUARD_MAX_COST", "1000000"))
+    SQL_GUARD_MAX_ROWS = int(os.getenv("SQL_GUARD_MAX_ROWS", "100000"))
+    SQL_GUARD_AUTO_LIMIT = os.getenv("SQL_GUARD_AUTO_LIMIT", "true").lower() == "true"
+    SQL_GUARD_LIMIT_ROWS = int(os.getenv("SQL_GUARD_LIMIT_ROWS", "10000"))
+    SQL_GUARD_CACHE_ENTRIES = int(os.getenv("SQL_GUARD_CACHE_ENTRIES", "4096"))
+    SQL_GUARD_CACHE_TTL = float(os.getenv("SQL_GUARD_CACHE_TTL", "600"))
+    
+    # SQL 执行结果缓存配置：按表修改计数失效
+    QUERY_CACHE_ENABLED = os.getenv("QUERY_CACHE_ENABLED", "true").lower() == "true"
+    QUERY_CACHE_MAX_BYTES = int(os.getenv("QUERY_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+    QUERY_CACHE_TTL = float(os.getenv("QUERY_CACHE_TTL", "300"))
+    QUERY_CACHE_POLL_INTERVAL = float(os.getenv("QUERY_CACHE_POLL_INTERVAL", "2"))
+    
+    # 数据库表结构索引配置
+    SCHEMA_CATALOG_ENABLED = os.getenv("SCHEMA_CATALOG_ENABLED", "true").lower() == "true"
+    SCHEMA_CATALOG_SCHEMA = os.getenv("SCHEMA_CATALOG_SCHEMA", "public")
+    SCHEMA_CATALOG_REFRESH_INTERVAL = float(os.getenv("SCHEMA_CATALOG_REFRESH_INTERVAL", "60"))
+    
     # ChromaDB 配置
     CHROMA_PERSIST_DIRECTORY = os.getenv("CHROMA_PERSIST_DIRECTORY", "./chroma_db")
+    CHROMA_MAX_WORKERS = int(os.getenv("CHROMA_MAX_WORKERS", "4"))
+    CHROMA_INGEST_BATCH_SIZE = int(os.getenv("CHROMA_INGEST_BATCH_SIZE", "256"))
 
     # OpenAI 配置
     OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "your-api-key")
     OPENAI_API_BASE = os.getenv("OPENAI_API_BASE", "https://api.openai.com/v1")
     OPENAI_MODEL_NAME = os.getenv("OPENAI_MODEL_NAME", "gpt-4-turbo-preview")
-    print(OPENAI_MODEL_NAME)
+    OPENAI_TEMPERATURE = float(os.getenv("OPENAI_TEMPERATURE", "0.1"))
+    OPENAI_MAX_TOKENS = int(os.getenv("OPENAI_MAX_TOKENS", "500"))
+    OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", "8"))
+
+    # Ollama 配置
+    OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+    OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "qwen2.5:32b")
+
+    # LLM 连接池配置
+    LLM_POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", "20"))
+    LLM_KEEPALIVE_TIMEOUT = float(os.getenv("LLM_KEEPALIVE_TIMEOUT", "60"))
+    LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+    LLM_READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", "120"))
+    LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+
+    # LLM 后端路由配置：ollama 始终可用，启用 LLM_OPENAI_ENABLED 后增加 OpenAI 兼容后端 openai；
+    # 按阶段指定后端顺序，如 "default:ollama,sql:openai>ollama"，第一个为主后端，其余用于对冲与故障转移
+    LLM_OPENAI_ENABLED = os.getenv("LLM_OPENAI_ENABLED", "false").lower() == "true"
+    LLM_STAGE_ROUTES = _parse_stage_routes(os.getenv("LLM_STAGE_ROUTES", "default:ollama"))
+
+    # 对冲请求配置：主后端超过该阶段历史耗时的指定分位数仍未返回时，向下一个后端发出相同请求
+    LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "true").lower() == "true"
+    LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+    LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+    LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "0.5"))
+
+    # 后端熔断配置：连续失败（含慢调用）达到阈值后熔断，恢复时间后放行探测请求
+    LLM_BREAKER_FAILURE_THRESHOLD = int(os.getenv("LLM_BREAKER_FAILURE_THRESHOLD", "5"))
+    LLM_BREAKER_RECOVERY_TIME = float(os.getenv("LLM_BREAKER_RECOVERY_TIME", "30"))
+    LLM_BREAKER_SLOW_CALL = float(os.getenv("LLM_BREAKER_SLOW_CALL", "60"))
+
+    # NL→SQL 结果缓存配置
+    RESULT_CACHE_ENABLED = os.getenv("RESULT_CACHE_ENABLED", "true").lower() == "true"
+    RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "2048"))
+    RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", "86400"))
+    RESULT_CACHE_FILE = os.getenv("RESULT_CACHE_FILE", "")
+
+    # LLM 分阶段响应缓存配置（TTL 为 0 的阶段不缓存）
+    LLM_MEMO_ENABLED = os.getenv("LLM_MEMO_ENABLED", "true").lower() == "true"
+    LLM_MEMO_MAX_BYTES = int(os.getenv("LLM_MEMO_MAX_BYTES", str(32 * 1024 * 1024)))
+    LLM_MEMO_TTL = float(os.getenv("LLM_MEMO_TTL", "3600"))
+    LLM_MEMO_STAGE_TTLS = {
+        stage.strip(): float(ttl)
+        for stage, ttl in (
+            item.split(":") for item in os.getenv(
+                "LLM_MEMO_STAGE_TTLS", "table:86400,field:86400,constraint:3600,fused:3600,sql:3600"
+            ).split(",") if item.strip()
+        )
+    }
+
+    # 流水线模式：split 为字段识别与约束分析两次调用，fused 为合并成一次调用
+    PIPELINE_MODE = os.getenv("PIPELINE_MODE", "split")
+
+    # 词典表识别配置：置信度达到阈值时跳过 LLM 表识别
+    TABLE_RESOLVER_ENABLED = os.getenv("TABLE_RESOLVER_ENABLED", "true").lower() == "true"
+    TABLE_RESOLVER_THRESHOLD = float(os.getenv("TABLE_RESOLVER_THRESHOLD", "0.9"))
+
+    # 提示词 token 预算（本地估算），超出时裁剪表结构中的字段；0 表示不裁剪
+    PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "4096"))
+
+    # 资源文件热加载配置
+    RESOURCE_WATCH_ENABLED = os.getenv("RESOURCE_WATCH_ENABLED", "true").lower() == "true"
+    RESOURCE_WATCH_INTERVAL = float(os.getenv("RESOURCE_WATCH_INTERVAL", "2"))
+
+    # 表描述向量检索配置
+    TABLE_RETRIEVAL_ENABLED = os.getenv("TABLE_RETRIEVAL_ENABLED", "false").lower() == "true"
+    TABLE_RETRIEVAL_TOP_K = int(os.getenv("TABLE_RETRIEVAL_TOP_K", "20"))
+    TABLE_RETRIEVAL_MIN_SIMILARITY = float(os.getenv("TABLE_RETRIEVAL_MIN_SIMILARITY", "0.2"))
+    TABLE_RETRIEVAL_INCLUDE_COLUMNS = os.getenv("TABLE_RETRIEVAL_INCLUDE_COLUMNS", "false").lower() == "true"
+
+    # SQL 示例库配置：执行成功的 问题 -> SQL 写入 ChromaDB，相似度达到复用阈值时直接复用，
+    # 否则把达到最低相似度的 top-k 示例加入SQL生成提示词
+    EXAMPLE_STORE_ENABLED = os.getenv("EXAMPLE_STORE_ENABLED", "false").lower() == "true"
+    EXAMPLE_REUSE_SIMILARITY = float(os.getenv("EXAMPLE_REUSE_SIMILARITY", "0.97"))
+    EXAMPLE_MIN_SIMILARITY = float(os.getenv("EXAMPLE_MIN_SIMILARITY", "0.6"))
+    EXAMPLE_TOP_K = int(os.getenv("EXAMPLE_TOP_K", "3"))
+    EXAMPLE_INGEST_QUEUE_SIZE = int(os.getenv("EXAMPLE_INGEST_QUEUE_SIZE", "1000"))
+    EXAMPLE_INGEST_BATCH_SIZE = int(os.getenv("EXAMPLE_INGEST_BATCH_SIZE", "32"))
+
+    # 批量生成配置
+    BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "1000"))
+    BATCH_DEFAULT_CONCURRENCY = int(os.getenv("BATCH_DEFAULT_CONCURRENCY", "4"))
+    BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "16"))
+
+    # 日志配置：经队列由后台线程写出，文件按大小滚动；完整提示词/响应按比例采样记录，出错时总是记录
+    LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+    LOG_FILE = os.getenv("LOG_FILE", "app.log")
+    LOG_JSON = os.getenv("LOG_JSON", "true").lower() == "true"
+    LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(50 * 1024 * 1024)))
+    LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "5"))
+    LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+    LOG_PAYLOAD_SAMPLE_RATE = float(os.getenv("LOG_PAYLOAD_SAMPLE_RATE", "0.01"))
+
+    # 多进程服务配置（python -m app.server）：主进程预加载后 fork 工作进程，SIGHUP 滚动重载
+    SERVER_HOST = os.getenv("SERVER_HOST", "0.0.0.0")
+    SERVER_PORT = int(os.getenv("SERVER_PORT", "8000"))
+    SERVER_WORKERS = int(os.getenv("SERVER_WORKERS", "0"))  # 0 表示 CPU 核数
+    SERVER_GRACEFUL_TIMEOUT = float(os.getenv("SERVER_GRACEFUL_TIMEOUT", "30"))
+    SERVER_MEMORY_REPORT_INTERVAL = float(os.getenv("SERVER_MEMORY_REPORT_INTERVAL", "60"))
 
     # 应用配置
     CONFIG_DIR = os.getenv("CONFIG_DIR", os.path.join(os.path.dirname(__file__), "../config"))
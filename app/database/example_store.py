@@ -0,0 +1,190 @@
+from typing import Dict, List, Any, Optional, Tuple
+import asyncio
+import hashlib
+import logging
+import re
+import time
+from app.services.cache_service import LRUCache
+from app.utils.helpers import normalize_query
+from app.utils.metrics import record_example_lookup
+
+logger = logging.getLogger(__name__)
+
+_NUMBER_RE = re.compile(r"\d+(?:\.\d+)?")
+
+class ExampleStore:
+    """
+    已验证的 问题 -> SQL 示例库
+
+    执行成功的SQL连同问题在后台批量写入 ChromaDB，不占用请求路径。
+    请求时检索最相似的历史问题：相似度达到复用阈值且 schema 版本一致时直接复用其SQL，
+    跳过全部 LLM 阶段；否则把达到最低相似度的示例作为 few-shot 加入SQL生成提示词。
+    """
+
+    COLLECTION = "sql_examples"
+
+    def __init__(
+        self,
+        vector_store,
+        reuse_similarity: float = 0.97,
+        min_similarity: float = 0.6,
+        top_k: int = 3,
+        queue_size: int = 1000,
+        batch_size: int = 32
+    ):
+        self.vector_store = vector_store
+        self.reuse_similarity = reuse_similarity
+        self.min_similarity = min_similarity
+        self.top_k = top_k
+        self.batch_size = batch_size
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        # 最近写入过的示例，避免重复执行同一问题时反复写入
+        self._seen = LRUCache(max_entries=queue_size * 10)
+        self._task: Optional[asyncio.Task] = None
+        self._ready = False
+        self._stats = {"queued": 0, "ingested": 0, "dropped": 0, "failed": 0, "reuse": 0, "fewshot": 0, "miss": 0}
+
+    @staticmethod
+    def make_id(question: str) -> str:
+        return hashlib.sha256(normalize_query(question).encode("utf-8")).hexdigest()
+
+    # ---- 写入 ----
+
+    def add(
+        self,
+        question: str,
+        sql: str,
+        description: Optional[str],
+        tables: List[str],
+        schema_version: str
+    ) -> bool:
+        """加入写入队列，不等待写入完成；队列已满或近期已写入时返回 False"""
+        example_id = self.make_id(question)
+        if self._seen.get((example_id, sql)) is not None:
+            return False
+        try:
+            self._queue.put_nowait({
+                "id": example_id,
+                "question": question,
+                "sql": sql,
+                "description": description or "",
+                "tables": ",".join(tables),
+                "schema_version": schema_version,
+                "created_at": time.time()
+            })
+        except asyncio.QueueFull:
+            self._stats["dropped"] += 1
+            return False
+        self._seen.set((example_id, sql), True)
+        self._stats["queued"] += 1
+        return True
+
+    async def _write(self, batch: List[Dict[str, Any]]):
+        # 同一批次中的重复问题只保留最新的一条
+        examples = {example["id"]: example for example in batch}
+        await self.vector_store.upsert_documents(
+            self.COLLECTION,
+            documents=[example["question"] for example in examples.values()],
+            metadatas=[{k: v for k, v in example.items() if k != "id"} for example in examples.values()],
+            ids=list(examples)
+        )
+        self._stats["ingested"] += len(examples)
+
+    def _drain(self) -> List[Dict[str, Any]]:
+        batch = []
+        while len(batch) < self.batch_size and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        return batch
+
+    async def _ingest_loop(self):
+        while True:
+            batch = [await self._queue.get()]
+            batch.extend(self._drain())
+            try:
+                await self._write(batch)
+            except Exception as e:
+                self._stats["failed"] += len(batch)
+                logger.error(f"写入SQL示例失败: {str(e)}")
+
+    async def start(self):
+        """创建集合并启动后台写入任务"""
+        await self.vector_store.get_or_create_collection(self.COLLECTION, metadata={"hnsw:space": "cosine"})
+        self._ready = True
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._ingest_loop())
+
+    async def stop(self):
+        """停止后台任务并写入队列中剩余的示例"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        while not self._queue.empty():
+            batch = self._drain()
+            try:
+                await self._write(batch)
+            except Exception as e:
+                self._stats["failed"] += len(batch)
+                logger.error(f"写入SQL示例失败: {str(e)}")
+                break
+
+    # ---- 检索 ----
+
+    async def search(self, question: str) -> List[Dict[str, Any]]:
+        """检索最相似的 top_k 个示例，按相似度降序返回"""
+        if not self._ready:
+            return []
+        try:
+            results = await self.vector_store.query_similar(self.COLLECTION, question, n_results=self.top_k)
+        except Exception as e:
+            # 集合为空或向量库不可用时不影响SQL生成
+            logger.warning(f"检索SQL示例失败: {str(e)}")
+            return []
+        examples = []
+        for metadata, distance in zip(results["metadatas"][0], results["distances"][0]):
+            examples.append({
+                "question": metadata["question"],
+                "sql": metadata["sql"],
+                "description": metadata.get("description") or None,
+                "tables": [t for t in metadata.get("tables", "").split(",") if t],
+                "schema_version": metadata.get("schema_version"),
+                "similarity": 1.0 - distance
+            })
+        examples.sort(key=lambda example: example["similarity"], reverse=True)
+        return examples
+
+    async def lookup(self, question: str, schema_version: str) -> Tuple[Optional[Dict[str, Any]], List[Dict[str, Any]]]:
+        """
+        返回 (可直接复用的示例, few-shot 示例)
+
+        复用要求相似度达到 reuse_similarity、schema 版本一致，且问题中的数字完全相同，
+        避免 "最近7天" 与 "最近30天" 这类只差一个数字的问题复用同一条SQL。
+        """
+        examples = await self.search(question)
+        best = examples[0] if examples else None
+        if (
+            best is not None
+            and best["similarity"] >= self.reuse_similarity
+            and best["schema_version"] == schema_version
+            and _NUMBER_RE.findall(question) == _NUMBER_RE.findall(best["question"])
+        ):
+            result = "reuse"
+            shots = []
+        else:
+            best = None
+            shots = [example for example in examples if example["similarity"] >= self.min_similarity]
+            result = "fewshot" if shots else "miss"
+        self._stats[result] += 1
+        record_example_lookup(result)
+        return best, shots
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self._stats["reuse"] + self._stats["fewshot"] + self._stats["miss"]
+        return {
+            **self._stats,
+            "pending": self._queue.qsize(),
+            "reuse_ratio": self._stats["reuse"] / lookups if lookups else 0.0
+        }
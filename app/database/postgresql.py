@@ -1,18 +1,159 @@
-from sqlalchemy import create_engine
+from typing import Dict, List, Any, Optional, AsyncIterator, Tuple
+from contextlib import asynccontextmanager
+import json
+import time
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
 from app.config import settings
+from app.utils.metrics import stage_timer
 
-SQLALCHEMY_DATABASE_URL = f"postgresql://{settings.POSTGRES_USER}:{settings.POSTGRES_PASSWORD}@{settings.POSTGRES_HOST}:{settings.POSTGRES_PORT}/{settings.POSTGRES_DB}"
+SQLALCHEMY_DATABASE_URL = f"postgresql+asyncpg://{settings.POSTGRES_USER}:{settings.POSTGRES_PASSWORD}@{settings.POSTGRES_HOST}:{settings.POSTGRES_PORT}/{settings.POSTGRES_DB}"
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+engine = create_async_engine(
+    SQLALCHEMY_DATABASE_URL,
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_pre_ping=settings.DB_POOL_PRE_PING,
+    pool_recycle=settings.DB_POOL_RECYCLE,
+    pool_timeout=settings.DB_POOL_TIMEOUT
+)
+SessionLocal = async_sessionmaker(engine, expire_on_commit=False, autoflush=False)
 
 Base = declarative_base()
 
-def get_db():
-    db = SessionLocal()
-    try:
+# 连接池统计信息
+_pool_stats = {
+    "checkouts": 0,
+    "checked_out": 0,
+    "checkout_wait_total": 0.0,
+    "checkout_wait_max": 0.0
+}
+
+@event.listens_for(engine.sync_engine, "checkout")
+def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+    _pool_stats["checked_out"] += 1
+
+@event.listens_for(engine.sync_engine, "checkin")
+def _on_checkin(dbapi_connection, connection_record):
+    _pool_stats["checked_out"] -= 1
+
+def get_pool_stats() -> Dict[str, Any]:
+    """获取连接池饱和度与等待时间统计"""
+    pool = engine.sync_engine.pool
+    checkouts = _pool_stats["checkouts"]
+    capacity = settings.DB_POOL_SIZE + settings.DB_MAX_OVERFLOW
+    return {
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "checked_out": _pool_stats["checked_out"],
+        "overflow": pool.overflow() if hasattr(pool, "overflow") else 0,
+        "saturation": _pool_stats["checked_out"] / capacity if capacity else 0.0,
+        "checkouts": checkouts,
+        "checkout_wait_avg": _pool_stats["checkout_wait_total"] / checkouts if checkouts else 0.0,
+        "checkout_wait_max": _pool_stats["checkout_wait_max"]
+    }
+
+def resolve_statement_timeout(timeout_ms: Optional[int] = None) -> int:
+    """计算本次执行的 statement_timeout，不超过配置的上限"""
+    if not timeout_ms or timeout_ms <= 0:
+        timeout_ms = settings.SQL_STATEMENT_TIMEOUT_MS
+    return min(int(timeout_ms), settings.SQL_STATEMENT_TIMEOUT_MAX_MS)
+
+async def get_db() -> AsyncIterator[AsyncSession]:
+    async with SessionLocal() as db:
         yield db
-    finally:
-        db.close() 
\ No newline at end of file
+
+@asynccontextmanager
+async def readonly_session(timeout_ms: Optional[int] = None) -> AsyncIterator[AsyncSession]:
+    """
+    开启只读事务并设置 statement_timeout 的会话
+
+    事务结束时总是回滚；超时由 PostgreSQL 取消语句，不会占住连接。
+    """
+    async with SessionLocal() as session:
+        start = time.perf_counter()
+        await session.connection()
+        wait = time.perf_counter() - start
+        _pool_stats["checkouts"] += 1
+        _pool_stats["checkout_wait_total"] += wait
+        _pool_stats["checkout_wait_max"] = max(_pool_stats["checkout_wait_max"], wait)
+        try:
+            await session.execute(text("SET TRANSACTION READ ONLY"))
+            await session.execute(text(f"SET LOCAL statement_timeout = {resolve_statement_timeout(timeout_ms)}"))
+            yield session
+        finally:
+            await session.rollback()
+
+async def execute_readonly(sql: str, timeout_ms: Optional[int] = None) -> List[Dict[str, Any]]:
+    """在只读、限时的事务中执行查询并返回全部结果"""
+    async with readonly_session(timeout_ms) as session:
+        with stage_timer("db_execution"):
+            result = await session.execute(text(sql))
+            return [dict(row._mapping) for row in result.fetchall()]
+
+# 表的累计修改行数，用于判断缓存的查询结果是否过期。
+# 统计信息在事务结束后异步上报，可能有约 1 秒的延迟；TRUNCATE 不计入。
+TABLE_COUNTERS_SQL = """
+SELECT relname AS table_name, n_tup_ins + n_tup_upd + n_tup_del AS changes
+FROM pg_stat_user_tables
+WHERE schemaname = :schema AND relname = ANY(:tables)
+"""
+
+async def fetch_table_counters(session_or_conn, tables: List[str], schema: str = "public") -> Dict[str, Optional[int]]:
+    """获取各表的修改计数，统计视图中不存在的表（视图、CTE 名等）计数为 None"""
+    result = await session_or_conn.execute(text(TABLE_COUNTERS_SQL), {"schema": schema, "tables": list(tables)})
+    counters: Dict[str, Optional[int]] = {table: None for table in tables}
+    counters.update({row.table_name: row.changes for row in result})
+    return counters
+
+async def execute_readonly_tracked(
+    sql: str,
+    tables: List[str],
+    timeout_ms: Optional[int] = None,
+    schema: str = "public"
+) -> Tuple[List[Dict[str, Any]], Dict[str, Optional[int]]]:
+    """
+    在只读、限时的事务中执行查询，并返回执行前各表的修改计数
+
+    计数先于查询读取，查询期间或之后的写入都会使计数变化，缓存的结果只会被提前失效。
+    """
+    async with readonly_session(timeout_ms) as session:
+        counters = await fetch_table_counters(session, tables, schema)
+        with stage_timer("db_execution"):
+            result = await session.execute(text(sql))
+            return [dict(row._mapping) for row in result.fetchall()], counters
+
+async def explain_readonly(sql: str, timeout_ms: Optional[int] = None) -> Dict[str, Any]:
+    """在只读、限时的事务中获取查询的估算执行计划（不执行查询），返回根节点"""
+    async with readonly_session(timeout_ms) as session:
+        with stage_timer("sql_explain"):
+            result = await session.execute(text(f"EXPLAIN (FORMAT JSON) {sql}"))
+            plan = result.scalar()
+    # asyncpg 对 json 类型默认返回字符串
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]["Plan"]
+
+def is_statement_timeout(error: Exception) -> bool:
+    """判断异常是否由 statement_timeout 取消查询引起（SQLSTATE 57014）"""
+    orig = getattr(error, "orig", None)
+    return getattr(orig, "sqlstate", None) == "57014"
+
+async def stream_readonly(
+    sql: str,
+    timeout_ms: Optional[int] = None,
+    batch_size: int = 1000
+) -> AsyncIterator[Tuple[List[str], List[tuple]]]:
+    """
+    在只读、限时的事务中通过服务端游标分批读取查询结果
+
+    每批产出 (列名列表, 行元组列表)，内存占用只与批大小有关。
+    """
+    async with readonly_session(timeout_ms) as session:
+        result = await session.stream(
+            text(sql).execution_options(yield_per=batch_size)
+        )
+        columns = list(result.keys())
+        async for partition in result.partitions(batch_size):
+            yield columns, [tuple(row) for row in partition]
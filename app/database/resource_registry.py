@@ -0,0 +1,211 @@
+from typing import Dict, List, Any, Optional, Callable, Tuple
+from pathlib import Path
+import asyncio
+import hashlib
+import json
+import logging
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+class ResourceRegistry:
+    """
+    提示词模板、表 DDL、字段说明与业务规则的内存注册表
+
+    启动时一次性加载并预解析全部资源文件，请求路径只读内存快照；
+    文件变更由后台轮询任务检测，重新加载后以整体替换快照的方式原子生效。
+    """
+
+    def __init__(self, resources_dir: Optional[Path] = None, config_dir: Optional[str] = None):
+        self.resources_dir = resources_dir or Path(__file__).parent.parent / "resources"
+        self.config_dir = config_dir or settings.CONFIG_DIR
+        self._snapshot: Dict[str, Any] = {}
+        self._signature: Tuple = ()
+        self._listeners: List[Callable[["ResourceRegistry"], Any]] = []
+        self._watch_task: Optional[asyncio.Task] = None
+        self.load()
+
+    # ---- 加载与解析 ----
+
+    def _resource_files(self) -> List[Path]:
+        return (
+            sorted(self.resources_dir.glob("prompts/*.md"))
+            + sorted(self.resources_dir.glob("schemas/ddl/*.md"))
+            + sorted(self.resources_dir.glob("schemas/descriptions/*.md"))
+            + [Path(self.config_dir) / "business_rules.json", Path(self.config_dir) / "table_synonyms.json"]
+        )
+
+    def _scan_signature(self) -> Tuple:
+        """获取资源文件的 (路径, 修改时间, 大小) 签名，用于检测变更"""
+        signature = []
+        for path in self._resource_files():
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            signature.append((str(path), stat.st_mtime_ns, stat.st_size))
+        return tuple(signature)
+
+    def load(self):
+        """加载全部资源并原子替换当前快照"""
+        signature = self._scan_signature()
+        digest = hashlib.sha256()
+        prompts: Dict[str, str] = {}
+        ddl: Dict[str, Dict[str, Any]] = {}
+        descriptions: Dict[str, Dict[str, str]] = {}
+        business_rules: Dict[str, List[str]] = {}
+        table_synonyms: Dict[str, List[str]] = {}
+
+        for path in self._resource_files():
+            if not path.exists():
+                continue
+            content = path.read_text(encoding="utf-8")
+            digest.update(f"{path.parent.name}/{path.name}".encode("utf-8"))
+            digest.update(content.encode("utf-8"))
+
+            kind = path.parent.name
+            if kind == "prompts":
+                prompts[path.stem] = content
+            elif kind == "ddl":
+                ddl[path.stem] = self._parse_ddl(path.stem, content)
+            elif kind == "descriptions":
+                descriptions[path.stem] = {
+                    "content": content,
+                    "summary": self._parse_description_summary(content)
+                }
+            elif path.name == "business_rules.json":
+                try:
+                    business_rules = json.loads(content)
+                except json.JSONDecodeError as e:
+                    logger.error(f"业务规则配置解析失败: {str(e)}")
+            elif path.name == "table_synonyms.json":
+                try:
+                    table_synonyms = json.loads(content)
+                except json.JSONDecodeError as e:
+                    logger.error(f"表同义词配置解析失败: {str(e)}")
+
+        self._snapshot = {
+            "version": digest.hexdigest()[:16],
+            "prompts": prompts,
+            "ddl": ddl,
+            "descriptions": descriptions,
+            "business_rules": business_rules,
+            "table_synonyms": table_synonyms
+        }
+        self._signature = signature
+        logger.info(
+            f"资源注册表已加载: version={self.version}, prompts={len(prompts)}, "
+            f"ddl={len(ddl)}, descriptions={len(descriptions)}"
+        )
+
+    @staticmethod
+    def _parse_ddl(table: str, content: str) -> Dict[str, Any]:
+        """解析 DDL 文件：SQL 代码块、字段说明与业务规则"""
+        sql = ""
+        start = content.find("```sql")
+        end = content.find("```", start + 6)
+        if start != -1 and end != -1:
+            sql = content[start + 6:end].strip()
+
+        fields: Dict[str, str] = {}
+        if "## 字段说明" in content:
+            section = content.split("## 字段说明")[1].split("\n## ")[0]
+            for line in section.split("\n"):
+                line = line.strip()
+                if line.startswith("- ") and ":" in line:
+                    name, desc = line[2:].split(":", 1)
+                    fields[name.strip()] = desc.strip()
+
+        rules: List[str] = []
+        if "## 业务规则" in content:
+            rules_section = content.split("## 业务规则")[1].strip()
+            rules = [
+                f"{table}: {r.lstrip('123456789.').strip()}"
+                for r in rules_section.split("\n")
+                if r.strip() and r.strip()[0].isdigit()
+            ]
+
+        return {"content": content, "sql": sql, "fields": fields, "rules": rules}
+
+    @staticmethod
+    def _parse_description_summary(content: str) -> str:
+        """提取描述（第一段内容，跳过标题行）"""
+        lines = content.split("\n")
+        return lines[2].strip() if len(lines) > 2 else ""
+
+    # ---- 读取接口 ----
+
+    @property
+    def version(self) -> str:
+        return self._snapshot["version"]
+
+    def get_prompt(self, name: str) -> str:
+        prompts = self._snapshot["prompts"]
+        if name not in prompts:
+            raise FileNotFoundError(f"模板不存在: {name}")
+        return prompts[name]
+
+    def get_table_ddl(self, table: str) -> Optional[Dict[str, Any]]:
+        """获取表的 DDL 解析结果（content/sql/fields/rules），不存在时返回 None"""
+        return self._snapshot["ddl"].get(table)
+
+    def get_ddl_tables(self) -> List[str]:
+        """获取所有有 DDL 文件的表名"""
+        return list(self._snapshot["ddl"])
+
+    def get_table_descriptions(self) -> Dict[str, Dict[str, str]]:
+        """获取所有表的描述信息（content/summary）"""
+        return self._snapshot["descriptions"]
+
+    def get_business_rules_config(self) -> Dict[str, List[str]]:
+        return self._snapshot["business_rules"]
+
+    def get_table_synonyms(self) -> Dict[str, List[str]]:
+        """获取表同义词配置：表名 -> 用户常用的叫法"""
+        return self._snapshot["table_synonyms"]
+
+    # ---- 变更监听 ----
+
+    def add_listener(self, callback: Callable[["ResourceRegistry"], Any]):
+        """注册资源重新加载后的回调，回调可以是普通函数或协程函数"""
+        self._listeners.append(callback)
+
+    async def reload_if_changed(self) -> bool:
+        """检测资源文件变更，变更时重新加载并通知监听者"""
+        loop = asyncio.get_running_loop()
+        signature = await loop.run_in_executor(None, self._scan_signature)
+        if signature == self._signature:
+            return False
+        logger.info("检测到资源文件变更，重新加载")
+        await loop.run_in_executor(None, self.load)
+        for callback in self._listeners:
+            try:
+                result = callback(self)
+                if asyncio.iscoroutine(result):
+                    await result
+            except Exception as e:
+                logger.error(f"资源变更回调执行失败: {str(e)}", exc_info=True)
+        return True
+
+    async def _watch(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.reload_if_changed()
+            except Exception as e:
+                logger.error(f"资源文件监听失败: {str(e)}", exc_info=True)
+
+    def start_watching(self, interval: float = 2.0):
+        """启动后台轮询任务监听资源文件变更"""
+        if self._watch_task is None or self._watch_task.done():
+            self._watch_task = asyncio.get_running_loop().create_task(self._watch(interval))
+            logger.info(f"已启动资源文件监听: interval={interval}s")
+
+    async def stop_watching(self):
+        if self._watch_task is not None:
+            self._watch_task.cancel()
+            try:
+                await self._watch_task
+            except asyncio.CancelledError:
+                pass
+            self._watch_task = None
@@ -0,0 +1,153 @@
+from typing import Dict, List, Any, Optional, Callable
+import asyncio
+import logging
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+logger = logging.getLogger(__name__)
+
+# 一次查询加载所有表、字段、类型与注释
+CATALOG_SQL = """
+SELECT c.relname AS table_name,
+       obj_description(c.oid, 'pg_class') AS table_comment,
+       a.attname AS column_name,
+       format_type(a.atttypid, a.atttypmod) AS data_type,
+       col_description(c.oid, a.attnum) AS column_comment
+FROM pg_class c
+JOIN pg_namespace n ON n.oid = c.relnamespace
+LEFT JOIN pg_attribute a
+       ON a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped
+WHERE n.nspname = :schema
+  AND c.relkind IN ('r', 'p', 'v', 'm')
+  AND (CAST(:load_all AS boolean) OR c.relname = ANY(:tables))
+ORDER BY c.relname, a.attnum
+"""
+
+# 每张表的变更签名：pg_class、pg_attribute、pg_description 中相关行的最大 xmin。
+# DDL 或 COMMENT 会改写这些目录行，签名随之变化；查询只读目录表，开销很小。
+SIGNATURE_SQL = """
+SELECT c.relname AS table_name,
+       c.xmin::text
+       || ':' || COALESCE((
+            SELECT max(a.xmin::text::bigint) FROM pg_attribute a
+            WHERE a.attrelid = c.oid AND a.attnum > 0
+          ), 0)::text
+       || ':' || COALESCE((
+            SELECT max(d.xmin::text::bigint) FROM pg_description d
+            WHERE d.objoid = c.oid AND d.classoid = 'pg_class'::regclass
+          ), 0)::text AS signature
+FROM pg_class c
+JOIN pg_namespace n ON n.oid = c.relnamespace
+WHERE n.nspname = :schema
+  AND c.relkind IN ('r', 'p', 'v', 'm')
+"""
+
+class SchemaCatalog:
+    """
+    数据库表结构的内存索引
+
+    启动时用一次目录查询加载全部表、字段、类型与注释；之后定期比较每张表的
+    目录签名，只重新加载发生变化的表。字段相关性判断只读内存，不访问数据库。
+    """
+
+    def __init__(self, engine: AsyncEngine, schema: str = "public"):
+        self.engine = engine
+        self.schema = schema
+        # table -> {"name", "description", "columns": [{"name", "type", "description"}]}
+        self.tables: Dict[str, Dict[str, Any]] = {}
+        self._signatures: Dict[str, str] = {}
+        # 是否已完成全量加载；多进程模式下由主进程预加载，工作进程不再重复加载
+        self.loaded = False
+        self._listeners: List[Callable[["SchemaCatalog"], Any]] = []
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    def add_listener(self, callback: Callable[["SchemaCatalog"], Any]):
+        """注册表结构变化后的回调"""
+        self._listeners.append(callback)
+
+    async def _fetch_tables(self, conn, tables: Optional[List[str]] = None) -> Dict[str, Dict[str, Any]]:
+        result = await conn.execute(
+            text(CATALOG_SQL),
+            {"schema": self.schema, "load_all": tables is None, "tables": tables or []}
+        )
+        loaded: Dict[str, Dict[str, Any]] = {}
+        for row in result:
+            table = loaded.setdefault(row.table_name, {
+                "name": row.table_name,
+                "description": row.table_comment or "",
+                "columns": []
+            })
+            if row.column_name is not None:
+                table["columns"].append({
+                    "name": row.column_name,
+                    "type": row.data_type,
+                    "description": row.column_comment or ""
+                })
+        return loaded
+
+    async def _fetch_signatures(self, conn) -> Dict[str, str]:
+        result = await conn.execute(text(SIGNATURE_SQL), {"schema": self.schema})
+        return {row.table_name: row.signature for row in result}
+
+    async def load(self):
+        """全量加载表结构"""
+        async with self.engine.connect() as conn:
+            signatures = await self._fetch_signatures(conn)
+            tables = await self._fetch_tables(conn)
+        self.tables = tables
+        self._signatures = signatures
+        self.loaded = True
+        logger.info(f"已加载表结构索引: {len(tables)} 张表")
+        await self._notify()
+
+    async def refresh(self) -> bool:
+        """比较目录签名，只重新加载新增或变化的表，返回是否有变化"""
+        async with self.engine.connect() as conn:
+            signatures = await self._fetch_signatures(conn)
+            changed = [t for t, sig in signatures.items() if self._signatures.get(t) != sig]
+            removed = [t for t in self._signatures if t not in signatures]
+            if not changed and not removed:
+                return False
+            reloaded = await self._fetch_tables(conn, changed) if changed else {}
+
+        tables = {t: info for t, info in self.tables.items() if t not in removed and t not in changed}
+        tables.update(reloaded)
+        self.tables = tables
+        self._signatures = signatures
+        logger.info(f"表结构索引已增量刷新: 更新 {len(changed)} 张, 删除 {len(removed)} 张")
+        await self._notify()
+        return True
+
+    async def _notify(self):
+        for callback in self._listeners:
+            try:
+                result = callback(self)
+                if asyncio.iscoroutine(result):
+                    await result
+            except Exception as e:
+                logger.error(f"表结构变更回调执行失败: {str(e)}", exc_info=True)
+
+    async def _refresh_loop(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                if self._signatures:
+                    await self.refresh()
+                else:
+                    await self.load()
+            except Exception as e:
+                logger.error(f"刷新表结构索引失败: {str(e)}")
+
+    def start_refreshing(self, interval: float = 60.0):
+        """启动后台任务定期检查表结构变化"""
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.get_running_loop().create_task(self._refresh_loop(interval))
+
+    async def stop_refreshing(self):
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+            try:
+                await self._refresh_task
+            except asyncio.CancelledError:
+                pass
+            self._refresh_task = None
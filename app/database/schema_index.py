@@ -0,0 +1,141 @@
+from typing import Dict, List, Any, Iterable, Optional, Tuple
+from collections import defaultdict
+import math
+import re
+import unicodedata
+
+__all__ = ['tokenize', 'SchemaTokenIndex']
+
+_WORD_RE = re.compile(r"[0-9a-z]+|[㐀-䶿一-鿿豈-﫿]+")
+
+# 名称命中比注释命中更可信
+NAME_WEIGHT = 2.0
+COMMENT_WEIGHT = 1.0
+
+def _is_cjk(ch: str) -> bool:
+    return ch >= "㐀"
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """
+    将名称或自然语言切分为检索词
+
+    英文/数字按非字母数字字符（含下划线）切分，并附加去掉复数 s 的形式；
+    中文没有空格，按相邻两个字符切分（单字片段保留单字）。
+    """
+    if not text:
+        return []
+    text = unicodedata.normalize("NFKC", text).casefold()
+    tokens = []
+    for piece in _WORD_RE.findall(text):
+        if _is_cjk(piece[0]):
+            if len(piece) == 1:
+                tokens.append(piece)
+            else:
+                tokens.extend(piece[i:i + 2] for i in range(len(piece) - 1))
+        else:
+            tokens.append(piece)
+            if len(piece) > 3 and piece.endswith("s") and not piece.endswith("ss"):
+                tokens.append(piece[:-1])
+    return tokens
+
+class SchemaTokenIndex:
+    """
+    表名、字段名及其注释的倒排索引
+
+    检索词 -> 表 / (表, 字段) 的权重，权重为命中位置的权重乘以 IDF。
+    查询时只遍历问题自身的检索词，不随表和字段数量增长。
+    """
+
+    def __init__(self):
+        # token -> {table: weight}
+        self._tables: Dict[str, Dict[str, float]] = {}
+        # token -> {table: {column: weight}}
+        self._columns: Dict[str, Dict[str, Dict[str, float]]] = {}
+        self._table_info: Dict[str, Dict[str, str]] = {}
+        self._column_info: Dict[str, Dict[str, Dict[str, str]]] = {}
+
+    def __len__(self) -> int:
+        return len(self._table_info)
+
+    @staticmethod
+    def _add_terms(postings: Dict[str, float], name: str, comment: str):
+        for token in tokenize(name):
+            postings[token] = max(postings.get(token, 0.0), NAME_WEIGHT)
+        for token in tokenize(comment):
+            postings[token] = max(postings.get(token, 0.0), COMMENT_WEIGHT)
+
+    def build(self, tables: Dict[str, Dict[str, Any]]):
+        """
+        根据表结构构建索引，构建完成后整体替换，查询不会看到半成品
+
+        tables 格式与 SchemaCatalog.tables 相同：
+        table -> {"name", "description", "columns": [{"name", "type", "description"}]}
+        """
+        table_postings: Dict[str, Dict[str, float]] = defaultdict(dict)
+        column_postings: Dict[str, Dict[str, Dict[str, float]]] = defaultdict(lambda: defaultdict(dict))
+        table_info: Dict[str, Dict[str, str]] = {}
+        column_info: Dict[str, Dict[str, Dict[str, str]]] = {}
+        column_count = 0
+
+        for table_name, table in tables.items():
+            table_info[table_name] = {"name": table_name, "description": table.get("description") or ""}
+            terms: Dict[str, float] = {}
+            self._add_terms(terms, table_name, table_info[table_name]["description"])
+            for token, weight in terms.items():
+                table_postings[token][table_name] = weight
+
+            columns = column_info.setdefault(table_name, {})
+            for column in table.get("columns", []):
+                columns[column["name"]] = {
+                    "table": table_name,
+                    "name": column["name"],
+                    "type": str(column.get("type") or ""),
+                    "description": column.get("description") or ""
+                }
+                terms = {}
+                self._add_terms(terms, column["name"], columns[column["name"]]["description"])
+                for token, weight in terms.items():
+                    column_postings[token][table_name][column["name"]] = weight
+                column_count += 1
+
+        # 乘以 IDF：出现在越多元素中的检索词（如 id、时间）区分度越低
+        for token, postings in table_postings.items():
+            idf = math.log(1 + len(table_info) / len(postings))
+            for table_name in postings:
+                postings[table_name] *= idf
+        for token, by_table in column_postings.items():
+            idf = math.log(1 + column_count / sum(len(cols) for cols in by_table.values()))
+            for cols in by_table.values():
+                for column_name in cols:
+                    cols[column_name] *= idf
+
+        self._tables = dict(table_postings)
+        self._columns = {token: dict(by_table) for token, by_table in column_postings.items()}
+        self._table_info = table_info
+        self._column_info = column_info
+
+    def search_tables(self, text: str, extra_terms: Iterable[str] = ()) -> List[Tuple[Dict[str, str], float]]:
+        """返回与问题（及额外检索词，如已识别的实体）相关的表，按得分降序"""
+        tokens = set(tokenize(text))
+        for term in extra_terms:
+            tokens.update(tokenize(term))
+        scores: Dict[str, float] = defaultdict(float)
+        for token in tokens:
+            for table_name, weight in self._tables.get(token, {}).items():
+                scores[table_name] += weight
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        return [(self._table_info[name], score) for name, score in ranked]
+
+    def search_fields(self, text: str, tables: Iterable[str]) -> List[Tuple[Dict[str, str], float]]:
+        """返回指定表中与问题相关的字段，按得分降序"""
+        tables = [t for t in tables if t in self._column_info]
+        scores: Dict[Tuple[str, str], float] = defaultdict(float)
+        for token in set(tokenize(text)):
+            by_table = self._columns.get(token)
+            if not by_table:
+                continue
+            for table_name in tables:
+                for column_name, weight in by_table.get(table_name, {}).items():
+                    scores[(table_name, column_name)] += weight
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        return [(self._column_info[t][c], score) for (t, c), score in ranked]
@@ -1,94 +1,165 @@
-from typing import List, Dict, Any
-from sqlalchemy import MetaData, inspect
+from typing import List, Dict, Any, Optional, Tuple
+from sqlalchemy import MetaData
 from sqlalchemy.ext.asyncio import AsyncEngine
 import json
 import os
 from app.config import settings
+from app.database.resource_registry import ResourceRegistry
+from app.database.table_catalog import TableCatalogIndex
+from app.database.schema_catalog import SchemaCatalog
+from app.database.schema_index import SchemaTokenIndex
+from app.utils.tokenizer import count_tokens
 import logging
-from pathlib import Path
 
 logger = logging.getLogger(__name__)
 
+MAX_DERIVED_ENTRIES = 1024
+
+# CREATE TABLE 中的表级约束，裁剪字段时始终保留
+TABLE_CONSTRAINT_PREFIXES = ("PRIMARY KEY", "FOREIGN KEY", "UNIQUE", "CONSTRAINT", "CHECK", "EXCLUDE")
+
+def _split_definitions(body: str) -> List[str]:
+    """按顶层逗号拆分 CREATE TABLE 括号内的定义，忽略 VARCHAR(50)、NUMERIC(10,2) 等内部逗号"""
+    items, depth, start = [], 0, 0
+    for i, ch in enumerate(body):
+        if ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+        elif ch == "," and depth == 0:
+            items.append(body[start:i])
+            start = i + 1
+    items.append(body[start:])
+    return [item.strip() for item in items if item.strip()]
+
+def parse_create_table(sql: str) -> Optional[Dict[str, Any]]:
+    """
+    拆分 CREATE TABLE 语句
+
+    返回 {"header", "columns": [(字段名, 定义)], "constraints", "footer"}，无法解析时返回 None。
+    """
+    start, end = sql.find("("), sql.rfind(")")
+    if start == -1 or end <= start:
+        return None
+    columns, constraints = [], []
+    for item in _split_definitions(sql[start + 1:end]):
+        if item.upper().startswith(TABLE_CONSTRAINT_PREFIXES):
+            constraints.append(item)
+        else:
+            columns.append((item.split()[0].strip('"'), item))
+    return {
+        "header": sql[:start + 1].rstrip(),
+        "columns": columns,
+        "constraints": constraints,
+        "footer": sql[end:].strip()
+    }
+
+def _is_key_column(name: str, definition: str) -> bool:
+    """主键、外键及命名为关联字段的列，裁剪时始终保留以便生成 JOIN"""
+    upper = definition.upper()
+    return "PRIMARY KEY" in upper or "REFERENCES" in upper or name == "id" or name.endswith("_id")
+
 class SchemaStore:
-    def __init__(self, engine: AsyncEngine):
+    def __init__(
+        self,
+        engine: AsyncEngine,
+        registry: ResourceRegistry,
+        table_catalog: Optional[TableCatalogIndex] = None,
+        catalog: Optional[SchemaCatalog] = None
+    ):
         self.engine = engine
         self.metadata = MetaData()
-        self.cache = {}
-        self.resources_dir = Path(__file__).parent.parent / "resources"
-        self.descriptions_dir = self.resources_dir / "schemas" / "descriptions"
-        self.ddl_dir = self.resources_dir / "schemas" / "ddl"
-        # 加载业务规则配置
-        self.business_rules = self._load_business_rules()
+        self.registry = registry
+        # 数据库表结构的内存索引，启动时批量加载
+        self.catalog = catalog or SchemaCatalog(engine, settings.SCHEMA_CATALOG_SCHEMA)
+        self.table_catalog = table_catalog
+        # 表名/字段名及注释的倒排索引，表结构或资源文件变化时重建
+        self.token_index = SchemaTokenIndex()
+        self.catalog.add_listener(lambda _: self.rebuild_token_index())
+        self.registry.add_listener(lambda _: self.rebuild_token_index())
+        # 由资源派生的结果（表目录文本、表集合的 DDL 拼接），随资源版本失效
+        self._derived: Dict[Any, Any] = {}
+        self._derived_version: Optional[str] = None
         
-    def _load_business_rules(self) -> Dict[str, List[str]]:
-        """加载业务规则配置文件"""
-        rules_path = os.path.join(settings.CONFIG_DIR, "business_rules.json")
-        try:
-            with open(rules_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except FileNotFoundError:
-            return {}
+    def _get_derived(self, key: Any, build) -> Any:
+        """读取或构建由资源派生的结果，资源版本变化或条目过多时整体失效"""
+        version = self.schema_version
+        if version != self._derived_version or len(self._derived) > MAX_DERIVED_ENTRIES:
+            self._derived = {}
+            self._derived_version = version
+        if key not in self._derived:
+            self._derived[key] = build()
+        return self._derived[key]
+    
+    @property
+    def business_rules(self) -> Dict[str, List[str]]:
+        """业务规则配置"""
+        return self.registry.get_business_rules_config()
+    
+    @property
+    def schema_version(self) -> str:
+        """schema/prompt 版本指纹，用于缓存失效"""
+        return self.registry.version
+    
+    def rebuild_token_index(self):
+        """
+        重建倒排索引
+
+        以数据库表结构为准，数据库中缺少注释时用资源文件中的表描述和字段说明补全；
+        数据库表结构尚未加载时只索引资源文件中的表及其 DDL 中的字段。
+        """
+        descriptions = self.registry.get_table_descriptions()
+        table_names = set(self.catalog.tables) | set(descriptions) | set(self.registry.get_ddl_tables())
+        tables: Dict[str, Dict[str, Any]] = {}
+        for table_name in table_names:
+            db_table = self.catalog.tables.get(table_name)
+            ddl = self.registry.get_table_ddl(table_name)
+            field_docs = ddl["fields"] if ddl else {}
+            if db_table is not None:
+                columns = [
+                    {**column, "description": column["description"] or field_docs.get(column["name"], "")}
+                    for column in db_table["columns"]
+                ]
+                description = db_table["description"]
+            else:
+                parsed = parse_create_table(ddl["sql"]) if ddl else None
+                names = [name for name, _ in parsed["columns"]] if parsed else list(field_docs)
+                columns = [
+                    {"name": name, "type": "", "description": field_docs.get(name, "")}
+                    for name in names
+                ]
+                description = ""
+            if not description and table_name in descriptions:
+                description = descriptions[table_name]["summary"]
+            tables[table_name] = {"name": table_name, "description": description, "columns": columns}
+        self.token_index.build(tables)
+        logger.info(f"表结构倒排索引已重建: {len(tables)} 张表")
     
     async def get_relevant_tables(
         self,
         entities: List[str],
         query_text: str
     ) -> List[Dict[str, str]]:
-        """获取相关的表结构信息"""
-        if not self.cache.get('tables'):
-            # 使用 SQLAlchemy inspect 获取数据库表信息
-            async with self.engine.connect() as conn:
-                inspector = inspect(conn)
-                tables = []
-                for table_name in await inspector.get_table_names():
-                    comment = await inspector.get_table_comment(table_name)
-                    tables.append({
-                        "name": table_name,
-                        "description": comment.get("text", ""),
-                        "columns": await inspector.get_columns(table_name)
-                    })
-                self.cache['tables'] = tables
-        
-        # 根据实体和查询文本过滤相关表
-        relevant_tables = []
-        for table in self.cache['tables']:
-            if any(entity.lower() in table['name'].lower() for entity in entities) or \
-               any(entity.lower() in table['description'].lower() for entity in entities) or \
-               table['name'].lower() in query_text.lower():
-                relevant_tables.append({
-                    "name": table['name'],
-                    "description": table['description']
-                })
-        
-        return relevant_tables
+        """获取相关的表结构信息，按与问题和实体的匹配得分降序"""
+        if not len(self.token_index):
+            self.rebuild_token_index()
+        return [
+            dict(table)
+            for table, _ in self.token_index.search_tables(query_text, entities)
+        ]
     
     async def get_relevant_fields(
         self,
         tables: List[Dict[str, str]],
         query_text: str
     ) -> List[Dict[str, str]]:
-        """获取相关的字段信息"""
-        relevant_fields = []
-        async with self.engine.connect() as conn:
-            inspector = inspect(conn)
-            for table in tables:
-                columns = await inspector.get_columns(table['name'])
-                for column in columns:
-                    # 获取字段注释
-                    comment = await self._get_column_comment(
-                        inspector,
-                        table['name'],
-                        column['name']
-                    )
-                    if self._is_field_relevant(column['name'], comment, query_text):
-                        relevant_fields.append({
-                            "table": table['name'],
-                            "name": column['name'],
-                            "type": str(column['type']),
-                            "description": comment or ""
-                        })
-        
-        return relevant_fields
+        """获取相关的字段信息，按与问题的匹配得分降序"""
+        if not len(self.token_index):
+            self.rebuild_token_index()
+        return [
+            dict(field)
+            for field, _ in self.token_index.search_fields(query_text, [t['name'] for t in tables])
+        ]
     
     async def get_business_rules(
         self,
@@ -100,114 +171,229 @@ class SchemaStore:
             if entity in self.business_rules:
                 rules.extend(self.business_rules[entity])
         return rules
-    
-    async def _get_column_comment(
-        self,
-        inspector,
-        table_name: str,
-        column_name: str
-    ) -> str:
-        """获取字段注释"""
-        try:
-            return await inspector.get_column_comment(
-                table_name,
-                column_name
-            )
-        except:
-            return ""
-    
-    def _is_field_relevant(
-        self,
-        field_name: str,
-        comment: str,
-        query_text: str
-    ) -> bool:
-        """判断字段是否相关"""
-        query_terms = query_text.lower().split()
-        field_terms = field_name.lower().split('_')
-        comment_terms = comment.lower().split() if comment else []
-        
-        # 检查字段名或注释是否与查询相关
-        return any(
-            term in query_terms
-            for term in field_terms + comment_terms
-        )
 
-    async def get_all_tables_info(self) -> str:
-        """获取所有表的基本描述信息"""
+    async def get_all_tables_info(self, query: Optional[str] = None) -> str:
+        """
+        获取表的基本描述信息
+        
+        启用表描述向量索引且传入问题时，只返回与问题最相似的 top-k 张表。
+        """
         try:
-            tables_info = []
-            
-            if not self.descriptions_dir.exists():
-                raise FileNotFoundError(f"表描述目录不存在: {self.descriptions_dir}")
+            descriptions = self.registry.get_table_descriptions()
             
-            # 读取所有表描述文件
-            for file_path in self.descriptions_dir.glob("*.md"):
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                
-                # 提取表名（文件名去掉.md后缀）
-                table_name = file_path.stem
-                
-                # 提取描述（第一段内容）
-                description = ""
-                lines = content.split("\n")
-                if len(lines) > 2:  # 跳过标题行
-                    description = lines[2].strip()
-                
-                info = f"- {table_name}: {description}"
-                tables_info.append(info.strip())
+            if (
+                self.table_catalog is not None
+                and query
+                and len(descriptions) > settings.TABLE_RETRIEVAL_TOP_K
+            ):
+                try:
+                    candidates = await self.table_catalog.search(
+                        query,
+                        top_k=settings.TABLE_RETRIEVAL_TOP_K,
+                        min_similarity=settings.TABLE_RETRIEVAL_MIN_SIMILARITY
+                    )
+                    logger.info(f"向量检索到的候选表: {candidates}")
+                    return self._format_tables_info(
+                        [c["table"] for c in candidates if c["table"] in descriptions]
+                    )
+                except Exception as e:
+                    logger.error(f"向量检索候选表失败，使用全部表: {str(e)}", exc_info=True)
             
-            result = "\n\n".join(tables_info)
-            logger.info(f"从描述文件获取到的表信息: {result}")
-            return result
+            # 全量表目录只在资源版本变化时重新拼接
+            return self._get_derived(
+                "tables_info",
+                lambda: self._format_tables_info(list(descriptions))
+            )
             
         except Exception as e:
             logger.error(f"获取表信息失败: {str(e)}", exc_info=True)
             raise
     
+    def _format_tables_info(self, table_names: List[str]) -> str:
+        descriptions = self.registry.get_table_descriptions()
+        return "\n\n".join(
+            f"- {table_name}: {descriptions[table_name]['summary']}".strip()
+            for table_name in table_names
+        )
+    
     async def get_tables_schema(self, tables: List[str]) -> str:
-        """获取指定表的DDL和字段信息"""
+        """获取指定表的DDL和字段信息，相同表集合的结果在资源版本内复用"""
         try:
-            schemas = []
-            
-            for table in tables:
-                file_path = self.ddl_dir / f"{table}.md"
-                if not file_path.exists():
-                    logger.warning(f"表DDL文件不存在: {file_path}")
-                    continue
-                
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                schemas.append(content)
-            
-            return "\n\n".join(schemas)
+            return self._get_derived(("tables_schema", tuple(tables)), lambda: self._build_tables_schema(tables))
         except Exception as e:
             logger.error(f"获取表结构失败: {str(e)}", exc_info=True)
             raise
     
+    def _build_tables_schema(self, tables: List[str]) -> str:
+        schemas = []
+        for table in tables:
+            ddl = self.registry.get_table_ddl(table)
+            if ddl is None:
+                logger.warning(f"表DDL文件不存在: {table}")
+                continue
+            schemas.append(ddl["content"])
+        return "\n\n".join(schemas)
+    
+    async def get_budgeted_tables_schema(
+        self,
+        tables: List[str],
+        reserved_tokens: int = 0,
+        query: Optional[str] = None,
+        keep_fields: Optional[Dict[str, List[str]]] = None,
+        sql_only: bool = False
+    ) -> Tuple[str, Dict[str, int]]:
+        """
+        在 token 预算内拼接指定表的结构
+
+        预算为 PROMPT_TOKEN_BUDGET 减去提示词其余部分占用的 reserved_tokens。
+        主键、外键和关联字段始终保留；传入 keep_fields 时只额外保留这些字段，
+        否则按与问题的相关度依次加入字段直到用完预算。预算允许时以注释列出被省略的
+        字段名，否则只注明省略的数量。sql_only 为 True 时只输出 CREATE TABLE 语句，
+        否则附带保留字段的说明和业务规则。
+
+        返回 (表结构文本, token 统计)。
+        """
+        budget = settings.PROMPT_TOKEN_BUDGET
+        if budget <= 0:
+            if sql_only:
+                text = "\n\n".join(
+                    ddl["sql"] for ddl in (self.registry.get_table_ddl(t) for t in tables) if ddl
+                )
+            else:
+                text = await self.get_tables_schema(tables)
+            return text, {"schema_tokens": count_tokens(text), "omitted_columns": 0}
+        
+        max_tokens = max(budget - reserved_tokens, 0)
+        if keep_fields is None:
+            return self._build_budgeted_schema(tables, max_tokens, query, None, sql_only)
+        key = (
+            "budgeted_schema", tuple(tables), max_tokens, sql_only,
+            tuple((t, tuple(sorted(set(f)))) for t, f in sorted(keep_fields.items()))
+        )
+        text, stats = self._get_derived(
+            key, lambda: self._build_budgeted_schema(tables, max_tokens, query, keep_fields, sql_only)
+        )
+        return text, dict(stats)
+    
+    def _parsed_ddl(self, table: str) -> Optional[Dict[str, Any]]:
+        ddl = self.registry.get_table_ddl(table)
+        if ddl is None:
+            return None
+        return self._get_derived(("parsed_ddl", table), lambda: parse_create_table(ddl["sql"]))
+    
+    def _render_table(
+        self,
+        table: str,
+        kept: set,
+        sql_only: bool,
+        list_omitted: bool
+    ) -> str:
+        ddl = self.registry.get_table_ddl(table)
+        parsed = self._parsed_ddl(table)
+        if parsed is None:
+            return ddl["sql"] if sql_only else ddl["content"]
+        
+        lines = [f"    {definition}" for name, definition in parsed["columns"] if name in kept]
+        lines.extend(f"    {constraint}" for constraint in parsed["constraints"])
+        body = ",\n".join(lines)
+        omitted = [name for name, _ in parsed["columns"] if name not in kept]
+        if omitted:
+            if list_omitted:
+                body += f"\n    -- 省略 {len(omitted)} 个字段: {', '.join(omitted)}"
+            else:
+                body += f"\n    -- 省略 {len(omitted)} 个字段"
+        sql = f"{parsed['header']}\n{body}\n{parsed['footer']}"
+        if sql_only:
+            return sql
+        
+        title = ddl["content"].split("\n", 1)[0]
+        sections = [title if title.startswith("#") else f"# {table} 表结构", f"```sql\n{sql}\n```"]
+        field_docs = [f"- {name}: {doc}" for name, doc in ddl["fields"].items() if name in kept]
+        if field_docs:
+            sections.append("## 字段说明\n" + "\n".join(field_docs))
+        if ddl["rules"]:
+            rules = [rule.split(": ", 1)[-1] for rule in ddl["rules"]]
+            sections.append("## 业务规则\n" + "\n".join(f"{i}. {rule}" for i, rule in enumerate(rules, 1)))
+        return "\n\n".join(sections)
+    
+    def _column_cost(self, table: str, name: str, definition: str, sql_only: bool) -> int:
+        cost = count_tokens(definition) + 1
+        if not sql_only:
+            doc = self.registry.get_table_ddl(table)["fields"].get(name)
+            if doc:
+                cost += count_tokens(f"- {name}: {doc}")
+        return cost
+    
+    def _build_budgeted_schema(
+        self,
+        tables: List[str],
+        max_tokens: int,
+        query: Optional[str],
+        keep_fields: Optional[Dict[str, List[str]]],
+        sql_only: bool
+    ) -> Tuple[str, Dict[str, int]]:
+        missing = [t for t in tables if self.registry.get_table_ddl(t) is None]
+        if missing:
+            logger.warning(f"表DDL文件不存在: {missing}")
+        tables = [t for t in tables if t not in missing]
+        kept: Dict[str, set] = {}
+        candidates: List[Tuple[str, str, str]] = []
+        for table in tables:
+            parsed = self._parsed_ddl(table)
+            if parsed is None:
+                kept[table] = set()
+                continue
+            wanted = set((keep_fields or {}).get(table, []))
+            kept[table] = {
+                name for name, definition in parsed["columns"]
+                if name in wanted or _is_key_column(name, definition)
+            }
+            if keep_fields is None:
+                candidates.extend(
+                    (table, name, definition) for name, definition in parsed["columns"]
+                    if name not in kept[table]
+                )
+        
+        if candidates:
+            # 与问题相关的字段优先，其余按建表顺序
+            if not len(self.token_index):
+                self.rebuild_token_index()
+            ranked = {
+                (field["table"], field["name"]): i
+                for i, (field, _) in enumerate(self.token_index.search_fields(query or "", tables))
+            }
+            candidates.sort(key=lambda c: ranked.get((c[0], c[1]), len(ranked)))
+            used = count_tokens(self._join_tables(tables, kept, sql_only, False))
+            for table, name, definition in candidates:
+                cost = self._column_cost(table, name, definition, sql_only)
+                if used + cost <= max_tokens:
+                    kept[table].add(name)
+                    used += cost
+        
+        text = self._join_tables(tables, kept, sql_only, True)
+        tokens = count_tokens(text)
+        if tokens > max_tokens:
+            text = self._join_tables(tables, kept, sql_only, False)
+            tokens = count_tokens(text)
+            if tokens > max_tokens:
+                logger.warning(f"表结构超出 token 预算: {tokens} > {max_tokens}, 表: {tables}")
+        
+        total = sum(len(p["columns"]) for p in (self._parsed_ddl(t) for t in tables) if p)
+        kept_count = sum(len(k) for k in kept.values())
+        return text, {"schema_tokens": tokens, "omitted_columns": max(total - kept_count, 0)}
+    
+    def _join_tables(self, tables: List[str], kept: Dict[str, set], sql_only: bool, list_omitted: bool) -> str:
+        return "\n\n".join(self._render_table(t, kept[t], sql_only, list_omitted) for t in tables)
+    
     async def get_business_rules(self, tables: List[str]) -> List[str]:
         """获取指定表的业务规则"""
         try:
             rules = []
             
             for table in tables:
-                file_path = self.ddl_dir / f"{table}.md"
-                if not file_path.exists():
-                    continue
-                
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                    
-                # 提取业务规则部分
-                if "## 业务规则" in content:
-                    rules_section = content.split("## 业务规则")[1].strip()
-                    table_rules = [
-                        f"{table}: {r.lstrip('123456789.').strip()}"
-                        for r in rules_section.split("\n")
-                        if r.strip() and r.strip()[0].isdigit()
-                    ]
-                    rules.extend(table_rules)
+                ddl = self.registry.get_table_ddl(table)
+                if ddl is not None:
+                    rules.extend(ddl["rules"])
             
             return rules
         except Exception as e:
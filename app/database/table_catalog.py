@@ -0,0 +1,77 @@
+from typing import Dict, List, Any
+import hashlib
+import logging
+from app.database.resource_registry import ResourceRegistry
+
+logger = logging.getLogger(__name__)
+
+class TableCatalogIndex:
+    """
+    表描述向量索引
+
+    将每张表的描述（可选附带字段说明）写入 ChromaDB，表识别阶段只取与问题
+    最相似的 top-k 张表拼入提示词，避免提示词随表数量线性增长。
+    """
+
+    COLLECTION = "table_catalog"
+
+    def __init__(self, vector_store, registry: ResourceRegistry, include_columns: bool = False):
+        self.vector_store = vector_store
+        self.registry = registry
+        self.include_columns = include_columns
+
+    def _build_documents(self) -> Dict[str, str]:
+        """根据注册表中的表描述构建待索引文档"""
+        documents = {}
+        for table, description in self.registry.get_table_descriptions().items():
+            document = f"{table}\n{description['content']}"
+            ddl = self.registry.get_table_ddl(table)
+            if self.include_columns and ddl:
+                columns = "\n".join(f"{name}: {desc}" for name, desc in ddl["fields"].items())
+                document = f"{document}\n{columns}"
+            documents[table] = document
+        return documents
+
+    async def sync(self):
+        """增量同步索引：只写入新增或内容变化的表，删除已不存在的表"""
+        await self.vector_store.get_or_create_collection(
+            self.COLLECTION,
+            metadata={"hnsw:space": "cosine"}
+        )
+        documents = self._build_documents()
+        indexed = await self.vector_store.get_metadatas(self.COLLECTION)
+
+        changed_ids, changed_docs, changed_metas = [], [], []
+        for table, document in documents.items():
+            content_hash = hashlib.sha256(document.encode("utf-8")).hexdigest()
+            if (indexed.get(table) or {}).get("hash") == content_hash:
+                continue
+            changed_ids.append(table)
+            changed_docs.append(document)
+            changed_metas.append({"hash": content_hash})
+
+        if changed_ids:
+            await self.vector_store.bulk_upsert(
+                self.COLLECTION,
+                documents=changed_docs,
+                metadatas=changed_metas,
+                ids=changed_ids,
+                progress=lambda done, total: logger.info(f"表描述索引写入进度: {done}/{total}")
+            )
+        removed = [table for table in indexed if table not in documents]
+        if removed:
+            await self.vector_store.delete_documents(self.COLLECTION, ids=removed)
+        logger.info(f"表描述索引已同步: 更新 {len(changed_ids)} 张, 删除 {len(removed)} 张, 共 {len(documents)} 张")
+
+    async def search(self, query: str, top_k: int, min_similarity: float) -> List[Dict[str, Any]]:
+        """检索与问题最相似的表，按相似度降序返回"""
+        results = await self.vector_store.query_similar(self.COLLECTION, query, n_results=top_k)
+        candidates = [
+            {"table": table, "similarity": 1.0 - distance}
+            for table, distance in zip(results["ids"][0], results["distances"][0])
+        ]
+        matched = [c for c in candidates if c["similarity"] >= min_similarity]
+        if not matched and candidates:
+            logger.warning(f"没有表的相似度达到阈值 {min_similarity}，使用未过滤的 top-{top_k} 结果")
+            return candidates
+        return matched
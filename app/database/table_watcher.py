@@ -0,0 +1,55 @@
+from typing import Optional
+import asyncio
+import logging
+from sqlalchemy.ext.asyncio import AsyncEngine
+from app.database.postgresql import fetch_table_counters
+from app.services.cache_service import QueryResultCache
+
+logger = logging.getLogger(__name__)
+
+class TableChangeWatcher:
+    """
+    定期读取查询结果缓存所涉及表的修改计数，计数变化时失效对应的缓存条目
+
+    只查询缓存中实际引用的表；缓存为空时不访问数据库。
+    """
+
+    def __init__(self, engine: AsyncEngine, cache: QueryResultCache, schema: str = "public"):
+        self.engine = engine
+        self.cache = cache
+        self.schema = schema
+        self._task: Optional[asyncio.Task] = None
+
+    async def poll(self) -> int:
+        """检查一次修改计数，返回失效的缓存条数"""
+        tables = self.cache.tracked_tables()
+        if not tables:
+            return 0
+        async with self.engine.connect() as conn:
+            counters = await fetch_table_counters(conn, tables, self.schema)
+        invalidated = self.cache.invalidate_changed(counters)
+        if invalidated:
+            logger.info(f"表数据已变更，失效 {invalidated} 条查询结果缓存")
+        return invalidated
+
+    async def _watch(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.poll()
+            except Exception as e:
+                logger.error(f"检查表修改计数失败: {str(e)}")
+
+    def start(self, interval: float = 2.0):
+        """启动后台轮询任务"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._watch(interval))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
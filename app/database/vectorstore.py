@@ -1,50 +1,218 @@
-import chromadb
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+from concurrent.futures import ThreadPoolExecutor
 from app.config import settings
 import asyncio
+import logging
+import os
 from functools import partial
 
+logger = logging.getLogger(__name__)
+
+# 查询结果中按问题分组的字段，合并查询后按下标拆分
+_QUERY_FIELDS = ("ids", "embeddings", "documents", "metadatas", "distances", "uris", "data")
+
 class VectorStore:
-    def __init__(self):
-        self.client = chromadb.PersistentClient(path=settings.CHROMA_PERSIST_DIRECTORY)
-        
+    """
+    ChromaDB 的异步封装
+
+    所有 Chroma 调用在独立的有界线程池中执行，不与默认线程池中的其他任务争抢线程；
+    集合句柄首次获取后缓存。同一轮事件循环中对同一集合的并发检索合并为一次 query_texts 调用。
+    """
+
+    def __init__(self, max_workers: Optional[int] = None, batch_size: Optional[int] = None):
+        self.max_workers = max_workers or settings.CHROMA_MAX_WORKERS
+        self.batch_size = batch_size or settings.CHROMA_INGEST_BATCH_SIZE
+        self._client = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._collections: Dict[str, Any] = {}
+        # (集合名, n_results) -> 等待合并检索的 (问题, future)
+        self._pending_queries: Dict[Tuple[str, int], List[Tuple[str, asyncio.Future]]] = {}
+        self._query_tasks: Set[asyncio.Task] = set()
+
+    @property
+    def client(self):
+        # 首次使用时打开：chromadb 导入较慢，且 SQLite 连接不能跨 fork 共享
+        if self._client is None:
+            import chromadb
+            self._client = chromadb.PersistentClient(path=settings.CHROMA_PERSIST_DIRECTORY)
+        return self._client
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="chroma")
+        return self._executor
+
+    async def _run(self, fn: Callable, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, partial(fn, *args, **kwargs))
+
+    def _after_fork(self):
+        # 线程与 SQLite 连接不会被 fork 复制，子进程中重新创建
+        self._client = None
+        self._executor = None
+        self._collections.clear()
+        self._pending_queries.clear()
+        self._query_tasks.clear()
+
+    def close(self):
+        """关闭线程池，未开始的 Chroma 调用被取消"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    # ---- 集合 ----
+
     async def create_collection(self, collection_name: str):
-        loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(
-            None, 
-            partial(self.client.create_collection, name=collection_name)
-        )
-    
+        collection = await self._run(self.client.create_collection, name=collection_name)
+        self._collections[collection_name] = collection
+        return collection
+
     async def get_collection(self, collection_name: str):
-        loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(
-            None,
-            partial(self.client.get_collection, name=collection_name)
-        )
-    
-    async def add_documents(self, collection_name: str, documents: list, metadatas: list = None, ids: list = None):
+        collection = self._collections.get(collection_name)
+        if collection is None:
+            collection = await self._run(self.client.get_collection, name=collection_name)
+            self._collections[collection_name] = collection
+        return collection
+
+    async def get_or_create_collection(self, collection_name: str, metadata: dict = None):
+        collection = await self._run(self.client.get_or_create_collection, name=collection_name, metadata=metadata)
+        self._collections[collection_name] = collection
+        return collection
+
+    # ---- 写入 ----
+
+    def _max_batch_size(self) -> int:
+        # Chroma 对单次写入的条数有上限
+        get_max = getattr(self.client, "get_max_batch_size", None)
+        return get_max() if get_max is not None else self.batch_size
+
+    async def _write_chunks(
+        self,
+        method: str,
+        collection_name: str,
+        documents: list,
+        metadatas: Optional[list],
+        ids: list,
+        batch_size: Optional[int],
+        progress: Optional[Callable[[int, int], None]]
+    ) -> int:
         collection = await self.get_collection(collection_name)
-        loop = asyncio.get_event_loop()
-        await loop.run_in_executor(
-            None,
-            partial(
-                collection.add,
-                documents=documents,
-                metadatas=metadatas,
-                ids=ids
+        batch_size = min(batch_size or self.batch_size, self._max_batch_size())
+        total = len(documents)
+        for start in range(0, total, batch_size):
+            end = min(start + batch_size, total)
+            # 每块的 embedding 计算与写入在线程池中完成
+            await self._run(
+                getattr(collection, method),
+                documents=documents[start:end],
+                metadatas=metadatas[start:end] if metadatas else None,
+                ids=ids[start:end]
             )
-        )
-    
-    async def query_similar(self, collection_name: str, query_text: str, n_results: int = 5):
+            if progress is not None:
+                progress(end, total)
+        return total
+
+    async def bulk_upsert(
+        self,
+        collection_name: str,
+        documents: list,
+        metadatas: list = None,
+        ids: list = None,
+        batch_size: Optional[int] = None,
+        progress: Optional[Callable[[int, int], None]] = None
+    ) -> int:
+        """
+        分块写入文档，id 已存在时更新，返回写入条数
+
+        progress 在每块写入后以 (已写入条数, 总条数) 调用。
+        """
+        return await self._write_chunks("upsert", collection_name, documents, metadatas, ids, batch_size, progress)
+
+    async def upsert_documents(self, collection_name: str, documents: list, metadatas: list = None, ids: list = None):
+        await self.bulk_upsert(collection_name, documents, metadatas=metadatas, ids=ids)
+
+    async def add_documents(self, collection_name: str, documents: list, metadatas: list = None, ids: list = None):
+        await self._write_chunks("add", collection_name, documents, metadatas, ids, None, None)
+
+    async def delete_documents(self, collection_name: str, ids: list):
         collection = await self.get_collection(collection_name)
-        loop = asyncio.get_event_loop()
-        results = await loop.run_in_executor(
-            None,
-            partial(
-                collection.query,
-                query_texts=[query_text],
-                n_results=n_results
-            )
-        )
-        return results
+        await self._run(collection.delete, ids=ids)
+
+    async def get_metadatas(self, collection_name: str) -> dict:
+        """获取集合中全部文档的 id -> metadata 映射"""
+        collection = await self.get_collection(collection_name)
+        results = await self._run(collection.get, include=["metadatas"])
+        return dict(zip(results["ids"], results["metadatas"]))
+
+    # ---- 检索 ----
+
+    async def query_similar_batch(self, collection_name: str, query_texts: List[str], n_results: int = 5):
+        """一次检索多个问题，结果中每个字段按问题顺序排列"""
+        collection = await self.get_collection(collection_name)
+        try:
+            return await self._run(collection.query, query_texts=query_texts, n_results=n_results)
+        except Exception:
+            # 集合可能已被删除重建，下次重新获取句柄
+            self._collections.pop(collection_name, None)
+            raise
+
+    async def query_similar(self, collection_name: str, query_text: str, n_results: int = 5):
+        """检索单个问题，与同一时刻对同一集合的其他检索合并执行"""
+        key = (collection_name, n_results)
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        pending = self._pending_queries.get(key)
+        if pending is None:
+            pending = self._pending_queries[key] = []
+            # 任务在下一轮事件循环开始执行，之前到达的检索都会并入本批
+            task = loop.create_task(self._flush_queries(key))
+            self._query_tasks.add(task)
+            task.add_done_callback(self._query_tasks.discard)
+        pending.append((query_text, future))
+        return await future
+
+    async def _flush_queries(self, key: Tuple[str, int]):
+        batch = self._pending_queries.pop(key)
+        collection_name, n_results = key
+        try:
+            results = await self.query_similar_batch(collection_name, [text for text, _ in batch], n_results)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        if len(batch) > 1:
+            logger.debug(f"合并 {len(batch)} 个向量检索: {collection_name}")
+        for index, (_, future) in enumerate(batch):
+            if not future.done():
+                future.set_result({
+                    field: value[index:index + 1] if field in _QUERY_FIELDS and value is not None else value
+                    for field, value in results.items()
+                })
+
+_vector_store: Optional[VectorStore] = None
+
+def get_vector_store() -> VectorStore:
+    """获取向量库实例，首次调用时打开 ChromaDB"""
+    global _vector_store
+    if _vector_store is None:
+        _vector_store = VectorStore()
+    return _vector_store
+
+def close_vector_store():
+    """关闭已创建的向量库实例的线程池"""
+    if _vector_store is not None:
+        _vector_store.close()
+
+def _reset_after_fork():
+    if _vector_store is not None:
+        _vector_store._after_fork()
+
+os.register_at_fork(after_in_child=_reset_after_fork)
 
-vector_store = VectorStore() 
\ No newline at end of file
+def __getattr__(name: str):
+    # 兼容 from app.database.vectorstore import vector_store
+    if name == "vector_store":
+        return get_vector_store()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
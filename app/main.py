@@ -1,37 +1,115 @@
-from fastapi import FastAPI, Depends, HTTPException
-from sqlalchemy.ext.asyncio import AsyncSession
-from app.database.postgresql import get_db
-from app.services.factory import create_services
-from app.models.request import QueryRequest
-from app.models.response import SQLResponse, QueryResult
-from sqlalchemy import text
+from typing import Dict, Any, Optional, Tuple
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import StreamingResponse, Response
+from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
+from sqlalchemy.exc import DBAPIError, TimeoutError as SQLAlchemyTimeoutError
+from app.database.postgresql import (
+    execute_readonly, execute_readonly_tracked, stream_readonly, is_statement_timeout, get_pool_stats, engine
+)
+from app.database.schema_store import init_business_rules
+from app.database.table_watcher import TableChangeWatcher
+from app.database.vectorstore import close_vector_store
+from app.services.factory import create_services, create_cost_guard, create_query_cache
+from app.services.cache_service import QueryResultCache
+from app.services.cost_guard import QueryCostGuard, QueryRejectedError
+from app.services.sql_generation import SQLGenerator
+from app.models.request import QueryRequest, BatchQueryRequest
+from app.models.response import SQLResponse, QueryResult, BatchItemResult, BatchSQLResponse
+import contextlib
+import json
 import logging
+import os
+import time
 import uvicorn
-from app.utils.helpers import log_api_call
-
-# 配置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - [%(filename)s:%(lineno)d] - %(message)s',
-    handlers=[
-        logging.StreamHandler(),
-        logging.FileHandler('app.log')
-    ]
-)
+from app.utils.helpers import log_api_call, referenced_tables, process_memory
+from app.utils.logging_setup import setup_logging, shutdown_logging
+from app.config import settings
+
 logger = logging.getLogger(__name__)
 
-# 创建服务实例
-try:
-    sql_generator = create_services()
-    logger.info("服务实例创建成功")
-except Exception as e:
-    logger.error(f"服务实例创建失败: {str(e)}")
-    raise
+# 服务实例在应用启动时创建（见 lifespan），导入本模块不访问外部资源
+sql_generator: Optional[SQLGenerator] = None
+cost_guard: Optional[QueryCostGuard] = None
+query_cache: Optional[QueryResultCache] = None
+table_watcher: Optional[TableChangeWatcher] = None
+startup_seconds: Optional[float] = None
+
+def init_services() -> SQLGenerator:
+    """创建服务实例，重复调用时返回已创建的实例"""
+    global sql_generator, cost_guard, query_cache, table_watcher
+    if sql_generator is None:
+        try:
+            # 初始化业务规则
+            init_business_rules()
+            sql_generator = create_services()
+            cost_guard = create_cost_guard()
+            query_cache, table_watcher = create_query_cache()
+            logger.info("服务实例创建成功")
+        except Exception as e:
+            logger.error(f"服务实例创建失败: {str(e)}")
+            raise
+    return sql_generator
+
+async def startup():
+    """创建服务实例并启动后台任务"""
+    init_services()
+    if sql_generator.schema_store.table_catalog is not None:
+        await sql_generator.schema_store.table_catalog.sync()
+    if settings.SCHEMA_CATALOG_ENABLED:
+        catalog = sql_generator.schema_store.catalog
+        # 多进程模式下主进程已预加载，后台刷新任务负责同步之后的变化
+        if not catalog.loaded:
+            try:
+                await catalog.load()
+            except Exception as e:
+                logger.error(f"加载表结构索引失败，将在后台重试: {str(e)}")
+        catalog.start_refreshing(settings.SCHEMA_CATALOG_REFRESH_INTERVAL)
+    if sql_generator.example_store is not None:
+        try:
+            await sql_generator.example_store.start()
+        except Exception as e:
+            logger.error(f"初始化SQL示例库失败，本次运行不使用示例: {str(e)}")
+    if settings.RESOURCE_WATCH_ENABLED:
+        sql_generator.schema_store.registry.start_watching(settings.RESOURCE_WATCH_INTERVAL)
+    if table_watcher is not None:
+        table_watcher.start(settings.QUERY_CACHE_POLL_INTERVAL)
+
+async def shutdown():
+    """释放共享资源"""
+    if sql_generator is None:
+        return
+    await sql_generator.schema_store.registry.stop_watching()
+    await sql_generator.schema_store.catalog.stop_refreshing()
+    if table_watcher is not None:
+        await table_watcher.stop()
+    if sql_generator.example_store is not None:
+        await sql_generator.example_store.stop()
+    await sql_generator.llm.close()
+    close_vector_store()
+    await engine.dispose()
+    if sql_generator.result_cache is not None:
+        sql_generator.result_cache.save()
+    shutdown_logging()
+
+@contextlib.asynccontextmanager
+async def lifespan(app: FastAPI):
+    global startup_seconds
+    start = time.perf_counter()
+    # 配置日志：经队列由后台线程写出
+    setup_logging()
+    await startup()
+    startup_seconds = time.perf_counter() - start
+    logger.info(f"服务启动完成，耗时 {startup_seconds:.3f} 秒")
+    try:
+        yield
+    finally:
+        await shutdown()
 
 app = FastAPI(
     title="Text2SQL API",
     description="智能SQL生成服务",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 @app.get("/")
@@ -39,6 +117,31 @@ async def health_check():
     """健康检查接口"""
     return {"status": "healthy", "message": "Text2SQL service is running"}
 
+@app.get("/stats")
+async def stats():
+    """运行时统计信息，用于容量规划"""
+    return {
+        "pipeline_mode": sql_generator.pipeline_mode,
+        "startup_seconds": startup_seconds,
+        "process": {"pid": os.getpid(), "memory": process_memory()},
+        "llm_pool": sql_generator.llm.get_pool_stats(),
+        "db_pool": get_pool_stats(),
+        "llm_memo": sql_generator.llm.memo.get_stats() if sql_generator.llm.memo else None,
+        "result_cache": sql_generator.result_cache.get_stats() if sql_generator.result_cache else None,
+        "plan_cache": cost_guard.cache.get_stats() if cost_guard and cost_guard.cache else None,
+        "query_cache": query_cache.get_stats() if query_cache else None,
+        "example_store": sql_generator.example_store.get_stats() if sql_generator.example_store else None,
+        "table_resolver": (
+            sql_generator.entity_service.table_resolver.get_stats()
+            if sql_generator.entity_service.table_resolver else None
+        )
+    }
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus 指标"""
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
 @app.post("/generate-sql", response_model=SQLResponse)
 async def generate_sql(request: QueryRequest):
     """生成SQL查询语句"""
@@ -54,35 +157,206 @@ async def generate_sql(request: QueryRequest):
         log_api_call("generate_sql", request.text, error=e)
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/generate-sql/stream")
+async def generate_sql_stream(request: QueryRequest, http_request: Request):
+    """以 SSE 事件流生成SQL：依次推送各阶段结果、SQL token 与最终结果"""
+    async def event_source():
+        try:
+            async with contextlib.aclosing(sql_generator.generate_sql_stream(request.text)) as events:
+                async for event in events:
+                    if await http_request.is_disconnected():
+                        logger.info(f"客户端已断开，停止生成: {request.text}")
+                        break
+                    data = json.dumps(event["data"], ensure_ascii=False)
+                    yield f"event: {event['event']}\ndata: {data}\n\n"
+        except Exception as e:
+            logger.error(f"流式生成SQL时发生错误: {str(e)}", exc_info=True)
+            data = json.dumps({"detail": str(e)}, ensure_ascii=False)
+            yield f"event: error\ndata: {data}\n\n"
+
+    logger.info(f"收到流式查询请求: {request.text}")
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/generate-sql/batch", response_model=BatchSQLResponse)
+async def generate_sql_batch(request: BatchQueryRequest):
+    """批量生成SQL：去重后按并发上限执行，每条结果单独返回错误"""
+    if len(request.queries) > settings.BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"批量查询最多 {settings.BATCH_MAX_ITEMS} 条")
+    texts = [query.text for query in request.queries]
+    concurrency = min(
+        request.concurrency or settings.BATCH_DEFAULT_CONCURRENCY,
+        settings.BATCH_MAX_CONCURRENCY
+    )
+
+    def to_item(index, result, error) -> BatchItemResult:
+        if error is not None:
+            return BatchItemResult(index=index, text=texts[index], error=str(error))
+        return BatchItemResult(
+            index=index,
+            text=texts[index],
+            sql=result["sql"],
+            description=result.get("description"),
+            cached=result.get("cached", False)
+        )
+
+    if request.stream:
+        async def item_source():
+            async for index, result, error in sql_generator.generate_sql_batch(texts, concurrency):
+                yield to_item(index, result, error).model_dump_json() + "\n"
+        return StreamingResponse(item_source(), media_type="application/x-ndjson")
+
+    items = [None] * len(texts)
+    async for index, result, error in sql_generator.generate_sql_batch(texts, concurrency):
+        items[index] = to_item(index, result, error)
+    return {"results": items}
+
+async def guard_sql(sql: str, timeout_ms: Optional[int]) -> Tuple[str, Optional[Dict[str, Any]]]:
+    """执行前代价检查，返回实际执行的SQL与检查结果；拒绝时返回 422 及估算值"""
+    if cost_guard is None:
+        return sql, None
+    try:
+        verdict = await cost_guard.check(sql, timeout_ms)
+    except QueryRejectedError as e:
+        logger.warning(f"SQL估算代价超出阈值，拒绝执行: {str(e)}, sql: {sql}")
+        raise HTTPException(status_code=422, detail={
+            "message": f"查询代价过高，请缩小查询范围: {str(e)}",
+            "sql": sql,
+            "estimate": e.verdict["estimate"],
+            "original_estimate": e.verdict.get("original_estimate")
+        })
+    plan = {k: v for k, v in verdict.items() if k != "sql"}
+    return verdict["sql"], plan
+
 @app.post("/execute-sql", response_model=QueryResult)
-async def execute_sql(
-    request: QueryRequest,
-    db: AsyncSession = Depends(get_db)
-):
-    """生成并执行SQL查询"""
+async def execute_sql(request: QueryRequest):
+    """生成并在只读、限时的事务中执行SQL查询"""
     try:
         # 生成SQL
         result = await sql_generator.generate_sql(request.text)
-        sql = result["sql"]
+        context = {
+            "entities": result["entities"],
+            "constraints": result["constraints"]
+        }
         
-        # 执行查询
-        query_result = await db.execute(text(sql))
-        rows = query_result.fetchall()
-        await db.commit()
+        # 命中执行结果缓存时不占用数据库连接
+        cache_key = QueryResultCache.make_key(result["sql"]) if query_cache is not None else None
+        if cache_key is not None:
+            cached = query_cache.get(cache_key)
+            if cached is not None:
+                return {
+                    "sql": cached["sql"],
+                    "results": cached["results"],
+                    "context": context,
+                    "plan": cached["plan"],
+                    "cached": True,
+                    "cache_age": cached["age"]
+                }
         
-        # 转换结果
-        results = [dict(row._mapping) for row in rows]
+        # 代价检查，必要时自动加 LIMIT
+        sql, plan = await guard_sql(result["sql"], request.timeout_ms)
+        
+        # 执行查询
+        # 优先使用执行计划中的表（视图已展开为基表）
+        tables = (plan["relations"] if plan else referenced_tables(sql)) if cache_key is not None else []
+        if tables:
+            results, counters = await execute_readonly_tracked(
+                sql, tables, request.timeout_ms, settings.SCHEMA_CATALOG_SCHEMA
+            )
+            # 有表无法追踪修改计数时 put 不缓存
+            query_cache.put(cache_key, sql, results, counters, plan)
+        else:
+            # 不涉及任何表（如 SELECT now()）的结果无法判断何时失效，不缓存
+            results = await execute_readonly(sql, request.timeout_ms)
+        # 执行成功的SQL写入示例库
+        sql_generator.remember_example(request.text, result)
         
         return {
             "sql": sql,
             "results": results,
-            "intent": result["intent"],
-            "context": result["context"]
+            "context": context,
+            "plan": plan
         }
+    except HTTPException:
+        raise
+    except SQLAlchemyTimeoutError as e:
+        logger.error(f"获取数据库连接超时: {str(e)}")
+        raise HTTPException(status_code=503, detail="数据库连接池繁忙，请稍后重试")
+    except DBAPIError as e:
+        if is_statement_timeout(e):
+            logger.error(f"SQL执行超时: {str(e)}")
+            raise HTTPException(status_code=504, detail="SQL执行超时")
+        logger.error(f"执行SQL时发生错误: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
     except Exception as e:
         logger.error(f"执行SQL时发生错误: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/execute-sql/stream")
+async def execute_sql_stream(request: QueryRequest):
+    """
+    生成SQL并以 NDJSON 流式返回查询结果
+
+    第一行为 {"type": "columns", "sql": ..., "columns": [...], "plan": {...}}，随后每行是一条
+    结果记录的 JSON 数组，最后一行为 {"type": "end", ...}，其中 truncated
+    表示是否因行数或字节数上限被截断。估算代价超出阈值时返回 422，detail 中包含估算值。
+    """
+    try:
+        result = await sql_generator.generate_sql(request.text)
+    except Exception as e:
+        logger.error(f"生成SQL时发生错误: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+    try:
+        sql, plan = await guard_sql(result["sql"], request.timeout_ms)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"SQL代价检查失败: {str(e)}")
+        raise HTTPException(status_code=504 if is_statement_timeout(e) else 500, detail=str(e))
+
+    async def row_source():
+        rows, size, truncated = 0, 0, None
+        header_sent = False
+        try:
+            # 提前 break 时立即关闭，回滚只读事务并归还连接
+            async with contextlib.aclosing(
+                stream_readonly(sql, request.timeout_ms, settings.SQL_STREAM_BATCH_SIZE)
+            ) as batches:
+                async for columns, batch in batches:
+                    if not header_sent:
+                        header = {"type": "columns", "sql": sql, "columns": columns, "plan": plan}
+                        yield json.dumps(header, ensure_ascii=False) + "\n"
+                        header_sent = True
+                    lines = []
+                    for row in batch:
+                        if rows >= settings.SQL_STREAM_MAX_ROWS:
+                            truncated = "max_rows"
+                            break
+                        line = (json.dumps(row, ensure_ascii=False, default=str) + "\n").encode("utf-8")
+                        if size + len(line) > settings.SQL_STREAM_MAX_BYTES:
+                            truncated = "max_bytes"
+                            break
+                        lines.append(line)
+                        rows += 1
+                        size += len(line)
+                    if lines:
+                        yield b"".join(lines)
+                    if truncated:
+                        break
+            if not header_sent:
+                yield json.dumps({"type": "columns", "sql": sql, "columns": [], "plan": plan}, ensure_ascii=False) + "\n"
+            sql_generator.remember_example(request.text, result)
+            yield json.dumps({"type": "end", "rows": rows, "bytes": size, "truncated": truncated}) + "\n"
+        except Exception as e:
+            detail = "SQL执行超时" if is_statement_timeout(e) else str(e)
+            logger.error(f"流式执行SQL时发生错误: {str(e)}")
+            yield json.dumps({"type": "error", "detail": detail, "rows": rows}, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(row_source(), media_type="application/x-ndjson")
+
 if __name__ == "__main__":
     uvicorn.run(
         "app.main:app",
@@ -1,6 +1,18 @@
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import Optional, List
+from app.config import settings
 
 class QueryRequest(BaseModel):
     text: str = Field(..., description="用户的自然语言查询")
-    context_id: Optional[str] = Field(None, description="上下文ID，用于多轮对话") 
\ No newline at end of file
+    context_id: Optional[str] = Field(None, description="上下文ID，用于多轮对话")
+    timeout_ms: Optional[int] = Field(None, description="SQL执行超时（毫秒），默认使用配置，不超过配置的上限")
+
+class BatchQueryRequest(BaseModel):
+    queries: List[QueryRequest] = Field(..., description="批量查询列表")
+    concurrency: Optional[int] = Field(
+        None,
+        ge=1,
+        le=settings.BATCH_MAX_CONCURRENCY,
+        description="并发数，默认使用配置，不能超过配置的上限"
+    )
+    stream: bool = Field(False, description="是否以 NDJSON 流式返回，每完成一条返回一行")
@@ -1,13 +1,35 @@
 from pydantic import BaseModel
-from typing import List, Any, Optional
+from typing import List, Any, Optional, Dict
 
 class SQLResponse(BaseModel):
     sql: str
+    description: Optional[str] = None
+    cached: bool = False
+    # 最终SQL生成提示词的 token 统计（本地估算）
+    token_usage: Optional[Dict[str, int]] = None
+    # 直接复用的历史示例：question 与 similarity
+    example: Optional[Dict[str, Any]] = None
     # intent: str
     # context: dict
 
 class QueryResult(BaseModel):
     sql: str
     results: List[dict]
-    intent: str
-    context: dict 
\ No newline at end of file
+    intent: Optional[str] = None
+    context: Optional[dict] = None
+    # 执行前代价检查结果：action（allow/limit）与估算值
+    plan: Optional[dict] = None
+    # 是否来自执行结果缓存，以及缓存时长（秒）
+    cached: bool = False
+    cache_age: Optional[float] = None
+
+class BatchItemResult(BaseModel):
+    index: int
+    text: str
+    sql: Optional[str] = None
+    description: Optional[str] = None
+    cached: bool = False
+    error: Optional[str] = None
+
+class BatchSQLResponse(BaseModel):
+    results: List[BatchItemResult]
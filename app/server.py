@@ -0,0 +1,239 @@
+"""
+多进程服务模式
+
+主进程加载资源文件、表结构索引与词典后 fork 出多个工作进程，工作进程以写时复制的方式
+共享这些只读数据，并共用同一个监听 socket。
+
+    python -m app.server --workers 4 --port 8000
+
+信号：
+    SIGHUP          主进程重新加载资源与表结构后逐个替换工作进程（滚动重载，不中断服务）
+    SIGTERM/SIGINT  通知全部工作进程优雅退出后结束
+"""
+from typing import Dict, Optional, Set
+import argparse
+import asyncio
+import contextlib
+import gc
+import logging
+import os
+import signal
+import socket
+import time
+import uvicorn
+from app.config import settings
+from app.utils.helpers import process_memory
+from app.utils.logging_setup import setup_logging, shutdown_logging
+from app import main as app_main
+
+logger = logging.getLogger(__name__)
+
+class PreforkServer:
+    """预加载后 fork 工作进程的主进程"""
+
+    def __init__(self, workers: int, host: str, port: int):
+        self.workers = workers
+        self.host = host
+        self.port = port
+        self.sock: Optional[socket.socket] = None
+        # pid -> 工作进程序号
+        self.children: Dict[int, int] = {}
+        # 滚动重载中已通知退出、等待回收的旧进程
+        self.retiring: Set[int] = set()
+        self._stopping = False
+        self._reload_requested = False
+
+    # ---- 预加载 ----
+
+    def preload(self):
+        """在主进程中创建服务实例并加载表结构索引，完成后冻结对象以减少写时复制"""
+        gc.unfreeze()
+        start = time.perf_counter()
+        generator = app_main.init_services()
+        asyncio.run(self._load(generator))
+        gc.collect()
+        # 已加载的对象移入永久代，工作进程中的 GC 不再扫描（写入）这些页
+        gc.freeze()
+        logger.info(f"主进程预加载完成，耗时 {time.perf_counter() - start:.3f} 秒")
+
+    @staticmethod
+    async def _load(generator):
+        registry = generator.schema_store.registry
+        catalog = generator.schema_store.catalog
+        try:
+            await registry.reload_if_changed()
+            if settings.SCHEMA_CATALOG_ENABLED:
+                if catalog.loaded:
+                    await catalog.refresh()
+                else:
+                    await catalog.load()
+        except Exception as e:
+            logger.error(f"主进程加载表结构索引失败，由工作进程自行加载: {str(e)}")
+        finally:
+            # 连接绑定在本事件循环上，不能带入子进程
+            await app_main.engine.dispose()
+
+    # ---- 工作进程 ----
+
+    def _bind(self) -> socket.socket:
+        sock = socket.socket(socket.AF_INET6 if ":" in self.host else socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((self.host, self.port))
+        sock.listen(2048)
+        sock.set_inheritable(True)
+        return sock
+
+    def spawn(self, index: int) -> int:
+        # 后台日志线程不会被复制到子进程，fork 前停止，子进程在 lifespan 中重新配置
+        shutdown_logging()
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                self._run_worker(index)
+            except BaseException:
+                logger.exception(f"工作进程 {index} 运行失败")
+                code = 1
+            finally:
+                os._exit(code)
+        setup_logging()
+        self.children[pid] = index
+        logger.info(f"启动工作进程 {index}: pid={pid}")
+        return pid
+
+    def _run_worker(self, index: int):
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(sig, signal.SIG_DFL)
+        if settings.LOG_FILE:
+            # 每个工作进程写各自的日志文件，避免多进程同时滚动同一文件
+            base, ext = os.path.splitext(settings.LOG_FILE)
+            settings.LOG_FILE = f"{base}-worker{index}{ext}"
+        config = uvicorn.Config(
+            app_main.app,
+            log_config=None,
+            timeout_graceful_shutdown=settings.SERVER_GRACEFUL_TIMEOUT
+        )
+        uvicorn.Server(config).run(sockets=[self.sock])
+
+    def _reap(self):
+        """回收已退出的子进程，非主动退出的工作进程自动重启"""
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            if pid in self.retiring:
+                self.retiring.discard(pid)
+                continue
+            index = self.children.pop(pid, None)
+            if index is not None and not self._stopping:
+                logger.error(f"工作进程 {index} 异常退出: pid={pid}, status={status}，重新启动")
+                self.spawn(index)
+
+    def _retire(self, *pids: int):
+        """通知工作进程优雅退出并等待回收，超时后强制结束"""
+        for pid in pids:
+            self.children.pop(pid, None)
+            self.retiring.add(pid)
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                self.retiring.discard(pid)
+        deadline = time.monotonic() + settings.SERVER_GRACEFUL_TIMEOUT + 5
+        while self.retiring and time.monotonic() < deadline:
+            self._reap()
+            time.sleep(0.05)
+        for pid in list(self.retiring):
+            logger.warning(f"工作进程 {pid} 未在超时内退出，强制结束")
+            with contextlib.suppress(ProcessLookupError):
+                os.kill(pid, signal.SIGKILL)
+            with contextlib.suppress(ChildProcessError):
+                os.waitpid(pid, 0)
+            self.retiring.discard(pid)
+
+    # ---- 重载与退出 ----
+
+    def reload(self):
+        """重新加载资源与表结构，逐个用新进程替换旧进程"""
+        logger.info("收到 SIGHUP，开始滚动重载")
+        self.preload()
+        for pid, index in list(self.children.items()):
+            # 先启动新进程再退出旧进程，始终保持 workers 个进程在接收连接
+            self.spawn(index)
+            self._retire(pid)
+        logger.info("滚动重载完成")
+        self.report_memory()
+
+    def stop(self):
+        self._stopping = True
+        logger.info("正在停止全部工作进程")
+        self._retire(*self.children)
+
+    def report_memory(self):
+        """记录主进程与各工作进程的内存占用，private 为每个工作进程的额外开销"""
+        parent = process_memory()
+        if parent is None:
+            return
+        workers = {index: process_memory(pid) for pid, index in self.children.items()}
+        workers = {index: memory for index, memory in workers.items() if memory is not None}
+        private = [memory["private_mb"] for memory in workers.values()]
+        logger.info(
+            "内存占用",
+            extra={
+                "memory": {
+                    "parent": parent,
+                    "workers": workers,
+                    "worker_private_avg_mb": sum(private) / len(private) if private else 0.0,
+                    "total_pss_mb": parent["pss_mb"] + sum(memory["pss_mb"] for memory in workers.values())
+                }
+            }
+        )
+
+    def run(self):
+        setup_logging()
+        self.sock = self._bind()
+        self.preload()
+
+        def on_stop(signum, frame):
+            self._stopping = True
+
+        def on_reload(signum, frame):
+            self._reload_requested = True
+
+        signal.signal(signal.SIGTERM, on_stop)
+        signal.signal(signal.SIGINT, on_stop)
+        signal.signal(signal.SIGHUP, on_reload)
+
+        for index in range(self.workers):
+            self.spawn(index)
+        logger.info(f"多进程服务已启动: http://{self.host}:{self.port}, workers={self.workers}")
+
+        next_report = time.monotonic() + 5
+        try:
+            while not self._stopping:
+                if self._reload_requested:
+                    self._reload_requested = False
+                    self.reload()
+                self._reap()
+                if time.monotonic() >= next_report:
+                    self.report_memory()
+                    next_report = time.monotonic() + settings.SERVER_MEMORY_REPORT_INTERVAL
+                time.sleep(0.2)
+        finally:
+            self.stop()
+            self.sock.close()
+            shutdown_logging()
+
+def main():
+    parser = argparse.ArgumentParser(description="Text2SQL 多进程服务")
+    parser.add_argument("--workers", type=int, default=settings.SERVER_WORKERS or os.cpu_count() or 1)
+    parser.add_argument("--host", default=settings.SERVER_HOST)
+    parser.add_argument("--port", type=int, default=settings.SERVER_PORT)
+    args = parser.parse_args()
+    PreforkServer(args.workers, args.host, args.port).run()
+
+if __name__ == "__main__":
+    main()
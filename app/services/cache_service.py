@@ -0,0 +1,326 @@
+from typing import Dict, Any, Optional, Hashable, List
+from collections import OrderedDict
+import contextlib
+import copy
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from app.utils.helpers import normalize_sql
+from app.utils.metrics import record_cache_lookup
+
+logger = logging.getLogger(__name__)
+
+class LRUCache:
+    """带 TTL 的 LRU 缓存"""
+
+    def __init__(self, max_entries: int = 1024, ttl: Optional[float] = None, name: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # 用于导出命中率指标的缓存名称
+        self.name = name
+        # key -> (value, expires_at)
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """读取缓存，过期或不存在时返回 None"""
+        entry = self._data.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= time.time():
+            del self._data[key]
+            entry = None
+        if entry is None:
+            self.misses += 1
+            if self.name:
+                record_cache_lookup(self.name, False)
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        if self.name:
+            record_cache_lookup(self.name, True)
+        return entry[0]
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        """写入缓存，超出容量时淘汰最久未使用的条目"""
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.time() + ttl if ttl else None
+        if key in self._data:
+            self._data.move_to_end(key)
+        self._data[key] = (value, expires_at)
+        while len(self._data) > self.max_entries:
+            self._evict()
+
+    def _evict(self):
+        """淘汰最久未使用的条目"""
+        self._data.popitem(last=False)
+        self.evictions += 1
+
+    def clear(self):
+        self._data.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取命中、未命中与淘汰计数"""
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / total if total else 0.0
+        }
+
+
+class ResultCache(LRUCache):
+    """NL→SQL 结果缓存，key 为规范化问题与 schema/prompt 版本指纹"""
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl: Optional[float] = None,
+        file_path: Optional[str] = None,
+        name: Optional[str] = "result"
+    ):
+        super().__init__(max_entries=max_entries, ttl=ttl, name=name)
+        self.file_path = file_path
+        if file_path:
+            self.load()
+
+    @staticmethod
+    def make_key(normalized_query: str, version: str) -> str:
+        return f"{version}:{normalized_query}"
+
+    def get(self, key: Hashable) -> Optional[Dict[str, Any]]:
+        value = super().get(key)
+        # 返回副本，避免调用方修改缓存中的结果
+        return copy.deepcopy(value) if value is not None else None
+
+    def set(self, key: Hashable, value: Dict[str, Any], ttl: Optional[float] = None):
+        super().set(key, copy.deepcopy(value), ttl)
+
+    def _read_entries(self) -> List[List[Any]]:
+        """读取磁盘文件中未过期的条目 [key, value, expires_at]"""
+        with open(self.file_path, 'r', encoding='utf-8') as f:
+            entries = json.load(f)
+        now = time.time()
+        return [entry for entry in entries if entry[2] is None or entry[2] > now]
+
+    def load(self):
+        """从磁盘文件加载未过期的缓存条目"""
+        if not self.file_path or not os.path.exists(self.file_path):
+            return
+        try:
+            for key, value, expires_at in self._read_entries():
+                self._data[key] = (value, expires_at)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+            logger.info(f"已从 {self.file_path} 加载 {len(self._data)} 条缓存结果")
+        except Exception as e:
+            logger.warning(f"加载结果缓存文件失败: {str(e)}")
+
+    def save(self):
+        """
+        将缓存条目原子写入磁盘文件
+
+        多个工作进程会在退出时各自保存：通过文件锁串行化，先合并磁盘上已有的条目
+        （本进程的条目优先），再经本进程独有的临时文件替换。
+        """
+        if not self.file_path:
+            return
+        tmp_path = None
+        try:
+            directory = os.path.dirname(os.path.abspath(self.file_path))
+            os.makedirs(directory, exist_ok=True)
+            with open(f"{self.file_path}.lock", 'w') as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                merged: OrderedDict = OrderedDict()
+                if os.path.exists(self.file_path):
+                    try:
+                        for key, value, expires_at in self._read_entries():
+                            merged[key] = (value, expires_at)
+                    except Exception as e:
+                        logger.warning(f"读取已有结果缓存文件失败，将直接覆盖: {str(e)}")
+                for key, item in self._data.items():
+                    merged.pop(key, None)
+                    merged[key] = item
+                while len(merged) > self.max_entries:
+                    merged.popitem(last=False)
+                entries = [[key, value, expires_at] for key, (value, expires_at) in merged.items()]
+                fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(self.file_path), suffix=".tmp")
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump(entries, f, ensure_ascii=False)
+                os.replace(tmp_path, self.file_path)
+                tmp_path = None
+            logger.info(f"已将 {len(entries)} 条缓存结果写入 {self.file_path}")
+        except Exception as e:
+            logger.warning(f"保存结果缓存文件失败: {str(e)}")
+        finally:
+            if tmp_path is not None:
+                with contextlib.suppress(OSError):
+                    os.remove(tmp_path)
+
+class SizedLRUCache(LRUCache):
+    """按内存预算（字节）淘汰的 LRU 缓存，单个条目超出预算时不缓存"""
+
+    def __init__(self, max_bytes: int, ttl: Optional[float] = None, name: Optional[str] = None):
+        super().__init__(max_entries=sys.maxsize, ttl=ttl, name=name)
+        self.max_bytes = max_bytes
+        self.size_bytes = 0
+        self._sizes: Dict[Hashable, int] = {}
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        value = super().get(key)
+        if value is None:
+            self._forget(key)
+        return value
+
+    def set_sized(self, key: Hashable, value: Any, size: int, ttl: Optional[float] = None) -> bool:
+        """按给定大小写入缓存，返回是否写入"""
+        if size > self.max_bytes:
+            return False
+        self._forget(key)
+        LRUCache.set(self, key, value, ttl)
+        self._sizes[key] = size
+        self.size_bytes += size
+        while self.size_bytes > self.max_bytes and self._data:
+            self._evict()
+        return True
+
+    def _evict(self):
+        key, _ = self._data.popitem(last=False)
+        self.evictions += 1
+        self._forget(key)
+
+    def _forget(self, key: Hashable):
+        self.size_bytes -= self._sizes.pop(key, 0)
+
+    def clear(self):
+        super().clear()
+        self._sizes.clear()
+        self.size_bytes = 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = super().get_stats()
+        stats["size_bytes"] = self.size_bytes
+        stats["max_bytes"] = self.max_bytes
+        return stats
+
+
+class PromptMemo(SizedLRUCache):
+    """按最终提示词内容寻址的 LLM 响应缓存，受内存预算与分阶段 TTL 约束"""
+
+    def __init__(
+        self,
+        max_bytes: int = 32 * 1024 * 1024,
+        ttl: Optional[float] = None,
+        stage_ttls: Optional[Dict[str, float]] = None,
+        name: Optional[str] = "llm_memo"
+    ):
+        super().__init__(max_bytes=max_bytes, ttl=ttl, name=name)
+        self.stage_ttls = stage_ttls or {}
+
+    @staticmethod
+    def make_key(model: str, prompt: str) -> str:
+        return hashlib.sha256(f"{model}\0{prompt}".encode("utf-8")).hexdigest()
+
+    def stage_enabled(self, stage: Optional[str]) -> bool:
+        """TTL 配置为 0 的阶段不做缓存"""
+        return self.stage_ttls.get(stage, self.ttl) != 0
+
+    def set(self, key: Hashable, value: str, ttl: Optional[float] = None, stage: Optional[str] = None):
+        if ttl is None:
+            ttl = self.stage_ttls.get(stage, self.ttl)
+        self.set_sized(key, value, len(key) + len(value.encode("utf-8")), ttl)
+
+
+class QueryResultCache(SizedLRUCache):
+    """
+    SQL 执行结果缓存，key 为规范化后的SQL
+
+    每个条目记录查询涉及的表在执行前的修改计数（pg_stat_user_tables 的
+    n_tup_ins + n_tup_upd + n_tup_del），后台轮询发现计数变化时失效对应条目。
+    返回的结果行与缓存共享，调用方不应修改。
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, ttl: Optional[float] = None, name: Optional[str] = "query_result"):
+        super().__init__(max_bytes=max_bytes, ttl=ttl, name=name)
+        # key -> {表: 修改计数}
+        self._snapshots: Dict[Hashable, Dict[str, Optional[int]]] = {}
+        # 表 -> 引用该表的 key
+        self._by_table: Dict[str, set] = {}
+
+    @staticmethod
+    def make_key(sql: str) -> str:
+        return normalize_sql(sql)
+
+    def get(self, key: Hashable) -> Optional[Dict[str, Any]]:
+        """读取缓存，返回条目（sql/results/plan）及缓存时长 age（秒）"""
+        entry = super().get(key)
+        if entry is None:
+            return None
+        return {**entry, "age": time.time() - entry["created_at"]}
+
+    def put(
+        self,
+        key: Hashable,
+        sql: str,
+        results: List[Dict[str, Any]],
+        counters: Dict[str, Optional[int]],
+        plan: Optional[Dict[str, Any]] = None
+    ) -> bool:
+        """
+        写入执行结果及执行前各表的修改计数
+
+        不涉及任何表（如 SELECT now()）或有表无法取得修改计数（统计视图之外的表、视图、CTE 名）时
+        无法判断何时失效，不缓存，返回 False。
+        """
+        if not counters or any(count is None for count in counters.values()):
+            logger.debug(f"查询涉及的表无法追踪修改，不缓存结果: {counters}")
+            return False
+        size = len(json.dumps(results, ensure_ascii=False, default=str).encode("utf-8")) + len(sql)
+        entry = {"sql": sql, "results": results, "plan": plan, "created_at": time.time()}
+        if not self.set_sized(key, entry, size):
+            return False
+        self._snapshots[key] = dict(counters)
+        for table in counters:
+            self._by_table.setdefault(table, set()).add(key)
+        return True
+
+    def _forget(self, key: Hashable):
+        super()._forget(key)
+        for table in self._snapshots.pop(key, {}):
+            keys = self._by_table.get(table)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_table[table]
+
+    def tracked_tables(self) -> List[str]:
+        """当前缓存条目涉及的全部表"""
+        return list(self._by_table)
+
+    def invalidate_changed(self, counters: Dict[str, Optional[int]]) -> int:
+        """按最新修改计数失效条目，未出现在 counters 中的表视为计数为 None，返回失效条数"""
+        stale = {
+            key
+            for table, keys in self._by_table.items()
+            for key in keys
+            if self._snapshots[key].get(table) != counters.get(table)
+        }
+        for key in stale:
+            self._data.pop(key, None)
+            self._forget(key)
+        return len(stale)
+
+    def clear(self):
+        super().clear()
+        self._snapshots.clear()
+        self._by_table.clear()
@@ -1,65 +1,114 @@
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Tuple, Optional
 import logging
 import json
-from pathlib import Path
 from app.services.llm_service import LLMService
 from app.database.schema_store import SchemaStore
+from app.database.resource_registry import ResourceRegistry
+from app.utils.tokenizer import count_tokens
+from app.utils.logging_setup import log_payload
 
 logger = logging.getLogger(__name__)
 
+REQUIRED_CONSTRAINT_KEYS = ["where", "group_by", "having", "order_by", "limit"]
+
 class ConstraintService:
-    def __init__(self, llm_service: LLMService, schema_store: SchemaStore):
+    def __init__(self, llm_service: LLMService, schema_store: SchemaStore, registry: ResourceRegistry):
         self.llm = llm_service
         self.schema_store = schema_store
-        self.resources_dir = Path(__file__).parent.parent / "resources"
+        self.registry = registry
     
-    def _load_template(self) -> str:
+    def _load_template(self, name: str = "constraint_analysis") -> str:
         """加载提示词模板"""
-        template_path = self.resources_dir / "prompts" / "constraint_analysis.md"
-        with open(template_path, 'r', encoding='utf-8') as f:
-            return f.read()
+        return self.registry.get_prompt(name)
+    
+    def _normalize_constraints(self, response: Any) -> Dict[str, Any]:
+        """验证约束条件格式并补全缺失的约束类型"""
+        if not isinstance(response, dict):
+            raise ValueError("LLM返回的结果格式不正确，应该是字典")
+        
+        # 验证每个表的约束条件格式
+        for table, constraints in response.items():
+            if not isinstance(constraints, dict):
+                raise ValueError(f"表 {table} 的约束条件不是字典格式")
+            
+            # 确保所有必需的约束类型都存在
+            for key in REQUIRED_CONSTRAINT_KEYS:
+                if key not in constraints:
+                    constraints[key] = [] if key != "limit" else None
+        
+        return response
     
     async def parse_constraints(
         self,
         query: str,
-        tables: List[str]
+        tables: List[str],
+        fields: Optional[Dict[str, List[str]]] = None
     ) -> Dict[str, Any]:
-        """解析查询中的约束条件"""
+        """
+        解析查询中的约束条件
+        
+        传入已识别的字段时，表结构只保留这些字段及主外键；否则按 token 预算保留相关字段。
+        """
         try:
             # 获取相关表的详细信息
-            table_schemas = await self.schema_store.get_tables_schema(tables)
+            template = self._load_template()
+            table_schemas, _ = await self.schema_store.get_budgeted_tables_schema(
+                tables,
+                reserved_tokens=count_tokens(template) + count_tokens(query),
+                query=query,
+                keep_fields=fields
+            )
             
             # 构建提示词
-            template = self._load_template()
             prompt = template.format(
                 table_schemas=table_schemas,
                 user_query=query
             )
             
             # 调用LLM
-            result = await self.llm.generate(prompt)
-            logger.info(f"LLM返回的约束分析结果: {result}")
+            result = await self.llm.generate(prompt, stage="constraint")
+            log_payload(logger, "LLM返回的约束分析结果", stage="constraint", result=result)
             
             try:
-                response = json.loads(result)
-                if not isinstance(response, dict):
-                    raise ValueError("LLM返回的结果格式不正确，应该是字典")
-                
-                # 验证每个表的约束条件格式
-                for table, constraints in response.items():
-                    if not isinstance(constraints, dict):
-                        raise ValueError(f"表 {table} 的约束条件不是字典格式")
-                    
-                    # 确保所有必需的约束类型都存在
-                    required_keys = ["where", "group_by", "having", "order_by", "limit"]
-                    for key in required_keys:
-                        if key not in constraints:
-                            constraints[key] = [] if key != "limit" else None
-                
-                return response
+                return self._normalize_constraints(json.loads(result))
             except json.JSONDecodeError as e:
                 logger.error(f"解析LLM返回的JSON失败: {result}", exc_info=True)
                 raise
         except Exception as e:
             logger.error(f"约束解析失败: {str(e)}", exc_info=True)
-            raise 
\ No newline at end of file
+            raise
+    
+    async def parse_fields_and_constraints(
+        self,
+        query: str,
+        tables: List[str]
+    ) -> Tuple[Dict[str, List[str]], Dict[str, Any]]:
+        """用一次LLM调用同时识别查询字段与约束条件"""
+        try:
+            # 获取相关表的详细信息，按 token 预算优先保留与问题相关的字段
+            template = self._load_template("field_constraint_extraction")
+            table_schemas, _ = await self.schema_store.get_budgeted_tables_schema(
+                tables,
+                reserved_tokens=count_tokens(template) + count_tokens(query),
+                query=query
+            )
+            
+            # 构建提示词
+            prompt = template.format(
+                table_schemas=table_schemas,
+                user_query=query
+            )
+            
+            # 调用LLM，由 LLMService 按字段识别与约束分析的规则校验结果
+            result = await self.llm.generate(prompt, stage="fused")
+            log_payload(logger, "LLM返回的字段与约束识别结果", stage="fused", result=result)
+            
+            try:
+                response = json.loads(result)
+                return response["fields"], self._normalize_constraints(response["constraints"])
+            except json.JSONDecodeError as e:
+                logger.error(f"解析LLM返回的JSON失败: {result}", exc_info=True)
+                raise
+        except Exception as e:
+            logger.error(f"字段与约束识别失败: {str(e)}", exc_info=True)
+            raise
@@ -0,0 +1,117 @@
+from typing import Dict, Any, Optional, Awaitable, Callable, List
+import logging
+from app.services.cache_service import LRUCache
+from app.utils.helpers import normalize_sql
+from app.utils.metrics import record_cost_guard
+
+logger = logging.getLogger(__name__)
+
+class QueryRejectedError(Exception):
+    """查询的估算代价超出阈值，拒绝执行"""
+
+    def __init__(self, message: str, verdict: Dict[str, Any]):
+        super().__init__(message)
+        self.verdict = verdict
+
+class QueryCostGuard:
+    """
+    执行前的代价检查
+
+    通过 EXPLAIN (FORMAT JSON) 获取优化器对生成SQL的估算代价与返回行数：
+    估算行数超出上限时自动包一层 LIMIT，仍然超出代价上限时拒绝执行。
+    判定结果按规范化后的SQL缓存，重复的查询不再执行 EXPLAIN。
+    """
+
+    def __init__(
+        self,
+        explain: Callable[[str, Optional[int]], Awaitable[Dict[str, Any]]],
+        max_cost: float,
+        max_rows: int,
+        auto_limit: bool = True,
+        limit_rows: Optional[int] = None,
+        cache: Optional[LRUCache] = None
+    ):
+        self.explain = explain
+        self.max_cost = max_cost
+        self.max_rows = max_rows
+        self.auto_limit = auto_limit
+        self.limit_rows = limit_rows or max_rows
+        self.cache = cache
+
+    @staticmethod
+    def _estimate(plan: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "total_cost": plan.get("Total Cost"),
+            "startup_cost": plan.get("Startup Cost"),
+            "plan_rows": plan.get("Plan Rows"),
+            "node_type": plan.get("Node Type")
+        }
+
+    @staticmethod
+    def _relations(plan: Dict[str, Any]) -> List[str]:
+        """执行计划中扫描的全部表（视图已展开为基表）"""
+        relations = set()
+        nodes = [plan]
+        while nodes:
+            node = nodes.pop()
+            if "Relation Name" in node:
+                relations.add(node["Relation Name"])
+            nodes.extend(node.get("Plans", []))
+        return sorted(relations)
+
+    def _limited_sql(self, sql: str) -> str:
+        # 包成子查询，不受原SQL中 ORDER BY / UNION / OFFSET 的影响
+        return f"SELECT * FROM ({sql}) AS limited_query LIMIT {self.limit_rows}"
+
+    async def check(self, sql: str, timeout_ms: Optional[int] = None) -> Dict[str, Any]:
+        """
+        检查SQL的估算代价
+
+        返回 {"action": "allow" | "limit", "sql": 实际执行的SQL, "estimate": {...}, "relations": [...]}；
+        拒绝时抛出 QueryRejectedError，其 verdict 中包含估算值与原因。
+        """
+        normalized = normalize_sql(sql)
+        verdict = self.cache.get(normalized) if self.cache is not None else None
+        if verdict is None:
+            verdict = await self._evaluate(normalized, timeout_ms)
+            if self.cache is not None:
+                self.cache.set(normalized, verdict)
+        record_cost_guard(verdict["action"])
+
+        if verdict["action"] == "reject":
+            raise QueryRejectedError(verdict["reason"], verdict)
+        return verdict
+
+    async def _evaluate(self, sql: str, timeout_ms: Optional[int]) -> Dict[str, Any]:
+        plan = await self.explain(sql, timeout_ms)
+        estimate = self._estimate(plan)
+        verdict = {"action": "allow", "sql": sql, "estimate": estimate, "relations": self._relations(plan)}
+
+        if (estimate["plan_rows"] or 0) > self.max_rows:
+            if not self.auto_limit:
+                return {
+                    **verdict,
+                    "action": "reject",
+                    "reason": f"估算返回行数 {estimate['plan_rows']} 超出上限 {self.max_rows}"
+                }
+            limited = self._limited_sql(sql)
+            limited_estimate = self._estimate(await self.explain(limited, timeout_ms))
+            verdict = {
+                **verdict,
+                "action": "limit",
+                "sql": limited,
+                "estimate": limited_estimate,
+                "original_estimate": estimate
+            }
+            estimate = limited_estimate
+
+        if (estimate["total_cost"] or 0) > self.max_cost:
+            return {
+                **verdict,
+                "action": "reject",
+                "reason": f"估算代价 {estimate['total_cost']} 超出上限 {self.max_cost}"
+            }
+
+        if verdict["action"] == "limit":
+            logger.warning(f"估算返回行数超出上限，已自动限制为 {self.limit_rows} 行: {sql}")
+        return verdict
@@ -1,38 +1,42 @@
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional
 import logging
 import json
-from pathlib import Path
 from app.services.llm_service import LLMService
 from app.database.schema_store import SchemaStore
+from app.database.resource_registry import ResourceRegistry
+from app.services.table_resolver import TableResolver
+from app.utils.tokenizer import count_tokens
+from app.utils.logging_setup import log_payload
 
 logger = logging.getLogger(__name__)
 
 class EntityService:
-    def __init__(self, llm_service: LLMService, schema_store: SchemaStore):
+    def __init__(
+        self,
+        llm_service: LLMService,
+        schema_store: SchemaStore,
+        registry: ResourceRegistry,
+        table_resolver: Optional[TableResolver] = None
+    ):
         self.llm = llm_service
         self.schema_store = schema_store
-        self.resources_dir = Path(__file__).parent.parent / "resources"
+        self.registry = registry
+        # 词典表识别，置信度足够时跳过 LLM 调用
+        self.table_resolver = table_resolver
         logger.info("实体服务初始化完成")
     
     def _load_template(self, template_type: str) -> str:
         """加载提示词模板"""
         try:
-            template_files = {
-                "table": "prompts/table_extraction.md",
-                "field": "prompts/field_extraction.md"
+            template_names = {
+                "table": "table_extraction",
+                "field": "field_extraction"
             }
             
-            if template_type not in template_files:
+            if template_type not in template_names:
                 raise ValueError(f"未知的模板类型: {template_type}")
             
-            file_path = self.resources_dir / template_files[template_type]
-            if not file_path.exists():
-                raise FileNotFoundError(f"模板文件不存在: {file_path}")
-            
-            with open(file_path, 'r', encoding='utf-8') as f:
-                template = f.read().strip()
-            logger.info(f"已加载模板 {template_type}: {template[:100]}...")
-            return template
+            return self.registry.get_prompt(template_names[template_type]).strip()
         except Exception as e:
             logger.error(f"加载{template_type}模板失败: {str(e)}", exc_info=True)
             raise
@@ -41,12 +45,10 @@ class EntityService:
         """分两步提取实体信息"""
         try:
             # 1. 识别涉及的表
-            tables = await self._extract_tables(query)
-            logger.info(f"识别到的表: {tables}")
+            tables = await self.extract_tables(query)
             
             # 2. 识别涉及的字段
-            table_to_fields = await self._extract_fields(query, tables)
-            logger.info(f"识别到的字段: {table_to_fields}")
+            table_to_fields = await self.extract_fields(query, tables)
             
             return {
                 "tables": tables,
@@ -56,12 +58,29 @@ class EntityService:
             logger.error(f"实体提取失败: {str(e)}", exc_info=True)
             raise
     
+    async def extract_tables(self, query: str) -> List[str]:
+        """识别查询涉及的表"""
+        tables = await self._extract_tables(query)
+        logger.info(f"识别到的表: {tables}")
+        return tables
+    
+    async def extract_fields(self, query: str, tables: List[str]) -> Dict[str, List[str]]:
+        """识别查询涉及的字段"""
+        table_to_fields = await self._extract_fields(query, tables)
+        logger.info(f"识别到的字段: {table_to_fields}")
+        return table_to_fields
+    
     async def _extract_tables(self, query: str) -> List[str]:
         """识别查询涉及的表"""
         try:
+            if self.table_resolver is not None:
+                tables = self.table_resolver.try_resolve(query)
+                if tables is not None:
+                    return tables
+            
             # 获取所有可用表的信息
-            available_tables = await self.schema_store.get_all_tables_info()
-            logger.info(f"获取到的表信息: {available_tables}")
+            available_tables = await self.schema_store.get_all_tables_info(query)
+            log_payload(logger, "获取到的表信息", stage="table", available_tables=available_tables)
             
             # 构建提示词
             template = self._load_template("table")
@@ -69,11 +88,11 @@ class EntityService:
                 available_tables=available_tables,
                 user_query=query
             )
-            logger.info(f"生成的表识别提示词: {prompt}")
+            log_payload(logger, "生成的表识别提示词", stage="table", prompt=prompt)
             
             # 调用LLM
-            result = await self.llm.generate(prompt)
-            logger.info(f"LLM返回的表识别结果: {result}")
+            result = await self.llm.generate(prompt, stage="table")
+            log_payload(logger, "LLM返回的表识别结果", stage="table", result=result)
             
             # 解析JSON响应
             try:
@@ -91,19 +110,23 @@ class EntityService:
     
     async def _extract_fields(self, query: str, tables: List[str]) -> Dict[str, List[str]]:
         """识别查询涉及的字段"""
-        # 获取相关表的详细信息
-        table_schemas = await self.schema_store.get_tables_schema(tables)
+        # 获取相关表的详细信息，按 token 预算优先保留与问题相关的字段
+        template = self._load_template("field")
+        table_schemas, _ = await self.schema_store.get_budgeted_tables_schema(
+            tables,
+            reserved_tokens=count_tokens(template) + count_tokens(query),
+            query=query
+        )
         
         # 构建提示词
-        template = self._load_template("field")
         prompt = template.format(
             table_schemas=table_schemas,
             user_query=query
         )
         
         # 调用LLM
-        result = await self.llm.generate(prompt)
-        logger.info(f"LLM返回的字段识别结果: {result}")
+        result = await self.llm.generate(prompt, stage="field")
+        log_payload(logger, "LLM返回的字段识别结果", stage="field", result=result)
         
         try:
             response = json.loads(result)
@@ -1,25 +1,75 @@
-from app.database.postgresql import engine
-from app.database.schema_store import SchemaStore, init_business_rules
+from app.database.postgresql import engine, explain_readonly
+from app.database.schema_store import SchemaStore
+from app.database.resource_registry import ResourceRegistry
+from app.database.table_catalog import TableCatalogIndex
+from app.database.table_watcher import TableChangeWatcher
+from app.database.example_store import ExampleStore
 from app.services.llm_service import LLMService
 from app.services.entity_service import EntityService
+from app.services.table_resolver import TableResolver
 from app.services.constraint_service import ConstraintService
 from app.services.prompt_service import PromptService
 from app.services.sql_generation import SQLGenerator
+from app.services.cache_service import ResultCache, PromptMemo, LRUCache, QueryResultCache
+from app.services.cost_guard import QueryCostGuard
+from app.config import settings
 
 def create_services():
     """创建服务实例"""
     try:
-        # 初始化业务规则
-        init_business_rules()
-        
         # 创建基础服务实例
-        schema_store = SchemaStore(engine)
-        llm_service = LLMService()
+        registry = ResourceRegistry()
+        
+        # 表描述向量索引，资源文件变更时增量同步
+        table_catalog = None
+        if settings.TABLE_RETRIEVAL_ENABLED:
+            from app.database.vectorstore import get_vector_store
+            table_catalog = TableCatalogIndex(
+                get_vector_store(),
+                registry,
+                include_columns=settings.TABLE_RETRIEVAL_INCLUDE_COLUMNS
+            )
+            registry.add_listener(lambda _: table_catalog.sync())
+        
+        schema_store = SchemaStore(engine, registry, table_catalog)
+        memo = None
+        if settings.LLM_MEMO_ENABLED:
+            memo = PromptMemo(
+                max_bytes=settings.LLM_MEMO_MAX_BYTES,
+                ttl=settings.LLM_MEMO_TTL,
+                stage_ttls=settings.LLM_MEMO_STAGE_TTLS
+            )
+        llm_service = LLMService(memo=memo)
         
         # 创建依赖服务
-        entity_service = EntityService(llm_service, schema_store)
-        constraint_service = ConstraintService(llm_service, schema_store)
-        prompt_service = PromptService()
+        table_resolver = None
+        if settings.TABLE_RESOLVER_ENABLED:
+            table_resolver = TableResolver(registry, threshold=settings.TABLE_RESOLVER_THRESHOLD)
+        entity_service = EntityService(llm_service, schema_store, registry, table_resolver)
+        constraint_service = ConstraintService(llm_service, schema_store, registry)
+        prompt_service = PromptService(registry, schema_store)
+        
+        # 创建结果缓存
+        result_cache = None
+        if settings.RESULT_CACHE_ENABLED:
+            result_cache = ResultCache(
+                max_entries=settings.RESULT_CACHE_MAX_ENTRIES,
+                ttl=settings.RESULT_CACHE_TTL,
+                file_path=settings.RESULT_CACHE_FILE or None
+            )
+        
+        # 已验证的 问题 -> SQL 示例库
+        example_store = None
+        if settings.EXAMPLE_STORE_ENABLED:
+            from app.database.vectorstore import get_vector_store
+            example_store = ExampleStore(
+                get_vector_store(),
+                reuse_similarity=settings.EXAMPLE_REUSE_SIMILARITY,
+                min_similarity=settings.EXAMPLE_MIN_SIMILARITY,
+                top_k=settings.EXAMPLE_TOP_K,
+                queue_size=settings.EXAMPLE_INGEST_QUEUE_SIZE,
+                batch_size=settings.EXAMPLE_INGEST_BATCH_SIZE
+            )
         
         # 创建 SQL 生成器
         sql_generator = SQLGenerator(
@@ -27,9 +77,37 @@ def create_services():
             entity_service=entity_service,
             constraint_service=constraint_service,
             prompt_service=prompt_service,
-            schema_store=schema_store
+            schema_store=schema_store,
+            result_cache=result_cache,
+            pipeline_mode=settings.PIPELINE_MODE,
+            example_store=example_store
         )
         
         return sql_generator
     except Exception as e:
-        raise Exception(f"创建服务实例失败: {str(e)}") 
\ No newline at end of file
+        raise Exception(f"创建服务实例失败: {str(e)}") 
+
+def create_cost_guard():
+    """创建执行前代价检查服务，未启用时返回 None"""
+    if not settings.SQL_GUARD_ENABLED:
+        return None
+    return QueryCostGuard(
+        explain=explain_readonly,
+        max_cost=settings.SQL_GUARD_MAX_COST,
+        max_rows=settings.SQL_GUARD_MAX_ROWS,
+        auto_limit=settings.SQL_GUARD_AUTO_LIMIT,
+        limit_rows=settings.SQL_GUARD_LIMIT_ROWS,
+        cache=LRUCache(
+            max_entries=settings.SQL_GUARD_CACHE_ENTRIES,
+            ttl=settings.SQL_GUARD_CACHE_TTL,
+            name="plan"
+        )
+    )
+
+def create_query_cache():
+    """创建SQL执行结果缓存及其失效轮询任务，未启用时返回 (None, None)"""
+    if not settings.QUERY_CACHE_ENABLED:
+        return None, None
+    cache = QueryResultCache(max_bytes=settings.QUERY_CACHE_MAX_BYTES, ttl=settings.QUERY_CACHE_TTL)
+    watcher = TableChangeWatcher(engine, cache, settings.SCHEMA_CATALOG_SCHEMA)
+    return cache, watcher
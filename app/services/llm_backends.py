@@ -0,0 +1,418 @@
+from typing import Dict, Any, Optional, AsyncIterator, Tuple
+from collections import deque
+import abc
+import aiohttp
+import asyncio
+import contextlib
+import json
+import logging
+import time
+from app.config import settings
+from app.utils.metrics import record_circuit_state
+
+logger = logging.getLogger(__name__)
+
+__all__ = [
+    'LLMBackend', 'OllamaBackend', 'OpenAICompatibleBackend',
+    'CircuitBreaker', 'LatencyTracker', 'create_backends'
+]
+
+class LLMBackend(abc.ABC):
+    """
+    LLM 后端接口
+
+    complete 返回 (文本, 后端统计)；stream 逐段产出 (文本片段, 后端统计)，统计只在最后一段给出。
+    后端统计沿用 Ollama 的字段名（prompt_eval_count / eval_count / *_duration），便于统一导出指标。
+    """
+
+    def __init__(self, name: str, model: str, max_concurrency: int):
+        self.name = name
+        self.model = model
+        self.max_concurrency = max_concurrency
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._stats = {
+            "calls": 0,
+            "in_flight": 0,
+            "waiting": 0,
+            "queue_wait_total": 0.0,
+            "queue_wait_max": 0.0
+        }
+
+    @abc.abstractmethod
+    async def complete(
+        self,
+        prompt: str,
+        connect_timeout: Optional[float] = None,
+        read_timeout: Optional[float] = None
+    ) -> Tuple[str, Dict[str, Any]]:
+        """一次性生成完整响应"""
+
+    @abc.abstractmethod
+    def stream(
+        self,
+        prompt: str,
+        connect_timeout: Optional[float] = None,
+        read_timeout: Optional[float] = None
+    ) -> AsyncIterator[Tuple[str, Optional[Dict[str, Any]]]]:
+        """流式生成响应，子类以异步生成器实现"""
+
+    async def close(self):
+        pass
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取并发控制的统计信息"""
+        calls = self._stats["calls"]
+        return {
+            "model": self.model,
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self._stats["in_flight"],
+            "waiting": self._stats["waiting"],
+            "calls": calls,
+            "queue_wait_avg": self._stats["queue_wait_total"] / calls if calls else 0.0,
+            "queue_wait_max": self._stats["queue_wait_max"]
+        }
+
+    @contextlib.asynccontextmanager
+    async def _acquire_slot(self):
+        """获取并发槽位，并记录排队等待时间"""
+        start = time.perf_counter()
+        self._stats["waiting"] += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self._stats["waiting"] -= 1
+        wait = time.perf_counter() - start
+        self._stats["calls"] += 1
+        self._stats["queue_wait_total"] += wait
+        self._stats["queue_wait_max"] = max(self._stats["queue_wait_max"], wait)
+        self._stats["in_flight"] += 1
+        try:
+            yield
+        finally:
+            self._stats["in_flight"] -= 1
+            self._semaphore.release()
+
+
+class OllamaBackend(LLMBackend):
+    """Ollama /api/generate 后端，使用共享的 aiohttp 连接池"""
+
+    def __init__(
+        self,
+        name: str,
+        base_url: str,
+        model: str,
+        pool_size: int = 20,
+        keepalive_timeout: float = 60,
+        max_concurrency: int = 8
+    ):
+        super().__init__(name, model, max_concurrency)
+        self.base_url = base_url
+        self.pool_size = pool_size
+        self.keepalive_timeout = keepalive_timeout
+        # 应用生命周期内共享的 HTTP 会话，首次调用时创建
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        """获取共享的 HTTP 会话"""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=self.keepalive_timeout)
+            self._session = aiohttp.ClientSession(connector=connector)
+            logger.info(f"创建 LLM HTTP 连接池: backend={self.name}, limit={self.pool_size}")
+        return self._session
+
+    async def close(self):
+        """关闭共享的 HTTP 会话"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = super().get_stats()
+        connector = self._session.connector if self._session and not self._session.closed else None
+        stats["pool_size"] = self.pool_size
+        stats["active_connections"] = len(getattr(connector, "_acquired", ())) if connector else 0
+        return stats
+
+    def _build_timeout(
+        self,
+        connect_timeout: Optional[float] = None,
+        read_timeout: Optional[float] = None
+    ) -> aiohttp.ClientTimeout:
+        """构建单次调用的连接与读取超时"""
+        return aiohttp.ClientTimeout(
+            sock_connect=connect_timeout or settings.LLM_CONNECT_TIMEOUT,
+            sock_read=read_timeout or settings.LLM_READ_TIMEOUT
+        )
+
+    async def complete(
+        self,
+        prompt: str,
+        connect_timeout: Optional[float] = None,
+        read_timeout: Optional[float] = None
+    ) -> Tuple[str, Dict[str, Any]]:
+        try:
+            logger.debug(f"发送请求到 Ollama API, prompt 长度: {len(prompt)}")
+            async with self._acquire_slot():
+                async with self._get_session().post(
+                    f"{self.base_url}/api/generate",
+                    json={"model": self.model, "prompt": prompt, "stream": False},
+                    timeout=self._build_timeout(connect_timeout, read_timeout)
+                ) as response:
+                    if response.status != 200:
+                        error_text = await response.text()
+                        logger.error(f"Ollama API 返回错误: status={response.status}, error={error_text}")
+                        raise Exception(f"Ollama API error: {error_text}")
+
+                    result = await response.json()
+                    logger.debug(f"收到 Ollama API 响应: {json.dumps(result, ensure_ascii=False)[:200]}...")
+
+                    if "error" in result:
+                        logger.error(f"Ollama API 返回错误: {result['error']}")
+                        raise Exception(f"Ollama API error: {result['error']}")
+
+                    if "response" not in result:
+                        logger.error(f"Ollama API 响应格式错误: {json.dumps(result, ensure_ascii=False)}")
+                        raise Exception("Invalid response format from Ollama API")
+
+                    return result["response"], result
+
+        except asyncio.TimeoutError as e:
+            logger.error("请求 Ollama API 超时")
+            raise Exception("Timeout when calling Ollama API") from e
+        except aiohttp.ClientError as e:
+            logger.error(f"请求 Ollama API 时发生网络错误: {str(e)}")
+            raise Exception(f"Network error when calling Ollama API: {str(e)}")
+        except json.JSONDecodeError as e:
+            logger.error(f"解析 Ollama API 响应时发生错误: {str(e)}")
+            raise Exception(f"Failed to parse Ollama API response: {str(e)}")
+
+    async def stream(
+        self,
+        prompt: str,
+        connect_timeout: Optional[float] = None,
+        read_timeout: Optional[float] = None
+    ) -> AsyncIterator[Tuple[str, Optional[Dict[str, Any]]]]:
+        """按 NDJSON 行返回文本片段，调用方取消迭代时关闭底层 HTTP 请求，Ollama 随之停止生成"""
+        try:
+            async with self._acquire_slot():
+                async with self._get_session().post(
+                    f"{self.base_url}/api/generate",
+                    json={"model": self.model, "prompt": prompt, "stream": True},
+                    timeout=self._build_timeout(connect_timeout, read_timeout)
+                ) as response:
+                    if response.status != 200:
+                        error_text = await response.text()
+                        logger.error(f"Ollama API 返回错误: status={response.status}, error={error_text}")
+                        raise Exception(f"Ollama API error: {error_text}")
+
+                    async for line in response.content:
+                        if not line.strip():
+                            continue
+                        chunk = json.loads(line)
+                        if "error" in chunk:
+                            logger.error(f"Ollama API 返回错误: {chunk['error']}")
+                            raise Exception(f"Ollama API error: {chunk['error']}")
+                        done = chunk.get("done")
+                        if chunk.get("response") or done:
+                            yield chunk.get("response", ""), chunk if done else None
+                        if done:
+                            break
+        except asyncio.TimeoutError as e:
+            logger.error("请求 Ollama 流式 API 超时")
+            raise Exception("Timeout when calling Ollama API") from e
+        except aiohttp.ClientError as e:
+            logger.error(f"请求 Ollama 流式 API 时发生网络错误: {str(e)}")
+            raise Exception(f"Network error when calling Ollama API: {str(e)}")
+        except json.JSONDecodeError as e:
+            logger.error(f"解析 Ollama 流式响应时发生错误: {str(e)}")
+            raise Exception(f"Failed to parse Ollama API response: {str(e)}")
+
+
+class OpenAICompatibleBackend(LLMBackend):
+    """OpenAI 兼容的 chat/completions 后端（OpenAI、Azure OpenAI、vLLM 等）"""
+
+    def __init__(
+        self,
+        name: str,
+        base_url: str,
+        model: str,
+        api_key: str,
+        temperature: float = 0.1,
+        max_tokens: Optional[int] = None,
+        max_concurrency: int = 8
+    ):
+        # openai 导入较慢，仅在启用该后端时导入
+        from openai import AsyncOpenAI
+
+        super().__init__(name, model, max_concurrency)
+        self.base_url = base_url
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        self.client = AsyncOpenAI(api_key=api_key, base_url=base_url)
+
+    async def close(self):
+        await self.client.close()
+
+    def _request_options(
+        self,
+        prompt: str,
+        connect_timeout: Optional[float],
+        read_timeout: Optional[float]
+    ) -> Dict[str, Any]:
+        import httpx
+
+        options = {
+            "model": self.model,
+            "messages": [{"role": "user", "content": prompt}],
+            "temperature": self.temperature,
+            "timeout": httpx.Timeout(
+                read_timeout or settings.LLM_READ_TIMEOUT,
+                connect=connect_timeout or settings.LLM_CONNECT_TIMEOUT
+            )
+        }
+        if self.max_tokens:
+            options["max_tokens"] = self.max_tokens
+        return options
+
+    @staticmethod
+    def _usage_stats(usage) -> Dict[str, Any]:
+        if usage is None:
+            return {}
+        return {"prompt_eval_count": usage.prompt_tokens, "eval_count": usage.completion_tokens}
+
+    async def complete(
+        self,
+        prompt: str,
+        connect_timeout: Optional[float] = None,
+        read_timeout: Optional[float] = None
+    ) -> Tuple[str, Dict[str, Any]]:
+        async with self._acquire_slot():
+            response = await self.client.chat.completions.create(
+                **self._request_options(prompt, connect_timeout, read_timeout)
+            )
+        return response.choices[0].message.content or "", self._usage_stats(response.usage)
+
+    async def stream(
+        self,
+        prompt: str,
+        connect_timeout: Optional[float] = None,
+        read_timeout: Optional[float] = None
+    ) -> AsyncIterator[Tuple[str, Optional[Dict[str, Any]]]]:
+        async with self._acquire_slot():
+            response = await self.client.chat.completions.create(
+                **self._request_options(prompt, connect_timeout, read_timeout),
+                stream=True,
+                stream_options={"include_usage": True}
+            )
+            usage = None
+            async with response as chunks:
+                async for chunk in chunks:
+                    usage = chunk.usage or usage
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield chunk.choices[0].delta.content, None
+            yield "", self._usage_stats(usage)
+
+
+class CircuitBreaker:
+    """
+    后端熔断器
+
+    连续 failure_threshold 次失败（包括耗时超过 slow_call_threshold 的调用）后打开，
+    打开期间不再路由请求；recovery_time 秒后进入半开状态放行一个探测请求，
+    探测成功则关闭，失败则重新打开。
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 5, recovery_time: float = 30.0, slow_call_threshold: float = 60.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_time = recovery_time
+        self.slow_call_threshold = slow_call_threshold
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        record_circuit_state(name, self.state)
+
+    def allow(self) -> bool:
+        """当前是否允许向该后端发送请求"""
+        if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.recovery_time:
+            self._set_state(self.HALF_OPEN)
+        if self.state == self.HALF_OPEN:
+            if self._probing:
+                return False
+            self._probing = True
+            return True
+        return self.state == self.CLOSED
+
+    def record(self, ok: bool, elapsed: float = 0.0):
+        """记录一次调用结果，慢调用视为失败"""
+        if self.state == self.HALF_OPEN:
+            self._probing = False
+        if ok and elapsed < self.slow_call_threshold:
+            self.failures = 0
+            if self.state != self.CLOSED:
+                logger.info(f"LLM 后端 {self.name} 已恢复，熔断器关闭")
+                self._set_state(self.CLOSED)
+            return
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                logger.warning(f"LLM 后端 {self.name} 连续失败 {self.failures} 次，熔断 {self.recovery_time} 秒")
+            self.opened_at = time.monotonic()
+            self._set_state(self.OPEN)
+
+    def release(self):
+        """半开探测请求未得出结论（如被取消）时释放探测名额"""
+        if self.state == self.HALF_OPEN:
+            self._probing = False
+
+    def _set_state(self, state: str):
+        self.state = state
+        record_circuit_state(self.name, state)
+
+
+class LatencyTracker:
+    """最近若干次调用耗时的滑动窗口，用于计算对冲请求的等待阈值"""
+
+    def __init__(self, window: int = 200):
+        self._samples: deque = deque(maxlen=window)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def observe(self, elapsed: float):
+        self._samples.append(elapsed)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+        return ordered[index]
+
+
+def create_backends() -> Dict[str, LLMBackend]:
+    """根据配置创建 LLM 后端：始终包含 ollama，配置 LLM_OPENAI_ENABLED 时增加 openai"""
+    backends: Dict[str, LLMBackend] = {
+        "ollama": OllamaBackend(
+            "ollama",
+            base_url=settings.OLLAMA_BASE_URL,
+            model=settings.OLLAMA_MODEL,
+            pool_size=settings.LLM_POOL_SIZE,
+            keepalive_timeout=settings.LLM_KEEPALIVE_TIMEOUT,
+            max_concurrency=settings.LLM_MAX_CONCURRENCY
+        )
+    }
+    if settings.LLM_OPENAI_ENABLED:
+        backends["openai"] = OpenAICompatibleBackend(
+            "openai",
+            base_url=settings.OPENAI_API_BASE,
+            model=settings.OPENAI_MODEL_NAME,
+            api_key=settings.OPENAI_API_KEY,
+            temperature=settings.OPENAI_TEMPERATURE,
+            max_tokens=settings.OPENAI_MAX_TOKENS or None,
+            max_concurrency=settings.OPENAI_MAX_CONCURRENCY
+        )
+    return backends
@@ -1,46 +1,196 @@
-from typing import Optional, Dict, Any
-import aiohttp
+from typing import Optional, Dict, List, Any, AsyncIterator, Tuple
+import asyncio
+import contextlib
 import json
 import logging
+import time
 from app.config import settings
-from openai import OpenAI
+from app.services.cache_service import PromptMemo
+from app.services.llm_backends import LLMBackend, CircuitBreaker, LatencyTracker, create_backends
+from app.utils.metrics import record_llm_call, record_backend_call, record_hedged_request, record_backend_failover
+from app.utils.singleflight import SingleFlight
+from app.utils.logging_setup import log_payload
 
 logger = logging.getLogger(__name__)
 
 class LLMService:
-    def __init__(self):
-        self.client = OpenAI()
-        self.base_url = settings.OLLAMA_BASE_URL
-        self.model = settings.OLLAMA_MODEL
-        logger.info(f"初始化 LLM 服务: base_url={self.base_url}, model={self.model}")
-    
-    async def generate(self, prompt: str) -> str:
-        """调用LLM生成响应"""
+    """
+    LLM 调用入口
+
+    按阶段路由到配置的后端列表：第一个为主后端，主后端超过历史耗时分位数仍未返回时
+    向下一个后端发出对冲请求，先返回者胜出；主后端出错时立即故障转移。
+    每个后端配有熔断器，连续失败或过慢时暂时不再路由请求。
+    """
+
+    def __init__(
+        self,
+        backends: Optional[Dict[str, LLMBackend]] = None,
+        routes: Optional[Dict[str, List[str]]] = None,
+        memo: Optional[PromptMemo] = None
+    ):
+        self.backends = backends if backends is not None else create_backends()
+        self.routes = self._validate_routes(routes or settings.LLM_STAGE_ROUTES)
+        self.memo = memo
+        self.breakers = {
+            name: CircuitBreaker(
+                name,
+                failure_threshold=settings.LLM_BREAKER_FAILURE_THRESHOLD,
+                recovery_time=settings.LLM_BREAKER_RECOVERY_TIME,
+                slow_call_threshold=settings.LLM_BREAKER_SLOW_CALL
+            )
+            for name in self.backends
+        }
+        self.hedge_enabled = settings.LLM_HEDGE_ENABLED
+        self.hedge_percentile = settings.LLM_HEDGE_PERCENTILE
+        self.hedge_min_samples = settings.LLM_HEDGE_MIN_SAMPLES
+        self.hedge_min_delay = settings.LLM_HEDGE_MIN_DELAY
+        # (后端, 阶段) -> 最近成功调用的耗时
+        self._latency: Dict[Tuple[str, str], LatencyTracker] = {}
+        # 合并相同提示词的并发调用
+        self._flight = SingleFlight("llm_generate")
+        logger.info(f"初始化 LLM 服务: backends={list(self.backends)}, routes={self.routes}")
+
+    def _validate_routes(self, routes: Dict[str, List[str]]) -> Dict[str, List[str]]:
+        """去掉未配置的后端；未指定 default 时使用全部后端"""
+        validated = {}
+        for stage, names in routes.items():
+            unknown = [name for name in names if name not in self.backends]
+            if unknown:
+                logger.warning(f"LLM 路由中的后端未配置，已忽略: stage={stage}, backends={unknown}")
+            names = [name for name in names if name in self.backends]
+            if names:
+                validated[stage] = names
+        validated.setdefault("default", list(self.backends))
+        return validated
+
+    def _route(self, stage: Optional[str]) -> List[str]:
+        return self.routes.get(stage or "default", self.routes["default"])
+
+    def _memo_key(self, prompt: str, stage: Optional[str]) -> str:
+        # 路由到不同模型的阶段使用不同的缓存键
+        models = ",".join(f"{name}/{self.backends[name].model}" for name in self._route(stage))
+        return PromptMemo.make_key(models, prompt)
+
+    async def close(self):
+        """关闭全部后端的连接"""
+        for backend in self.backends.values():
+            await backend.close()
+
+    def get_pool_stats(self) -> Dict[str, Any]:
+        """获取各后端连接池、并发控制、熔断器与对冲阈值的统计信息"""
+        stats = {}
+        for name, backend in self.backends.items():
+            stats[name] = {
+                **backend.get_stats(),
+                "circuit": self.breakers[name].state,
+                "hedge_delay": {
+                    stage: self._hedge_delay(name, stage)
+                    for (backend_name, stage) in self._latency
+                    if backend_name == name
+                }
+            }
+        return stats
+
+    async def generate(
+        self,
+        prompt: str,
+        stage: Optional[str] = None,
+        memoize: bool = True,
+        connect_timeout: Optional[float] = None,
+        read_timeout: Optional[float] = None
+    ) -> str:
+        """
+        调用LLM生成响应
+        
+        Args:
+            prompt: 最终提示词
+            stage: 流水线阶段（table/field/constraint/fused/sql），用于结果校验与缓存 TTL
+            memoize: 是否使用按提示词内容寻址的响应缓存，非确定性阶段可关闭；
+                关闭时也不与其他相同提示词的并发调用合并
+        """
         try:
-            # 调用API
-            response = await self._call_api(prompt)
-            
-            # 提取JSON响应
-            result = self._extract_json(response)
+            memo_key = self._memo_key(prompt, stage)
+            use_memo = memoize and self.memo is not None and self.memo.stage_enabled(stage)
+            if use_memo:
+                cached = self.memo.get(memo_key)
+                if cached is not None:
+                    logger.debug(f"命中LLM响应缓存: stage={stage}")
+                    return cached
             
-            # 验证JSON格式
-            if not self._validate_json_response(result, prompt):
-                raise ValueError("LLM响应格式不正确")
+            async def call():
+                # 调用API
+                response = await self._call_api(prompt, connect_timeout, read_timeout, stage)
+                result = self.parse_response(response, prompt, stage)
+                if use_memo:
+                    self.memo.set(memo_key, result, stage=stage)
+                return result
             
-            return result
+            if not memoize:
+                return await call()
+            # 相同提示词的并发调用共享一次API请求
+            return await self._flight.do((memo_key, stage), call)
             
         except Exception as e:
             logger.error(f"LLM生成失败: {str(e)}", exc_info=True)
+            log_payload(logger, "LLM生成失败的提示词", error=True, stage=stage, prompt=prompt)
             raise
     
-    def _validate_json_response(self, response: str, prompt: str) -> bool:
+    async def generate_stream(
+        self,
+        prompt: str,
+        stage: Optional[str] = None,
+        memoize: bool = True,
+        connect_timeout: Optional[float] = None,
+        read_timeout: Optional[float] = None
+    ) -> AsyncIterator[str]:
+        """
+        以流式方式调用LLM，逐段返回生成的文本
+        
+        调用方拼接全部片段后应使用 parse_response 提取并校验结果；
+        命中响应缓存时一次性返回缓存内容。
+        """
+        use_memo = memoize and self.memo is not None and self.memo.stage_enabled(stage)
+        if use_memo:
+            memo_key = self._memo_key(prompt, stage)
+            cached = self.memo.get(memo_key)
+            if cached is not None:
+                logger.debug(f"命中LLM响应缓存: stage={stage}")
+                yield cached
+                return
+        
+        chunks = []
+        # 调用方提前关闭时立即关闭底层流，释放后端并发槽位
+        async with contextlib.aclosing(self._call_api_stream(prompt, connect_timeout, read_timeout, stage)) as stream:
+            async for chunk in stream:
+                chunks.append(chunk)
+                yield chunk
+        
+        if use_memo:
+            try:
+                self.memo.set(memo_key, self.parse_response("".join(chunks), prompt, stage), stage=stage)
+            except ValueError:
+                pass
+    
+    def parse_response(self, response: str, prompt: str, stage: Optional[str] = None) -> str:
+        """提取并校验LLM返回的JSON"""
+        # 提取JSON响应
+        result = self._extract_json(response)
+        
+        # 验证JSON格式
+        if not self._validate_json_response(result, prompt, stage):
+            raise ValueError("LLM响应格式不正确")
+        return result
+    
+    def _validate_json_response(self, response: str, prompt: str, stage: Optional[str] = None) -> bool:
         """验证JSON响应格式"""
         try:
             # 解析JSON
             data = json.loads(response)
             
             # 根据prompt类型判断需要验证的字段
-            if "表识别提示词" in prompt:
+            if stage == "fused":
+                return self._validate_fused_extraction(data)
+            elif "表识别提示词" in prompt:
                 return self._validate_table_extraction(data)
             elif "字段识别提示词" in prompt:
                 return self._validate_field_extraction(data)
@@ -102,6 +252,17 @@ class LLMService:
                         return False
         return True
     
+    def _validate_fused_extraction(self, data: Dict) -> bool:
+        """验证字段识别与约束分析合并结果"""
+        if not isinstance(data, dict):
+            return False
+        if "fields" not in data or "constraints" not in data:
+            return False
+        return (
+            self._validate_field_extraction(data["fields"])
+            and self._validate_constraint_analysis(data["constraints"])
+        )
+    
     def _validate_sql_generation(self, data: Dict) -> bool:
         """验证SQL生成结果"""
         if not isinstance(data, dict):
@@ -112,19 +273,191 @@ class LLMService:
             return False
         return True
 
-    async def _call_api(self, prompt: str):
+    def _hedge_delay(self, name: str, stage: Optional[str]) -> Optional[float]:
+        """主后端的对冲等待时间；样本不足时返回 None，不发对冲请求"""
+        tracker = self._latency.get((name, stage or "unknown"))
+        if tracker is None or len(tracker) < self.hedge_min_samples:
+            return None
+        return max(self.hedge_min_delay, tracker.percentile(self.hedge_percentile))
+
+    async def _attempt(
+        self,
+        name: str,
+        full_prompt: str,
+        connect_timeout: Optional[float],
+        read_timeout: Optional[float],
+        stage: Optional[str]
+    ) -> Tuple[str, Dict[str, Any]]:
+        """向单个后端发出请求，并记录熔断器状态与耗时"""
+        breaker = self.breakers[name]
+        start = time.perf_counter()
+        try:
+            text, stats = await self.backends[name].complete(full_prompt, connect_timeout, read_timeout)
+        except asyncio.CancelledError:
+            # 对冲中落败被取消：已经超过慢调用阈值时仍计为失败
+            elapsed = time.perf_counter() - start
+            if elapsed >= breaker.slow_call_threshold:
+                breaker.record(False, elapsed)
+            else:
+                breaker.release()
+            record_backend_call(name, stage, "cancelled")
+            raise
+        except Exception:
+            breaker.record(False, time.perf_counter() - start)
+            record_backend_call(name, stage, "error")
+            raise
+        elapsed = time.perf_counter() - start
+        breaker.record(True, elapsed)
+        self._latency.setdefault((name, stage or "unknown"), LatencyTracker()).observe(elapsed)
+        record_backend_call(name, stage, "success")
+        return text, stats
+
+    async def _call_api(
+        self,
+        prompt: str,
+        connect_timeout: Optional[float] = None,
+        read_timeout: Optional[float] = None,
+        stage: Optional[str] = None
+    ):
         """
-        使用 Ollama API 生成响应
-        
+        按阶段路由调用 LLM 后端
+
         Args:
             prompt: 提示词
-            
+            connect_timeout: 建立连接超时（秒），默认使用配置
+            read_timeout: 读取响应超时（秒），默认使用配置
+            stage: 流水线阶段，用于路由、对冲阈值与指标标签
+
         Returns:
             str: 生成的响应
         """
+        full_prompt = self._build_full_prompt(prompt)
+        candidates = iter(self._route(stage))
+        pending: Dict[asyncio.Task, str] = {}
+        hedged = False
+        last_error: Optional[Exception] = None
+
+        def launch_next() -> Optional[str]:
+            # 跳过已熔断的后端，返回发出请求的后端名
+            for name in candidates:
+                if self.breakers[name].allow():
+                    task = asyncio.ensure_future(
+                        self._attempt(name, full_prompt, connect_timeout, read_timeout, stage)
+                    )
+                    pending[task] = name
+                    return name
+                logger.warning(f"LLM 后端 {name} 已熔断，跳过: stage={stage}")
+            return None
+
+        # 当前的主后端；故障转移后为接替的后端，对冲计时与胜出统计都以它为准
+        primary = launch_next()
+        if primary is None:
+            raise Exception(f"没有可用的 LLM 后端: stage={stage}")
+
         try:
-            # 构建完整的提示词，要求返回 JSON 格式
-            full_prompt = f"""请将以下自然语言转换为PostgreSQL查询语句。
+            while pending:
+                timeout = None
+                if self.hedge_enabled and not hedged and len(pending) == 1:
+                    timeout = self._hedge_delay(primary, stage)
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+                if not done:
+                    # 主后端超过对冲阈值仍未返回
+                    hedged = True
+                    if launch_next():
+                        logger.info(f"LLM 后端 {primary} 超过 {timeout:.2f} 秒未返回，发出对冲请求: stage={stage}")
+                    continue
+
+                for task in done:
+                    name = pending.pop(task)
+                    try:
+                        text, stats = task.result()
+                    except Exception as e:
+                        logger.error(f"调用 LLM 后端 {name} 失败: {str(e)}")
+                        last_error = e
+                        continue
+                    if hedged:
+                        record_hedged_request(stage, "primary" if name == primary else "hedge")
+                    record_llm_call(stage, full_prompt, text, stats)
+                    return text
+
+                if not pending:
+                    # 全部已发出的请求均失败，故障转移到下一个后端；这不是对冲，接替的后端重新计时
+                    if hedged:
+                        # 本轮对冲的两个请求都失败了
+                        record_hedged_request(stage, "none")
+                        hedged = False
+                    failover = launch_next()
+                    if failover is not None:
+                        record_backend_failover(failover, stage)
+                        primary = failover
+        finally:
+            for task in pending:
+                task.cancel()
+
+        if hedged:
+            record_hedged_request(stage, "none")
+        raise last_error or Exception(f"没有可用的 LLM 后端: stage={stage}")
+
+    async def _call_api_stream(
+        self,
+        prompt: str,
+        connect_timeout: Optional[float] = None,
+        read_timeout: Optional[float] = None,
+        stage: Optional[str] = None
+    ) -> AsyncIterator[str]:
+        """
+        以流式方式按阶段路由调用 LLM 后端
+
+        流式调用不发对冲请求；后端在返回第一个片段前出错时故障转移到下一个后端，
+        之后出错则直接抛出。调用方取消迭代时会关闭底层请求。
+        """
+        full_prompt = self._build_full_prompt(prompt)
+        last_error: Optional[Exception] = None
+        for name in self._route(stage):
+            breaker = self.breakers[name]
+            if not breaker.allow():
+                logger.warning(f"LLM 后端 {name} 已熔断，跳过: stage={stage}")
+                continue
+            if last_error is not None:
+                record_backend_failover(name, stage)
+
+            start = time.perf_counter()
+            chunks = []
+            stats = None
+            stream = self.backends[name].stream(full_prompt, connect_timeout, read_timeout)
+            try:
+                async for text, final in stream:
+                    if text:
+                        chunks.append(text)
+                        yield text
+                    if final is not None:
+                        stats = final
+            except (asyncio.CancelledError, GeneratorExit):
+                breaker.release()
+                record_backend_call(name, stage, "cancelled")
+                raise
+            except Exception as e:
+                breaker.record(False, time.perf_counter() - start)
+                record_backend_call(name, stage, "error")
+                if chunks:
+                    raise
+                logger.error(f"调用 LLM 后端 {name} 失败，尝试下一个后端: {str(e)}")
+                last_error = e
+                continue
+            finally:
+                await stream.aclose()
+
+            breaker.record(True, time.perf_counter() - start)
+            record_backend_call(name, stage, "success")
+            record_llm_call(stage, full_prompt, "".join(chunks), stats)
+            return
+
+        raise last_error or Exception(f"没有可用的 LLM 后端: stage={stage}")
+
+    def _build_full_prompt(self, prompt: str) -> str:
+        """构建完整的提示词，要求返回 JSON 格式"""
+        return f"""请将以下自然语言转换为PostgreSQL查询语句。
 
 用户查询：{prompt}
 
@@ -139,43 +472,6 @@ class LLMService:
 
 只返回JSON格式的结果，不要包含其他说明文字。
 """
-            logger.debug(f"发送请求到 Ollama API, prompt 长度: {len(prompt)}")
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    f"{self.base_url}/api/generate",
-                    json={
-                        "model": self.model,
-                        "prompt": full_prompt,
-                        "stream": False
-                    }
-                ) as response:
-                    if response.status != 200:
-                        error_text = await response.text()
-                        logger.error(f"Ollama API 返回错误: status={response.status}, error={error_text}")
-                        raise Exception(f"Ollama API error: {error_text}")
-                    
-                    result = await response.json()
-                    logger.debug(f"收到 Ollama API 响应: {json.dumps(result, ensure_ascii=False)[:200]}...")
-                    
-                    if "error" in result:
-                        logger.error(f"Ollama API 返回错误: {result['error']}")
-                        raise Exception(f"Ollama API error: {result['error']}")
-                    
-                    if "response" not in result:
-                        logger.error(f"Ollama API 响应格式错误: {json.dumps(result, ensure_ascii=False)}")
-                        raise Exception("Invalid response format from Ollama API")
-                    
-                    return result["response"]
-                    
-        except aiohttp.ClientError as e:
-            logger.error(f"请求 Ollama API 时发生网络错误: {str(e)}", exc_info=True)
-            raise Exception(f"Network error when calling Ollama API: {str(e)}")
-        except json.JSONDecodeError as e:
-            logger.error(f"解析 Ollama API 响应时发生错误: {str(e)}", exc_info=True)
-            raise Exception(f"Failed to parse Ollama API response: {str(e)}")
-        except Exception as e:
-            logger.error(f"调用 Ollama API 时发生未知错误: {str(e)}", exc_info=True)
-            raise
 
     def _extract_json(self, response: str) -> str:
         """
@@ -199,5 +495,3 @@ class LLMService:
             json_str = response.strip()
         
         return json_str
-
-llm_service = LLMService() 
\ No newline at end of file
@@ -5,10 +5,12 @@ from app.config import settings
 class OpenAIService:
     def __init__(self):
         self.client = AsyncOpenAI(
-            # api_key=settings.OPENAI_API_KEY,
+            api_key=settings.OPENAI_API_KEY,
             base_url=settings.OPENAI_API_BASE  # 可以设置为 Azure OpenAI 或其他兼容接口
         )
         self.model = settings.OPENAI_MODEL_NAME
+        self.temperature = settings.OPENAI_TEMPERATURE
+        self.max_tokens = settings.OPENAI_MAX_TOKENS
     
     async def generate_sql(
         self,
@@ -42,12 +44,24 @@ class OpenAIService:
         response = await self.client.chat.completions.create(
             model=self.model,
             messages=messages,
-            temperature=0.1,  # 降低随机性，使输出更确定
-            max_tokens=500,
+            temperature=self.temperature,  # 默认 0.1，降低随机性，使输出更确定
+            max_tokens=self.max_tokens,
             response_format={"type": "text"}
         )
         
         return response.choices[0].message.content.strip()
 
-# 创建服务实例
-openai_service = OpenAIService() 
\ No newline at end of file
+_openai_service: Optional[OpenAIService] = None
+
+def get_openai_service() -> OpenAIService:
+    """获取服务实例，首次调用时创建"""
+    global _openai_service
+    if _openai_service is None:
+        _openai_service = OpenAIService()
+    return _openai_service
+
+def __getattr__(name: str):
+    # 兼容 from app.services.openai_service import openai_service
+    if name == "openai_service":
+        return get_openai_service()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
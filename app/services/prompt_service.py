@@ -1,53 +1,38 @@
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional, Tuple
 import logging
-import os
-from pathlib import Path
+import re
+from app.config import settings
+from app.database.resource_registry import ResourceRegistry
+from app.database.schema_store import SchemaStore
+from app.utils.tokenizer import count_tokens
+from app.utils.logging_setup import log_payload
 
 logger = logging.getLogger(__name__)
 
 class PromptService:
-    def __init__(self):
-        self.resources_dir = Path(__file__).parent.parent / "resources"
+    def __init__(self, registry: ResourceRegistry, schema_store: SchemaStore):
+        self.registry = registry
+        self.schema_store = schema_store
     
     def _load_prompt_template(self) -> str:
         """加载 prompt 模板"""
-        template_path = self.resources_dir / "prompts" / "sql_generation.md"
-        with open(template_path, 'r', encoding='utf-8') as f:
-            return f.read()
+        return self.registry.get_prompt("sql_generation")
     
-    def _load_table_ddl(self, table_name: str) -> str:
-        """加载表 DDL"""
-        ddl_path = self.resources_dir / "schemas" / f"{table_name}.md"
-        if not ddl_path.exists():
-            logger.warning(f"表结构文件不存在: {ddl_path}")
-            return ""
-        
-        with open(ddl_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-            # 提取 DDL 部分
-            start = content.find("```sql")
-            end = content.find("```", start + 6)
-            if start != -1 and end != -1:
-                return content[start+6:end].strip()
-            return ""
-    
-    def generate_prompt(
+    async def generate_prompt(
         self,
         query: str,
         entities: Dict[str, List[str]],
         constraints: Dict[str, Any],
-        business_rules: List[str]
-    ) -> str:
+        business_rules: List[str],
+        examples: Optional[List[Dict[str, Any]]] = None
+    ) -> Tuple[str, Dict[str, int]]:
         """
         生成完整的 prompt
-        """
-        # 收集相关表的 DDL
-        table_ddls = []
-        for table in entities["tables"]:
-            ddl = self._load_table_ddl(table)
-            if ddl:
-                table_ddls.append(ddl)
         
+        表结构只保留识别出的查询字段、约束条件中出现的字段以及主外键，
+        并受 PROMPT_TOKEN_BUDGET 约束；相似问题的示例计入预留 token，优先于表结构字段。
+        返回 (prompt, token 统计)。
+        """
         # 格式化查询字段
         query_fields = []
         for table, fields in entities["fields"].items():
@@ -73,18 +58,51 @@ class PromptService:
                 formatted_constraints.append(f"表 {table} 的约束条件：")
                 formatted_constraints.extend([f"  - {c}" for c in table_formatted])
         
-        # 填充模板
+        # 收集相关表的 DDL，保留查询字段及约束条件中引用的字段
+        constraints_text = "\n".join(formatted_constraints)
+        mentioned = set(re.findall(r"[A-Za-z_][A-Za-z0-9_]*", constraints_text))
+        keep_fields = {
+            table: list(entities["fields"].get(table, [])) + sorted(mentioned)
+            for table in entities["tables"]
+        }
+        
         template = self._load_prompt_template()
-        prompt = template.format(
-            table_ddl="\n\n".join(table_ddls),
+        values = dict(
             query_fields="\n".join(query_fields),
-            constraints="\n".join(formatted_constraints),
+            constraints=constraints_text,
             business_rules="\n".join(business_rules),
+            examples=self._format_examples(examples or []),
             user_query=query
         )
+        reserved = count_tokens(template.format(table_ddl="", **values))
+        table_ddl, schema_stats = await self.schema_store.get_budgeted_tables_schema(
+            entities["tables"],
+            reserved_tokens=reserved,
+            keep_fields=keep_fields,
+            sql_only=True
+        )
         
-        logger.info(f"生成的完整 prompt:\n{prompt}")
-        return prompt
+        # 填充模板
+        prompt = template.format(table_ddl=table_ddl, **values)
+        token_usage = {
+            "prompt_tokens": count_tokens(prompt),
+            "budget": settings.PROMPT_TOKEN_BUDGET,
+            "examples": len(examples or []),
+            **schema_stats
+        }
+        
+        logger.info(f"生成 prompt: {token_usage}")
+        log_payload(logger, "生成的完整 prompt", stage="sql", prompt=prompt)
+        return prompt, token_usage
+
+    @staticmethod
+    def _format_examples(examples: List[Dict[str, Any]]) -> str:
+        if not examples:
+            return "无"
+        return "\n\n".join(
+            f"问题：{example['question']}\nSQL：{example['sql']}"
+            for example in examples
+        )
 
     def generate_sql_prompt(
         self,
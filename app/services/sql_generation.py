@@ -1,10 +1,20 @@
-from typing import Dict, Any
+from typing import Dict, Any, Optional, Tuple, AsyncIterator, List
+import asyncio
+import contextlib
+import json
 import logging
+import time
 from app.services.llm_service import LLMService
 from app.services.entity_service import EntityService
 from app.services.constraint_service import ConstraintService
 from app.services.prompt_service import PromptService
+from app.services.cache_service import ResultCache
 from app.database.schema_store import SchemaStore
+from app.database.example_store import ExampleStore
+from app.utils.helpers import normalize_query
+from app.utils.metrics import stage_timer, STAGE_LATENCY
+from app.utils.singleflight import SingleFlight
+from app.utils.logging_setup import log_payload
 
 logger = logging.getLogger(__name__)
 
@@ -15,62 +25,257 @@ class SQLGenerator:
         entity_service: EntityService,
         constraint_service: ConstraintService,
         prompt_service: PromptService,
-        schema_store: SchemaStore
+        schema_store: SchemaStore,
+        result_cache: Optional[ResultCache] = None,
+        pipeline_mode: str = "split",
+        example_store: Optional[ExampleStore] = None
     ):
         self.llm = llm_service
         self.entity_service = entity_service
         self.constraint_service = constraint_service
         self.prompt_service = prompt_service
         self.schema_store = schema_store
-        logger.info("SQL生成器初始化完成")
+        self.result_cache = result_cache
+        self.example_store = example_store
+        if pipeline_mode not in ("split", "fused"):
+            raise ValueError(f"未知的流水线模式: {pipeline_mode}")
+        self.pipeline_mode = pipeline_mode
+        # 合并相同问题的并发生成请求
+        self._flight = SingleFlight("generate_sql")
+        logger.info(f"SQL生成器初始化完成: pipeline_mode={pipeline_mode}")
+    
+    def _cache_key(self, query: str) -> str:
+        return ResultCache.make_key(normalize_query(query), self.schema_store.schema_version)
     
     async def generate_sql(self, query: str) -> Dict[str, Any]:
-        """生成SQL查询"""
+        """生成SQL查询，优先从结果缓存返回"""
+        with stage_timer("total"):
+            return await self._generate_sql_cached(query)
+    
+    async def _generate_sql_cached(self, query: str) -> Dict[str, Any]:
+        cache_key = self._cache_key(query)
+        if self.result_cache is not None:
+            cached = self.result_cache.get(cache_key)
+            if cached is not None:
+                cached["cached"] = True
+                return cached
+        
+        # 相同规范化问题与 schema 版本的并发请求共享一次流水线执行
+        result = dict(await self._flight.do(cache_key, lambda: self._generate_and_store(query, cache_key)))
+        result["cached"] = False
+        return result
+    
+    async def _generate_and_store(self, query: str, cache_key: str) -> Dict[str, Any]:
+        result = await self._generate_sql(query)
+        if self.result_cache is not None:
+            self.result_cache.set(cache_key, result)
+        return result
+    
+    async def _lookup_examples(self, query: str) -> Tuple[Optional[Dict[str, Any]], List[Dict[str, Any]]]:
+        """检索相似的历史示例，返回 (可直接复用的结果, few-shot 示例)"""
+        if self.example_store is None:
+            return None, []
+        with stage_timer("example_lookup"):
+            example, shots = await self.example_store.lookup(query, self.schema_store.schema_version)
+        if example is None:
+            return None, shots
+        logger.info(f"复用相似问题的SQL: similarity={example['similarity']:.3f}, question={example['question']}")
+        return {
+            "sql": example["sql"],
+            "description": example["description"],
+            "entities": {"tables": example["tables"], "fields": {}},
+            "constraints": {},
+            "token_usage": None,
+            "example": {"question": example["question"], "similarity": example["similarity"]}
+        }, []
+    
+    def remember_example(self, query: str, result: Dict[str, Any]):
+        """记录执行成功的SQL，后台写入示例库；复用示例得到的结果不重复记录"""
+        if self.example_store is None or result.get("example"):
+            return
+        self.example_store.add(
+            query,
+            result["sql"],
+            result.get("description"),
+            result["entities"]["tables"],
+            self.schema_store.schema_version
+        )
+    
+    async def _run_stage(self, name: str, metric_stage: str, coro):
+        """执行流水线阶段，统一包装错误信息并记录耗时"""
+        logger.info(f"开始{name}")
         try:
-            # 1. 实体抽取
-            logger.info(f"开始实体抽取: {query}")
-            try:
-                entities = await self.entity_service.extract_entities(query)
-                logger.info(f"实体抽取结果: {entities}")
-            except Exception as e:
-                logger.error("实体抽取失败", exc_info=True)
-                raise Exception(f"实体抽取失败: {str(e)}")
-            
-            # 2. 约束解析
-            logger.info("开始约束解析")
-            try:
-                constraints = await self.constraint_service.parse_constraints(
-                    query,
-                    entities["tables"]
-                )
-                logger.info(f"约束解析结果: {constraints}")
-            except Exception as e:
-                logger.error("约束解析失败", exc_info=True)
-                raise Exception(f"约束解析失败: {str(e)}")
-            
-            # 3. 获取业务规则
-            business_rules = await self.schema_store.get_business_rules(
-                entities=entities["tables"]
+            with stage_timer(metric_stage):
+                result = await coro
+            logger.info(f"{name}完成")
+            log_payload(logger, f"{name}结果", stage=metric_stage, result=result)
+            return result
+        except Exception as e:
+            logger.error(f"{name}失败", exc_info=True)
+            raise Exception(f"{name}失败: {str(e)}")
+    
+    async def _iter_stages(
+        self,
+        query: str,
+        examples: Optional[List[Dict[str, Any]]] = None
+    ) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        依次执行SQL生成前的各个阶段，每完成一个阶段产出 (阶段名, 结果)
+        
+        产出顺序为 tables、fields、constraints、prompt，最后产出 prompt 的 token 统计 token_usage。
+        examples 为加入SQL生成提示词的相似问题示例。
+        """
+        # 1. 识别涉及的表
+        tables = await self._run_stage("实体抽取", "table_extraction", self.entity_service.extract_tables(query))
+        yield "tables", tables
+        
+        # 2. 字段识别与约束解析
+        if self.pipeline_mode == "fused":
+            fields, constraints = await self._run_stage(
+                "字段与约束解析",
+                "field_constraint_extraction",
+                self.constraint_service.parse_fields_and_constraints(query, tables)
             )
-            
-            # 4. 生成完整 prompt
-            prompt = self.prompt_service.generate_prompt(
+            yield "fields", fields
+        else:
+            fields = await self._run_stage(
+                "字段识别",
+                "field_extraction",
+                self.entity_service.extract_fields(query, tables)
+            )
+            yield "fields", fields
+            constraints = await self._run_stage(
+                "约束解析",
+                "constraint_analysis",
+                self.constraint_service.parse_constraints(query, tables, fields)
+            )
+        yield "constraints", constraints
+        
+        # 3. 获取业务规则
+        with stage_timer("business_rules"):
+            business_rules = await self.schema_store.get_business_rules(tables)
+        
+        # 4. 生成完整 prompt
+        with stage_timer("prompt_build"):
+            prompt, token_usage = await self.prompt_service.generate_prompt(
                 query=query,
-                entities=entities,
+                entities={"tables": tables, "fields": fields},
                 constraints=constraints,
-                business_rules=business_rules
+                business_rules=business_rules,
+                examples=examples
             )
+        yield "prompt", prompt
+        yield "token_usage", token_usage
+    
+    def _build_result(self, sql_json: str, stages: Dict[str, Any]) -> Dict[str, Any]:
+        """根据SQL生成结果和各阶段结果构建返回值"""
+        data = json.loads(sql_json)
+        return {
+            "sql": data["sql"],
+            "description": data.get("description"),
+            "entities": {"tables": stages["tables"], "fields": stages["fields"]},
+            "constraints": stages["constraints"],
+            "token_usage": stages.get("token_usage")
+        }
+    
+    async def _generate_sql(self, query: str) -> Dict[str, Any]:
+        """执行完整的SQL生成流程"""
+        try:
+            reused, examples = await self._lookup_examples(query)
+            if reused is not None:
+                return reused
+            
+            stages = {}
+            async for stage, data in self._iter_stages(query, examples):
+                stages[stage] = data
             
             # 5. 生成SQL
             logger.info("开始生成SQL")
-            sql = await self.llm.generate(prompt)
-            logger.info(f"生成的SQL: {sql}")
+            with stage_timer("sql_generation"):
+                sql_json = await self.llm.generate(stages["prompt"], stage="sql")
+            log_payload(logger, "生成的SQL", stage="sql", result=sql_json)
             
-            return {
-                "sql": sql,
-                "entities": entities,
-                "constraints": constraints
-            }
+            return self._build_result(sql_json, stages)
         except Exception as e:
             logger.error(f"生成SQL过程中发生错误: {str(e)}", exc_info=True)
-            raise 
\ No newline at end of file
+            raise
+    
+    async def generate_sql_batch(
+        self,
+        queries: List[str],
+        concurrency: int
+    ) -> AsyncIterator[Tuple[int, Optional[Dict[str, Any]], Optional[Exception]]]:
+        """
+        批量生成SQL，按完成顺序产出 (原始下标, 结果, 异常)
+        
+        规范化后相同的问题只执行一次，结果分发给所有重复项；
+        单条失败只影响该条，不会中断整个批次。
+        """
+        groups: Dict[str, List[int]] = {}
+        for index, query in enumerate(queries):
+            groups.setdefault(normalize_query(query), []).append(index)
+        logger.info(f"批量生成SQL: 共 {len(queries)} 条, 去重后 {len(groups)} 条, 并发 {concurrency}")
+        
+        semaphore = asyncio.Semaphore(concurrency)
+        
+        async def run(indexes: List[int]):
+            async with semaphore:
+                try:
+                    return indexes, await self.generate_sql(queries[indexes[0]]), None
+                except Exception as e:
+                    return indexes, None, e
+        
+        tasks = [asyncio.ensure_future(run(indexes)) for indexes in groups.values()]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                indexes, result, error = await next_done
+                for index in indexes:
+                    yield index, dict(result) if result is not None else None, error
+        finally:
+            for task in tasks:
+                task.cancel()
+    
+    async def generate_sql_stream(self, query: str) -> AsyncIterator[Dict[str, Any]]:
+        """
+        以事件流方式生成SQL
+        
+        每完成一个阶段产出一个事件，随后逐段产出SQL生成的 token，
+        最后产出完整结果。命中结果缓存或直接复用历史示例时只产出 result 事件。
+        """
+        if self.result_cache is not None:
+            cache_key = self._cache_key(query)
+            cached = self.result_cache.get(cache_key)
+            if cached is not None:
+                cached["cached"] = True
+                yield {"event": "result", "data": cached}
+                return
+        
+        reused, examples = await self._lookup_examples(query)
+        if reused is not None:
+            if self.result_cache is not None:
+                self.result_cache.set(cache_key, reused)
+            yield {"event": "result", "data": {**reused, "cached": False}}
+            return
+        
+        stages = {}
+        async with contextlib.aclosing(self._iter_stages(query, examples)) as stage_events:
+            async for stage, data in stage_events:
+                stages[stage] = data
+                if stage != "prompt":
+                    yield {"event": stage, "data": data}
+        
+        logger.info("开始流式生成SQL")
+        chunks = []
+        started = time.perf_counter()
+        async with contextlib.aclosing(self.llm.generate_stream(stages["prompt"], stage="sql")) as tokens:
+            async for token in tokens:
+                chunks.append(token)
+                yield {"event": "token", "data": token}
+        STAGE_LATENCY.labels(stage="sql_generation").observe(time.perf_counter() - started)
+        
+        sql_json = self.llm.parse_response("".join(chunks), stages["prompt"], stage="sql")
+        result = self._build_result(sql_json, stages)
+        if self.result_cache is not None:
+            self.result_cache.set(cache_key, result)
+        result["cached"] = False
+        yield {"event": "result", "data": result}
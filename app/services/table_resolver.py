@@ -0,0 +1,228 @@
+from typing import Dict, List, Any, Optional, Tuple
+import logging
+import re
+import unicodedata
+from app.database.resource_registry import ResourceRegistry
+from app.utils.metrics import record_table_resolution
+
+logger = logging.getLogger(__name__)
+
+# 不同来源词条的置信度：表名 > 配置的同义词 > 从表描述中提取的名称
+NAME_CONFIDENCE = 1.0
+SYNONYM_CONFIDENCE = 0.95
+DESCRIPTION_CONFIDENCE = 0.8
+# 问题中出现指向多张表且无法消歧的词条时，整体置信度乘以该系数
+AMBIGUITY_PENALTY = 0.5
+# 问题中还有词典之外的名词时（可能是未收录的表），整体置信度乘以该系数
+UNCOVERED_PENALTY = 0.5
+
+# 不指向任何表的常见查询用词，与字段名、字段说明一起用于判断问题是否已被词典完全覆盖
+GENERIC_TERMS = (
+    "查询", "查找", "查看", "统计", "计算", "显示", "列出", "获取", "给出", "返回", "找出", "看看", "分析",
+    "每个", "每位", "每天", "每周", "每月", "每年", "各个", "所有", "全部", "总共", "一共", "分别",
+    "多少", "数量", "个数", "总数", "次数", "数目", "总和", "合计", "总计", "平均", "占比", "比例",
+    "最大", "最小", "最高", "最低", "最多", "最少", "最近", "最新", "最早", "前面", "排名", "排序", "分组",
+    "今天", "昨天", "本周", "上周", "本月", "上月", "今年", "去年", "之后", "之前", "以来", "期间",
+    "以上", "以下", "超过", "大于", "小于", "等于", "不是", "没有", "按照", "根据", "包括", "包含",
+    "哪些", "哪个", "什么", "是否", "情况", "信息", "列表", "明细", "记录", "数据", "详情",
+    "名称", "名字", "姓名", "时间", "日期", "状态", "类型", "金额", "价格", "总额",
+    "创建", "注册", "新增", "更新", "修改", "删除", "活跃", "有效", "开头", "结尾", "为空", "不为空",
+    "select", "from", "where", "join", "group", "order", "by", "count", "sum", "avg", "max", "min",
+    "all", "each", "per", "of", "the", "and", "or", "in", "with", "for", "to", "top", "show", "list",
+    "how", "many", "what", "which", "is", "are",
+)
+
+# 问题中的取值（引号中的字符串、邮箱与域名），不会是表名
+_LITERAL_RE = re.compile(r"[\"'“‘「][^\"'”’」]*[\"'”’」]|[\w.+-]*[\w-]\.[a-z]{2,}\b")
+# 虚词，在判断未覆盖的名词前替换为分隔符
+_PARTICLES_RE = re.compile(r"[的地得和与及或为是在按被把从到对了吗呢中里各个每总]")
+# 未覆盖片段中的名词：连续两个以上的汉字，或两个以上字母组成的英文单词
+_NOUN_SPAN_RE = re.compile(r"[\u4e00-\u9fff]{2,}|[a-z][a-z0-9_]+")
+
+_LEADING_PHRASE_RE = re.compile(r"^[^\s，,。.;；:：（(]+")
+
+def _normalize(text: str) -> str:
+    return unicodedata.normalize("NFKC", text).casefold()
+
+class TableResolver:
+    """
+    基于词典的表识别
+
+    从表名、表描述和同义词配置构建 词条 -> 表 的词典，对问题做最长匹配，
+    返回识别出的表集合和置信度。置信度达到阈值时可以跳过 LLM 表识别阶段。
+    """
+
+    def __init__(self, registry: ResourceRegistry, threshold: float = 0.9):
+        self.registry = registry
+        self.threshold = threshold
+        # 首字符 -> [(词条, {表: 置信度})]，按词条长度降序
+        self._terms: Dict[str, List[Tuple[str, Dict[str, float]]]] = {}
+        # 不指向表的词条（通用查询用词、字段名与字段说明），结构同 _terms
+        self._fillers: Dict[str, List[Tuple[str, Dict[str, float]]]] = {}
+        self._version: Optional[str] = None
+        self._stats = {"fast_path": 0, "fallback": 0}
+
+    def _known_tables(self) -> List[str]:
+        return sorted(set(self.registry.get_ddl_tables()) | set(self.registry.get_table_descriptions()))
+
+    def _build(self):
+        """根据注册表当前内容构建词典"""
+        entries: Dict[str, Dict[str, float]] = {}
+
+        def add(term: str, table: str, confidence: float):
+            term = _normalize(term.strip())
+            if term:
+                tables = entries.setdefault(term, {})
+                tables[table] = max(tables.get(table, 0.0), confidence)
+
+        known = self._known_tables()
+        descriptions = self.registry.get_table_descriptions()
+        for table in known:
+            add(table, table, NAME_CONFIDENCE)
+            if table.endswith("s") and len(table) > 3:
+                add(table[:-1], table, NAME_CONFIDENCE)
+            # 描述摘要的首个短语，如 "用户信息表 users，..." 中的 "用户信息表" 与 "用户信息"
+            summary = (descriptions.get(table) or {}).get("summary", "")
+            match = _LEADING_PHRASE_RE.match(summary)
+            if match and _normalize(match.group()) != _normalize(table):
+                phrase = match.group()
+                add(phrase, table, DESCRIPTION_CONFIDENCE)
+                if phrase.endswith("表") and len(phrase) > 2:
+                    add(phrase[:-1], table, DESCRIPTION_CONFIDENCE)
+
+        for table, synonyms in self.registry.get_table_synonyms().items():
+            if table not in known:
+                logger.warning(f"同义词配置中的表不存在，已忽略: {table}")
+                continue
+            for synonym in synonyms:
+                add(synonym, table, SYNONYM_CONFIDENCE)
+
+        fillers = {_normalize(term): {} for term in GENERIC_TERMS}
+        for table in self.registry.get_ddl_tables():
+            for name, description in self.registry.get_table_ddl(table)["fields"].items():
+                for term in (name, *name.split("_")):
+                    fillers[_normalize(term)] = {}
+                match = _LEADING_PHRASE_RE.match(description)
+                if match:
+                    # 字段说明的首个短语及其首尾两个字，如 "创建时间"、"创建" 与 "时间"
+                    phrase = _normalize(match.group())
+                    for term in (phrase, phrase[:2], phrase[-2:]):
+                        fillers[term] = {}
+                # 字段说明中列出的英文取值，如 active/inactive
+                for word in re.findall(r"[A-Za-z][A-Za-z0-9_]+", description):
+                    fillers[_normalize(word)] = {}
+        fillers.pop("", None)
+
+        self._terms = self._index(entries)
+        self._fillers = self._index(fillers)
+        self._version = self.registry.version
+        logger.info(f"表识别词典已构建: {len(entries)} 个词条, {len(known)} 张表")
+
+    @staticmethod
+    def _index(entries: Dict[str, Dict[str, float]]) -> Dict[str, List[Tuple[str, Dict[str, float]]]]:
+        """按首字符分组，组内按词条长度降序"""
+        index: Dict[str, List[Tuple[str, Dict[str, float]]]] = {}
+        for term, tables in entries.items():
+            index.setdefault(term[0], []).append((term, tables))
+        for candidates in index.values():
+            candidates.sort(key=lambda item: len(item[0]), reverse=True)
+        return index
+
+    def _match_terms(
+        self,
+        text: str,
+        terms: Optional[Dict[str, List[Tuple[str, Dict[str, float]]]]] = None
+    ) -> Tuple[List[Tuple[str, Dict[str, float]]], str]:
+        """
+        从左到右最长匹配，返回 (命中的词条, 未命中的文本)，未命中的片段之间以空格分隔
+
+        英文词条要求前后不是字母或数字，避免 user 命中 username。
+        """
+        terms = self._terms if terms is None else terms
+        matches = []
+        uncovered = []
+        i = 0
+        while i < len(text):
+            matched = None
+            for term, tables in terms.get(text[i], ()):
+                if not text.startswith(term, i):
+                    continue
+                end = i + len(term)
+                if term.isascii() and (
+                    (i > 0 and text[i - 1].isascii() and text[i - 1].isalnum())
+                    or (end < len(text) and text[end].isascii() and text[end].isalnum())
+                ):
+                    continue
+                matched = (term, tables)
+                break
+            if matched:
+                matches.append(matched)
+                uncovered.append(" ")
+                i += len(matched[0])
+            else:
+                uncovered.append(text[i])
+                i += 1
+        return matches, "".join(uncovered)
+
+    def _uncovered_nouns(self, rest: str) -> List[str]:
+        """去掉通用用词与字段词后，剩余片段中的名词"""
+        rest = _LITERAL_RE.sub(" ", rest)
+        _, rest = self._match_terms(rest, self._fillers)
+        return _NOUN_SPAN_RE.findall(_PARTICLES_RE.sub(" ", rest))
+
+    def resolve(self, query: str) -> Dict[str, Any]:
+        """
+        识别问题涉及的表
+
+        返回 {"tables", "confidence", "matches", "uncovered"}。置信度取每张表最佳命中的最小值；
+        存在无法消歧的多义词条，或问题中还有词典未覆盖的名词（uncovered）时乘以惩罚系数；
+        没有命中任何词条时为 0。
+        """
+        if self._version != self.registry.version:
+            self._build()
+
+        matches, rest = self._match_terms(_normalize(query))
+        uncovered = self._uncovered_nouns(rest)
+        resolved: Dict[str, float] = {}
+        ambiguous: List[Dict[str, float]] = []
+        for _, tables in matches:
+            if len(tables) == 1:
+                table, confidence = next(iter(tables.items()))
+                resolved[table] = max(resolved.get(table, 0.0), confidence)
+            else:
+                ambiguous.append(tables)
+
+        confidence = min(resolved.values()) if resolved else 0.0
+        # 多义词条的候选表中已有被其他词条确定的表时视为已消歧
+        if any(not (set(tables) & set(resolved)) for tables in ambiguous):
+            confidence *= AMBIGUITY_PENALTY
+        # 未覆盖的名词可能是词典未收录的表，交给 LLM 识别
+        if uncovered:
+            confidence *= UNCOVERED_PENALTY
+
+        return {
+            "tables": sorted(resolved),
+            "confidence": confidence,
+            "matches": {term: sorted(tables) for term, tables in matches},
+            "uncovered": uncovered
+        }
+
+    def try_resolve(self, query: str) -> Optional[List[str]]:
+        """置信度达到阈值时返回识别出的表，否则返回 None 由调用方回退到 LLM"""
+        resolution = self.resolve(query)
+        fast_path = resolution["confidence"] >= self.threshold
+        self._stats["fast_path" if fast_path else "fallback"] += 1
+        record_table_resolution(resolution["confidence"], fast_path)
+        logger.info(
+            f"词典表识别: tables={resolution['tables']}, confidence={resolution['confidence']:.2f}, "
+            f"matches={resolution['matches']}, uncovered={resolution['uncovered']}, fast_path={fast_path}"
+        )
+        return resolution["tables"] if fast_path else None
+
+    def get_stats(self) -> Dict[str, Any]:
+        total = self._stats["fast_path"] + self._stats["fallback"]
+        return {
+            **self._stats,
+            "threshold": self.threshold,
+            "fast_path_ratio": self._stats["fast_path"] / total if total else 0.0
+        }
@@ -0,0 +1,150 @@
+import json
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.exc import DBAPIError
+from app import main
+from app.config import settings
+from app.services.cache_service import QueryResultCache
+from app.services.sql_generation import SQLGenerator
+
+RESULT = {
+    "sql": "SELECT id FROM users",
+    "description": "全部用户",
+    "entities": {"tables": ["users"], "fields": {"users": ["id"]}},
+    "constraints": {},
+    "token_usage": None,
+    "cached": False
+}
+
+class StubGenerator(SQLGenerator):
+    """不调用 LLM 的 SQL 生成器，批量接口沿用 SQLGenerator 的去重与并发逻辑"""
+
+    def __init__(self, fail=()):
+        super().__init__(None, None, None, None, None)
+        self.fail = fail
+        self.remembered = []
+
+    async def generate_sql(self, query):
+        if query in self.fail:
+            raise ValueError(f"failed: {query}")
+        return {**RESULT, "sql": f"SELECT '{query}'"}
+
+    async def generate_sql_stream(self, query):
+        for stage in ("tables", "fields", "constraints"):
+            yield {"event": stage, "data": RESULT["entities"].get(stage, {})}
+        for token in ('{"sql": ', '"SELECT 1"}'):
+            yield {"event": "token", "data": token}
+        yield {"event": "result", "data": RESULT}
+
+    def remember_example(self, query, result):
+        self.remembered.append(query)
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(main, "sql_generator", StubGenerator(fail=("失败",)))
+    monkeypatch.setattr(main, "cost_guard", None)
+    monkeypatch.setattr(main, "query_cache", None)
+    # 不进入 lifespan，避免连接数据库
+    return TestClient(main.app)
+
+def test_generate_sql_stream_event_order(client):
+    response = client.post("/generate-sql/stream", json={"text": "查询用户"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = [line.split(": ", 1)[1] for line in response.text.splitlines() if line.startswith("event: ")]
+    assert events == ["tables", "fields", "constraints", "token", "token", "result"]
+    result = json.loads(response.text.strip().splitlines()[-1].split(": ", 1)[1])
+    assert result["sql"] == RESULT["sql"]
+
+def test_batch_rejects_too_many_queries(client, monkeypatch):
+    monkeypatch.setattr(settings, "BATCH_MAX_ITEMS", 2)
+    response = client.post("/generate-sql/batch", json={"queries": [{"text": str(i)} for i in range(3)]})
+    assert response.status_code == 413
+    response = client.post("/generate-sql/batch", json={"queries": [{"text": "查询用户"}], "concurrency": 0})
+    assert response.status_code == 422
+
+def test_batch_results_in_order_and_as_ndjson(client):
+    queries = [{"text": "查询用户"}, {"text": "失败"}, {"text": "查询用户？"}]
+    response = client.post("/generate-sql/batch", json={"queries": queries})
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [item["index"] for item in results] == [0, 1, 2]
+    assert results[0]["sql"] == results[2]["sql"] == "SELECT '查询用户'"
+    assert results[1]["sql"] is None and "failed" in results[1]["error"]
+
+    response = client.post("/generate-sql/batch", json={"queries": queries, "stream": True})
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    items = [json.loads(line) for line in response.text.splitlines()]
+    assert sorted(item["index"] for item in items) == [0, 1, 2]
+    assert {item["index"]: item.get("error") is not None for item in items} == {0: False, 1: True, 2: False}
+
+class StatementTimeout(Exception):
+    sqlstate = "57014"
+
+def statement_timeout():
+    return DBAPIError("SELECT pg_sleep(10)", {}, StatementTimeout("canceling statement due to statement timeout"))
+
+def fake_stream(batches, error=None):
+    async def stream_readonly(sql, timeout_ms=None, batch_size=1000):
+        for batch in batches:
+            yield ["id"], batch
+        if error is not None:
+            raise error
+    return stream_readonly
+
+def read_ndjson(response):
+    return [json.loads(line) for line in response.text.splitlines()]
+
+def test_execute_stream_truncates_at_max_rows(client, monkeypatch):
+    monkeypatch.setattr(main, "stream_readonly", fake_stream([[(1,), (2,)], [(3,), (4,)]]))
+    monkeypatch.setattr(settings, "SQL_STREAM_MAX_ROWS", 3)
+    lines = read_ndjson(client.post("/execute-sql/stream", json={"text": "查询用户"}))
+    assert lines[0]["type"] == "columns" and lines[0]["columns"] == ["id"]
+    assert lines[1:4] == [[1], [2], [3]]
+    assert lines[-1] == {"type": "end", "rows": 3, "bytes": 12, "truncated": "max_rows"}
+
+def test_execute_stream_truncates_at_max_bytes(client, monkeypatch):
+    monkeypatch.setattr(main, "stream_readonly", fake_stream([[(1,), (2,), (3,)]]))
+    # 每行 "[n]\n" 为 4 字节
+    monkeypatch.setattr(settings, "SQL_STREAM_MAX_BYTES", 9)
+    lines = read_ndjson(client.post("/execute-sql/stream", json={"text": "查询用户"}))
+    assert lines[-1] == {"type": "end", "rows": 2, "bytes": 8, "truncated": "max_bytes"}
+
+def test_execute_stream_reports_statement_timeout(client, monkeypatch):
+    monkeypatch.setattr(main, "stream_readonly", fake_stream([[(1,)]], error=statement_timeout()))
+    response = client.post("/execute-sql/stream", json={"text": "查询用户"})
+    # 结果已开始返回，超时以 error 行告知
+    assert response.status_code == 200
+    assert read_ndjson(response)[-1] == {"type": "error", "detail": "SQL执行超时", "rows": 1}
+    assert main.sql_generator.remembered == []
+
+def test_statement_timeout_maps_to_504(client, monkeypatch):
+    async def execute_readonly_tracked(sql, tables, timeout_ms=None, schema="public"):
+        raise statement_timeout()
+
+    async def generate_sql(query):
+        return dict(RESULT)
+
+    # SQL 引用了 users 表，启用结果缓存时走 execute_readonly_tracked
+    monkeypatch.setattr(main.sql_generator, "generate_sql", generate_sql)
+    monkeypatch.setattr(main, "query_cache", QueryResultCache(max_bytes=10_000))
+    monkeypatch.setattr(main, "execute_readonly_tracked", execute_readonly_tracked)
+    response = client.post("/execute-sql", json={"text": "查询用户"})
+    assert response.status_code == 504
+    assert response.json()["detail"] == "SQL执行超时"
+    assert main.sql_generator.remembered == []
+
+    # 流式接口在开始返回前（代价检查阶段）超时同样返回 504
+    class TimeoutGuard:
+        async def check(self, sql, timeout_ms):
+            raise statement_timeout()
+
+    monkeypatch.setattr(main, "cost_guard", TimeoutGuard())
+    assert client.post("/execute-sql/stream", json={"text": "查询用户"}).status_code == 504
+
+def test_other_database_errors_map_to_500(client, monkeypatch):
+    async def execute_readonly(sql, timeout_ms=None):
+        raise DBAPIError("SELECT 1", {}, Exception("relation does not exist"))
+
+    monkeypatch.setattr(main, "execute_readonly", execute_readonly)
+    assert client.post("/execute-sql", json={"text": "查询用户"}).status_code == 500
@@ -0,0 +1,93 @@
+import time
+from app.services.cache_service import LRUCache, ResultCache, PromptMemo, QueryResultCache
+from app.utils.helpers import normalize_query
+
+def test_normalize_query():
+    assert normalize_query("  查询所有用户，的 邮箱？ ") == normalize_query("查询所有用户的 邮箱")
+    assert normalize_query("List ALL  users!") == "list all users"
+    assert normalize_query("ＡＢＣ") == "abc"
+    assert normalize_query("查询 所有用户") == normalize_query("查询所有用户")
+    assert normalize_query("查询 users 表") == "查询 users 表"
+    # 数字中的小数点、负号与时间分隔符不能去掉
+    assert normalize_query("价格大于3.5的商品") != normalize_query("价格大于35的商品")
+    assert normalize_query("低于-5度") != normalize_query("低于5度")
+    assert normalize_query("10:30之后的订单") != normalize_query("1030之后的订单")
+    assert normalize_query("价格大于3.5的商品。") == "价格大于3.5的商品"
+
+def test_lru_eviction_and_ttl():
+    cache = LRUCache(max_entries=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.evictions == 1
+
+    cache.set("d", 4, ttl=0.01)
+    time.sleep(0.02)
+    assert cache.get("d") is None
+    stats = cache.get_stats()
+    assert stats["hits"] == 2
+    assert stats["misses"] == 2
+
+def test_result_cache_persists_to_disk(tmp_path):
+    file_path = str(tmp_path / "result_cache.json")
+    cache = ResultCache(max_entries=10, ttl=60, file_path=file_path)
+    key = ResultCache.make_key(normalize_query("查询用户"), "v1")
+    cache.set(key, {"sql": "SELECT 1"})
+    cache.get(key)["sql"] = "mutated"
+    cache.save()
+
+    reloaded = ResultCache(max_entries=10, ttl=60, file_path=file_path)
+    assert reloaded.get(key) == {"sql": "SELECT 1"}
+
+    # 另一个工作进程保存时合并磁盘上已有的条目，而不是覆盖
+    other = ResultCache(max_entries=10, ttl=60, file_path=str(tmp_path / "missing.json"))
+    other.file_path = file_path
+    other.set("v1:其他问题", {"sql": "SELECT 2"})
+    other.save()
+    reloaded = ResultCache(max_entries=10, ttl=60, file_path=file_path)
+    assert reloaded.get(key) == {"sql": "SELECT 1"}
+    assert reloaded.get("v1:其他问题") == {"sql": "SELECT 2"}
+    assert [p.name for p in tmp_path.iterdir() if p.name.endswith(".tmp")] == []
+
+def test_prompt_memo_byte_budget_and_stage_ttl():
+    memo = PromptMemo(max_bytes=200, ttl=60, stage_ttls={"sql": 0})
+    assert not memo.stage_enabled("sql")
+    assert memo.stage_enabled("table")
+
+    key_a = PromptMemo.make_key("model", "prompt a")
+    key_b = PromptMemo.make_key("model", "prompt b")
+    assert key_a != PromptMemo.make_key("other-model", "prompt a")
+    memo.set(key_a, "x" * 100, stage="table")
+    memo.set(key_b, "y" * 100, stage="table")
+    assert memo.get(key_a) is None
+    assert memo.get(key_b) == "y" * 100
+    assert memo.size_bytes <= 200
+
+def test_query_result_cache_invalidates_changed_tables():
+    cache = QueryResultCache(max_bytes=10_000, ttl=60)
+    key_users = QueryResultCache.make_key("SELECT *  FROM users;")
+    assert key_users == QueryResultCache.make_key("SELECT * FROM users")
+    key_orders = QueryResultCache.make_key("SELECT * FROM orders JOIN users ON true")
+    cache.put(key_users, "SELECT * FROM users", [{"id": 1}], {"users": 10})
+    cache.put(key_orders, "SELECT * FROM orders JOIN users ON true", [{"id": 2}], {"orders": 5, "users": 10})
+    assert cache.get(key_users)["age"] >= 0
+    assert sorted(cache.tracked_tables()) == ["orders", "users"]
+
+    assert cache.invalidate_changed({"users": 10, "orders": 6}) == 1
+    assert cache.get(key_orders) is None
+    assert cache.get(key_users)["results"] == [{"id": 1}]
+    assert cache.tracked_tables() == ["users"]
+
+    # 表在统计视图中消失（被删除）时同样失效
+    assert cache.invalidate_changed({}) == 1
+    assert cache.size_bytes == 0
+
+def test_query_result_cache_skips_untrackable_queries():
+    cache = QueryResultCache(max_bytes=10_000, ttl=60)
+    assert not cache.put("now", "SELECT now()", [{"now": 1}], {})
+    assert not cache.put("view", "SELECT * FROM v_sales", [{"id": 1}], {"v_sales": None, "orders": 3})
+    assert cache.get("now") is None and cache.get("view") is None
+    assert cache.tracked_tables() == []
@@ -0,0 +1,57 @@
+import pytest
+from app.services.cache_service import LRUCache
+from app.services.cost_guard import QueryCostGuard, QueryRejectedError
+from app.utils.helpers import normalize_sql
+
+class FakeExplain:
+    """按SQL是否被包上 LIMIT 返回不同的估算计划"""
+
+    def __init__(self, rows: float, cost: float, limited_cost: float = 10.0):
+        self.rows = rows
+        self.cost = cost
+        self.limited_cost = limited_cost
+        self.calls = []
+
+    async def __call__(self, sql, timeout_ms=None):
+        self.calls.append(sql)
+        if "AS limited_query LIMIT" in sql:
+            return {"Node Type": "Limit", "Total Cost": self.limited_cost, "Plan Rows": 100}
+        return {"Node Type": "Seq Scan", "Total Cost": self.cost, "Plan Rows": self.rows}
+
+def make_guard(explain, **kwargs):
+    options = dict(max_cost=1000, max_rows=500, limit_rows=100, cache=LRUCache(16))
+    options.update(kwargs)
+    return QueryCostGuard(explain, **options)
+
+def test_normalize_sql():
+    assert normalize_sql("SELECT  *\n FROM t -- note\n WHERE a = 'x  y';") == "SELECT * FROM t WHERE a = 'x  y'"
+
+@pytest.mark.asyncio
+async def test_allow_and_cache_by_normalized_sql():
+    explain = FakeExplain(rows=10, cost=50)
+    guard = make_guard(explain)
+    verdict = await guard.check("SELECT * FROM users")
+    assert verdict["action"] == "allow"
+    assert verdict["estimate"]["total_cost"] == 50
+    await guard.check("SELECT *\n  FROM users -- 重复查询\n;")
+    assert len(explain.calls) == 1
+
+@pytest.mark.asyncio
+async def test_auto_limit_large_result():
+    guard = make_guard(FakeExplain(rows=1_000_000, cost=500_000))
+    verdict = await guard.check("SELECT * FROM events ORDER BY id")
+    assert verdict["action"] == "limit"
+    assert verdict["sql"] == "SELECT * FROM (SELECT * FROM events ORDER BY id) AS limited_query LIMIT 100"
+    assert verdict["original_estimate"]["plan_rows"] == 1_000_000
+
+@pytest.mark.asyncio
+async def test_reject_returns_estimate():
+    guard = make_guard(FakeExplain(rows=10, cost=5_000_000))
+    with pytest.raises(QueryRejectedError) as exc:
+        await guard.check("SELECT count(*) FROM a, b")
+    assert exc.value.verdict["estimate"]["total_cost"] == 5_000_000
+
+    guard = make_guard(FakeExplain(rows=1_000_000, cost=50), auto_limit=False)
+    with pytest.raises(QueryRejectedError) as exc:
+        await guard.check("SELECT * FROM events")
+    assert exc.value.verdict["estimate"]["plan_rows"] == 1_000_000
@@ -0,0 +1,72 @@
+import asyncio
+import pytest
+from prometheus_client import REGISTRY
+from app.database.example_store import ExampleStore
+
+class FakeVectorStore:
+    """按问题完全匹配返回相似度 1.0，其余示例使用预设相似度"""
+
+    def __init__(self, similarity=0.8):
+        self.similarity = similarity
+        self.records = {}
+        self.upserts = 0
+
+    async def get_or_create_collection(self, name, metadata=None):
+        return name
+
+    async def upsert_documents(self, collection_name, documents, metadatas, ids):
+        self.upserts += 1
+        for doc_id, metadata in zip(ids, metadatas):
+            self.records[doc_id] = metadata
+
+    async def query_similar(self, collection_name, query_text, n_results=3):
+        metadatas = list(self.records.values())[:n_results]
+        distances = [0.0 if m["question"] == query_text else 1.0 - self.similarity for m in metadatas]
+        return {"ids": [list(self.records)[:n_results]], "metadatas": [metadatas], "distances": [distances]}
+
+async def _store_with(vector_store, *examples):
+    store = ExampleStore(vector_store, reuse_similarity=0.97, min_similarity=0.6)
+    await store.start()
+    for question, sql in examples:
+        store.add(question, sql, None, ["orders"], "v1")
+    await store.stop()
+    return store
+
+@pytest.mark.asyncio
+async def test_examples_are_ingested_in_background_batches():
+    vector_store = FakeVectorStore()
+    store = ExampleStore(vector_store, batch_size=32)
+    await store.start()
+    assert store.add("最近7天的订单数", "SELECT 1", None, ["orders"], "v1")
+    assert store.add("最近30天的订单数", "SELECT 2", None, ["orders"], "v1")
+    # 同一问题与SQL近期已写入，不再入队
+    assert not store.add("最近7天的订单数", "SELECT 1", None, ["orders"], "v1")
+    await asyncio.sleep(0.01)
+    assert len(vector_store.records) == 2
+    assert vector_store.upserts == 1
+    await store.stop()
+
+@pytest.mark.asyncio
+async def test_lookup_reuses_only_identical_numbers_and_schema_version():
+    store = await _store_with(FakeVectorStore(similarity=0.99), ("最近7天的订单数", "SELECT 7"))
+    reused = REGISTRY.get_sample_value("nl2sql_example_lookups_total", {"result": "reuse"}) or 0.0
+
+    example, shots = await store.lookup("最近7天的订单数", "v1")
+    assert example["sql"] == "SELECT 7" and shots == []
+    assert REGISTRY.get_sample_value("nl2sql_example_lookups_total", {"result": "reuse"}) == reused + 1
+
+    # 相似度达到阈值但数字不同，只作为 few-shot
+    example, shots = await store.lookup("最近30天的订单数", "v1")
+    assert example is None and [s["sql"] for s in shots] == ["SELECT 7"]
+
+    # schema 版本变化后不再直接复用
+    example, shots = await store.lookup("最近7天的订单数", "v2")
+    assert example is None and len(shots) == 1
+    assert store.get_stats()["reuse"] == 1
+
+@pytest.mark.asyncio
+async def test_dissimilar_examples_are_not_used():
+    store = await _store_with(FakeVectorStore(similarity=0.3), ("各地区销售额", "SELECT 1"))
+    example, shots = await store.lookup("最近7天的订单数", "v1")
+    assert example is None and shots == []
+    assert store.get_stats()["miss"] == 1
@@ -0,0 +1,92 @@
+import asyncio
+import pytest
+from prometheus_client import REGISTRY
+from app.config import _parse_stage_routes
+from app.services.llm_backends import LLMBackend, CircuitBreaker
+from app.services.llm_service import LLMService
+
+class FakeBackend(LLMBackend):
+    def __init__(self, name, delay=0.0, fail=False):
+        super().__init__(name, f"{name}-model", max_concurrency=4)
+        self.delay = delay
+        self.fail = fail
+        self.calls = 0
+        self.cancelled = 0
+
+    async def complete(self, prompt, connect_timeout=None, read_timeout=None):
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if self.fail:
+            raise Exception(f"{self.name} failed")
+        return f'{{"sql": "select 1", "description": "{self.name}"}}', {}
+
+    async def stream(self, prompt, connect_timeout=None, read_timeout=None):
+        text, stats = await self.complete(prompt, connect_timeout, read_timeout)
+        yield text, stats
+
+def make_service(backends, routes=None):
+    service = LLMService(backends={b.name: b for b in backends}, routes=routes)
+    service.hedge_min_samples = 1
+    service.hedge_min_delay = 0.01
+    return service
+
+def test_circuit_breaker_opens_and_recovers():
+    breaker = CircuitBreaker("test", failure_threshold=2, recovery_time=0.0, slow_call_threshold=1.0)
+    breaker.record(False)
+    assert breaker.state == "closed"
+    breaker.record(True, elapsed=5.0)  # 慢调用计为失败
+    assert breaker.state == "open"
+
+    assert breaker.allow()  # 恢复时间已过，放行一个探测请求
+    assert breaker.state == "half_open"
+    assert not breaker.allow()
+    breaker.record(True, elapsed=0.1)
+    assert breaker.state == "closed"
+
+@pytest.mark.asyncio
+async def test_hedged_request_wins_over_slow_primary():
+    primary, secondary = FakeBackend("primary", delay=0.01), FakeBackend("secondary", delay=0.01)
+    service = make_service([primary, secondary], {"default": ["primary", "secondary"]})
+    await service._call_api("q", stage="sql")  # 记录主后端耗时样本
+
+    primary.delay = 1.0
+    response = await service._call_api("q", stage="sql")
+    assert '"secondary"' in response
+    await asyncio.sleep(0)  # 让被取消的主请求处理取消
+    assert primary.cancelled == 1
+    assert service.breakers["primary"].state == "closed"
+
+@pytest.mark.asyncio
+async def test_failover_and_open_circuit_skips_backend():
+    primary, secondary = FakeBackend("primary", fail=True), FakeBackend("secondary")
+    service = make_service([primary, secondary], {"default": ["primary", "secondary"]})
+    service.breakers["primary"].failure_threshold = 1
+
+    def sample(name, **labels):
+        return REGISTRY.get_sample_value(name, labels) or 0.0
+
+    failovers = sample("nl2sql_llm_failovers_total", backend="secondary", stage="failover_test")
+    assert '"secondary"' in await service._call_api("q", stage="failover_test")
+    assert service.breakers["primary"].state == "open"
+    # 顺序故障转移单独计数，不计为对冲
+    assert sample("nl2sql_llm_failovers_total", backend="secondary", stage="failover_test") == failovers + 1
+    assert sample("nl2sql_llm_hedged_requests_total", stage="failover_test", winner="hedge") == 0.0
+    assert sample("nl2sql_llm_hedged_requests_total", stage="failover_test", winner="none") == 0.0
+    await service._call_api("q", stage="table")
+    assert primary.calls == 1
+
+def test_stage_routes_ignore_unknown_backends():
+    service = make_service(
+        [FakeBackend("ollama"), FakeBackend("openai")],
+        {"default": ["ollama"], "sql": ["openai", "missing", "ollama"]}
+    )
+    assert service._route("sql") == ["openai", "ollama"]
+    assert service._route("table") == ["ollama"]
+
+def test_stage_routes_accept_bare_default_entry():
+    assert _parse_stage_routes("ollama") == {"default": ["ollama"]}
+    assert _parse_stage_routes("openai>ollama,sql:openai,bad:") == {"default": ["openai", "ollama"], "sql": ["openai"]}
@@ -0,0 +1,40 @@
+import json
+import logging
+import queue
+import sys
+from app.config import settings
+from app.utils.logging_setup import JsonFormatter, _BackgroundQueueHandler, log_payload
+
+def make_record(msg, *args, exc_info=None, **extra):
+    record = logging.LogRecord("test", logging.INFO, "test.py", 1, msg, args, exc_info)
+    record.__dict__.update(extra)
+    return record
+
+def test_json_formatter_writes_single_line_with_extra_fields():
+    line = JsonFormatter().format(make_record("识别到的表: %s", ["users"], payload={"prompt": "多行\n提示词"}))
+    assert "\n" not in line
+    data = json.loads(line)
+    assert data["msg"] == "识别到的表: ['users']"
+    assert data["payload"] == {"prompt": "多行\n提示词"}
+
+def test_queue_handler_renders_exception_in_caller_thread():
+    log_queue = queue.Queue(maxsize=1)
+    handler = _BackgroundQueueHandler(log_queue)
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        handler.emit(make_record("失败 %d", 1, exc_info=sys.exc_info()))
+    handler.emit(make_record("队列已满时丢弃"))
+
+    record = log_queue.get_nowait()
+    assert record.msg == "失败 1" and record.args is None and record.exc_info is None
+    assert "ValueError: boom" in json.loads(JsonFormatter().format(record))["exc"]
+    assert log_queue.empty()
+
+def test_payload_is_sampled_unless_error(monkeypatch, caplog):
+    logger = logging.getLogger("test_payload")
+    monkeypatch.setattr(settings, "LOG_PAYLOAD_SAMPLE_RATE", 0.0)
+    with caplog.at_level(logging.INFO, logger="test_payload"):
+        assert not log_payload(logger, "提示词", prompt="p")
+        assert log_payload(logger, "失败的提示词", error=True, prompt="p")
+    assert [r.payload for r in caplog.records] == [{"prompt": "p"}]
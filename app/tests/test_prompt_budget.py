@@ -0,0 +1,64 @@
+import pytest
+from app.config import settings
+from app.database.resource_registry import ResourceRegistry
+from app.database.schema_store import SchemaStore, parse_create_table
+from app.utils.tokenizer import count_tokens
+
+EXTRA_COLUMNS = [f"attr_{i}" for i in range(60)]
+
+DDL = "# Orders 表结构\n\n```sql\nCREATE TABLE orders (\n" + ",\n".join(
+    ["    id SERIAL PRIMARY KEY",
+     "    user_id INTEGER REFERENCES users(id)",
+     "    total_amount NUMERIC(10, 2) NOT NULL",
+     "    status VARCHAR(20) DEFAULT 'pending'"]
+    + [f"    {name} VARCHAR(255)" for name in EXTRA_COLUMNS]
+    + ["    CONSTRAINT orders_amount_check CHECK (total_amount > 0)"]
+) + "\n);\n```\n\n## 字段说明\n- id: 订单唯一标识\n- total_amount: 订单金额\n- status: 订单状态\n\n## 业务规则\n1. 订单金额必须大于0\n"
+
+@pytest.fixture
+def schema_store(tmp_path):
+    (tmp_path / "resources" / "prompts").mkdir(parents=True)
+    (tmp_path / "resources" / "schemas" / "ddl").mkdir(parents=True)
+    (tmp_path / "resources" / "schemas" / "descriptions").mkdir(parents=True)
+    (tmp_path / "config").mkdir()
+    (tmp_path / "resources" / "schemas" / "ddl" / "orders.md").write_text(DDL, encoding="utf-8")
+    registry = ResourceRegistry(tmp_path / "resources", str(tmp_path / "config"))
+    return SchemaStore(None, registry)
+
+def test_count_tokens():
+    assert count_tokens("") == 0
+    assert count_tokens("查询用户") == 4
+    assert count_tokens("select id") == 3
+
+def test_parse_create_table_keeps_inner_commas():
+    parsed = parse_create_table("CREATE TABLE t (\n  a NUMERIC(10, 2),\n  b INT,\n  PRIMARY KEY (a, b)\n);")
+    assert [name for name, _ in parsed["columns"]] == ["a", "b"]
+    assert parsed["constraints"] == ["PRIMARY KEY (a, b)"]
+
+@pytest.mark.asyncio
+async def test_keep_fields_prunes_to_identified_and_key_columns(schema_store, monkeypatch):
+    monkeypatch.setattr(settings, "PROMPT_TOKEN_BUDGET", 4096)
+    text, stats = await schema_store.get_budgeted_tables_schema(
+        ["orders"], keep_fields={"orders": ["total_amount"]}, sql_only=True
+    )
+    assert "total_amount NUMERIC(10, 2)" in text
+    assert "user_id INTEGER REFERENCES" in text
+    assert "CHECK (total_amount > 0)" in text
+    assert "attr_0 VARCHAR" not in text
+    assert "省略 61 个字段" in text
+    assert stats["omitted_columns"] == 61
+    assert stats["schema_tokens"] == count_tokens(text)
+
+@pytest.mark.asyncio
+async def test_budget_ranks_columns_by_query(schema_store, monkeypatch):
+    monkeypatch.setattr(settings, "PROMPT_TOKEN_BUDGET", 160)
+    text, stats = await schema_store.get_budgeted_tables_schema(["orders"], query="统计订单金额")
+    assert "total_amount NUMERIC" in text
+    assert "- total_amount: 订单金额" in text
+    assert stats["omitted_columns"] > 0
+    assert stats["schema_tokens"] <= 160
+
+    monkeypatch.setattr(settings, "PROMPT_TOKEN_BUDGET", 0)
+    full, stats = await schema_store.get_budgeted_tables_schema(["orders"], query="统计订单金额")
+    assert full == DDL
+    assert stats["omitted_columns"] == 0
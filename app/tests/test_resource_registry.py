@@ -0,0 +1,58 @@
+import os
+import pytest
+from app.database.resource_registry import ResourceRegistry
+
+DDL = """# Orders 表结构
+
+```sql
+CREATE TABLE orders (
+    id SERIAL PRIMARY KEY
+);
+```
+
+## 字段说明
+- id: 订单唯一标识
+
+## 业务规则
+1. 订单金额必须大于0
+"""
+
+@pytest.fixture
+def resources(tmp_path):
+    (tmp_path / "resources" / "prompts").mkdir(parents=True)
+    (tmp_path / "resources" / "schemas" / "ddl").mkdir(parents=True)
+    (tmp_path / "resources" / "schemas" / "descriptions").mkdir(parents=True)
+    (tmp_path / "config").mkdir()
+    (tmp_path / "resources" / "prompts" / "table_extraction.md").write_text("v1 {user_query}", encoding="utf-8")
+    (tmp_path / "resources" / "schemas" / "ddl" / "orders.md").write_text(DDL, encoding="utf-8")
+    (tmp_path / "resources" / "schemas" / "descriptions" / "orders.md").write_text(
+        "## orders 表\n\n订单表 orders，存储订单信息。\n", encoding="utf-8"
+    )
+    (tmp_path / "config" / "business_rules.json").write_text('{"order": ["规则"]}', encoding="utf-8")
+    return tmp_path
+
+def test_registry_parses_resources(resources):
+    registry = ResourceRegistry(resources / "resources", str(resources / "config"))
+    ddl = registry.get_table_ddl("orders")
+    assert ddl["sql"].startswith("CREATE TABLE orders")
+    assert ddl["fields"] == {"id": "订单唯一标识"}
+    assert ddl["rules"] == ["orders: 订单金额必须大于0"]
+    assert registry.get_table_descriptions()["orders"]["summary"] == "订单表 orders，存储订单信息。"
+    assert registry.get_business_rules_config() == {"order": ["规则"]}
+    assert registry.get_table_ddl("missing") is None
+
+@pytest.mark.asyncio
+async def test_registry_reloads_on_change(resources):
+    registry = ResourceRegistry(resources / "resources", str(resources / "config"))
+    version = registry.version
+    reloaded = []
+    registry.add_listener(lambda r: reloaded.append(r.version))
+    assert not await registry.reload_if_changed()
+
+    template = resources / "resources" / "prompts" / "table_extraction.md"
+    template.write_text("v2 {user_query}", encoding="utf-8")
+    os.utime(template, ns=(0, 1))
+    assert await registry.reload_if_changed()
+    assert registry.get_prompt("table_extraction") == "v2 {user_query}"
+    assert registry.version != version
+    assert reloaded == [registry.version]
@@ -0,0 +1,54 @@
+import contextlib
+from types import SimpleNamespace
+import pytest
+from app.database.schema_catalog import SchemaCatalog, SIGNATURE_SQL
+
+class FakeDatabase:
+    """模拟目录查询：signatures 为 表 -> 签名，columns 为 表 -> 字段名列表"""
+
+    def __init__(self, signatures, columns):
+        self.signatures = signatures
+        self.columns = columns
+        self.fetches = []
+
+    async def execute(self, statement, params):
+        if str(statement) == SIGNATURE_SQL:
+            return [SimpleNamespace(table_name=t, signature=s) for t, s in self.signatures.items()]
+        tables = list(self.columns) if params["load_all"] else params["tables"]
+        self.fetches.append(None if params["load_all"] else sorted(tables))
+        return [
+            SimpleNamespace(
+                table_name=table,
+                table_comment=f"{table} 表",
+                column_name=column,
+                data_type="integer",
+                column_comment=None
+            )
+            for table in tables if table in self.columns
+            for column in self.columns[table]
+        ]
+
+    @contextlib.asynccontextmanager
+    async def connect(self):
+        yield self
+
+@pytest.mark.asyncio
+async def test_refresh_reloads_only_changed_tables_and_drops_removed():
+    db = FakeDatabase({"users": "1:1:0", "orders": "2:2:0"}, {"users": ["id"], "orders": ["id"]})
+    catalog = SchemaCatalog(db)
+    await catalog.load()
+    assert db.fetches == [None]
+    assert sorted(catalog.tables) == ["orders", "users"]
+
+    # 签名未变化时不重新查询表结构
+    assert await catalog.refresh() is False
+    assert db.fetches == [None]
+
+    # users 加了字段、orders 被删除、新增 payments
+    db.signatures = {"users": "1:5:0", "payments": "7:7:0"}
+    db.columns = {"users": ["id", "email"], "payments": ["id"]}
+    assert await catalog.refresh() is True
+    assert db.fetches[-1] == ["payments", "users"]
+    assert sorted(catalog.tables) == ["payments", "users"]
+    assert [c["name"] for c in catalog.tables["users"]["columns"]] == ["id", "email"]
+    assert catalog.tables["users"]["columns"][1]["description"] == ""
@@ -0,0 +1,48 @@
+from app.database.schema_index import SchemaTokenIndex, tokenize
+
+TABLES = {
+    "users": {
+        "name": "users",
+        "description": "用户信息表",
+        "columns": [
+            {"name": "id", "type": "integer", "description": "用户唯一标识"},
+            {"name": "email", "type": "varchar(255)", "description": "邮箱地址"},
+            {"name": "created_at", "type": "timestamp", "description": "注册时间"},
+        ]
+    },
+    "orders": {
+        "name": "orders",
+        "description": "订单表",
+        "columns": [
+            {"name": "id", "type": "integer", "description": "订单唯一标识"},
+            {"name": "user_id", "type": "integer", "description": "下单用户"},
+            {"name": "total_amount", "type": "numeric", "description": "订单金额"},
+        ]
+    },
+}
+
+def test_tokenize_identifiers_and_cjk():
+    assert tokenize("user_id") == ["user", "id"]
+    assert "user" in tokenize("Users")
+    assert tokenize("用户邮箱") == ["用户", "户邮", "邮箱"]
+    assert tokenize("查") == ["查"]
+
+def test_search_chinese_question():
+    index = SchemaTokenIndex()
+    index.build(TABLES)
+
+    tables = index.search_tables("查询所有用户的邮箱")
+    assert tables[0][0]["name"] == "users"
+
+    fields = index.search_fields("查询所有用户的邮箱", ["users"])
+    assert fields[0][0]["name"] == "email"
+    assert all(field["table"] == "users" for field, _ in fields)
+
+def test_search_with_entities_and_rebuild():
+    index = SchemaTokenIndex()
+    index.build(TABLES)
+    assert [t["name"] for t, _ in index.search_tables("统计金额", ["orders"])] == ["orders"]
+
+    index.build({"orders": TABLES["orders"]})
+    assert index.search_tables("用户邮箱") == []
+    assert index.search_fields("金额", ["users", "orders"])[0][0]["name"] == "total_amount"
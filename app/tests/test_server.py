@@ -0,0 +1,36 @@
+import os
+import time
+from app.server import PreforkServer
+from app.utils.helpers import process_memory
+
+def fork_exiting_child(code: int) -> int:
+    pid = os.fork()
+    if pid == 0:
+        os._exit(code)
+    return pid
+
+def reap_until(server, condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        server._reap()
+        time.sleep(0.01)
+
+def test_reap_restarts_crashed_worker_but_not_retiring_one(monkeypatch):
+    server = PreforkServer(2, "127.0.0.1", 0)
+    spawned = []
+    monkeypatch.setattr(server, "spawn", spawned.append)
+
+    crashed, retired = fork_exiting_child(1), fork_exiting_child(0)
+    server.children[crashed] = 0
+    server.retiring.add(retired)
+    reap_until(server, lambda: not server.children and not server.retiring)
+
+    assert spawned == [0]
+    assert not server.retiring
+
+def test_process_memory_reports_private_and_shared():
+    memory = process_memory()
+    if memory is None:  # 非 Linux
+        return
+    assert memory["rss_mb"] > 0
+    assert memory["private_mb"] + memory["shared_mb"] >= memory["rss_mb"] - 1
@@ -0,0 +1,88 @@
+import asyncio
+import pytest
+from app.utils.singleflight import SingleFlight
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight()
+    calls = 0
+
+    async def work():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return "result"
+
+    results = await asyncio.gather(*(flight.do("key", work) for _ in range(5)))
+    assert results == ["result"] * 5
+    assert calls == 1
+    assert len(flight) == 0
+
+@pytest.mark.asyncio
+async def test_error_is_delivered_to_all_waiters():
+    flight = SingleFlight()
+
+    async def work():
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    results = await asyncio.gather(*(flight.do("key", work) for _ in range(3)), return_exceptions=True)
+    assert all(isinstance(r, ValueError) for r in results)
+
+@pytest.mark.asyncio
+async def test_cancelling_one_waiter_keeps_shared_work_running():
+    flight = SingleFlight()
+    started = asyncio.Event()
+
+    async def work():
+        started.set()
+        await asyncio.sleep(0.05)
+        return "done"
+
+    first = asyncio.create_task(flight.do("key", work))
+    second = asyncio.create_task(flight.do("key", work))
+    await started.wait()
+    first.cancel()
+    assert await second == "done"
+    with pytest.raises(asyncio.CancelledError):
+        await first
+
+@pytest.mark.asyncio
+async def test_cancelling_all_waiters_cancels_shared_work():
+    flight = SingleFlight()
+    cancelled = asyncio.Event()
+
+    async def work():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    waiters = [asyncio.create_task(flight.do("key", work)) for _ in range(2)]
+    await asyncio.sleep(0.01)
+    for waiter in waiters:
+        waiter.cancel()
+    await asyncio.gather(*waiters, return_exceptions=True)
+    await asyncio.wait_for(cancelled.wait(), 1)
+    assert len(flight) == 0
+
+@pytest.mark.asyncio
+async def test_call_after_sole_waiter_cancels_starts_new_work():
+    flight = SingleFlight()
+    calls = 0
+
+    async def work():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return calls
+
+    waiter = asyncio.create_task(flight.do("key", work))
+    await asyncio.sleep(0)
+    waiter.cancel()
+    # 让等待者处理取消并取消共享任务，此时共享任务尚未结束
+    await asyncio.sleep(0)
+    assert waiter.done()
+    # 新的调用不能加入正在取消的任务
+    assert await flight.do("key", work) == 2
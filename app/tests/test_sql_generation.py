@@ -0,0 +1,97 @@
+import asyncio
+import pytest
+from pydantic import ValidationError
+from app.database.postgresql import engine
+from app.database.resource_registry import ResourceRegistry
+from app.database.schema_store import SchemaStore
+from app.models.request import BatchQueryRequest
+from app.services.constraint_service import ConstraintService
+from app.services.entity_service import EntityService
+from app.services.prompt_service import PromptService
+from app.services.sql_generation import SQLGenerator
+
+def make_batch_generator(fail=()):
+    generator = SQLGenerator(None, None, None, None, None)
+    calls = []
+
+    async def generate_sql(query):
+        calls.append(query)
+        # 后提交的问题先完成，结果按完成顺序产出
+        await asyncio.sleep(0.02 if query.startswith("慢") else 0)
+        if query in fail:
+            raise ValueError(f"failed: {query}")
+        return {"sql": f"SELECT '{query}'"}
+
+    generator.generate_sql = generate_sql
+    return generator, calls
+
+@pytest.mark.asyncio
+async def test_batch_deduplicates_and_reports_errors_per_item():
+    generator, calls = make_batch_generator(fail=("失败",))
+    queries = ["慢查询", "查询用户", "查询用户？", "失败"]
+    items = [item async for item in generator.generate_sql_batch(queries, concurrency=4)]
+
+    # 规范化后相同的问题只执行一次
+    assert sorted(calls) == ["失败", "慢查询", "查询用户"]
+    assert [index for index, _, _ in items][-1] == 0
+    by_index = {index: (result, error) for index, result, error in items}
+    assert sorted(by_index) == [0, 1, 2, 3]
+    assert by_index[1][0] == by_index[2][0] == {"sql": "SELECT '查询用户'"}
+    # 重复项得到各自的结果副本
+    assert by_index[1][0] is not by_index[2][0]
+    assert by_index[0][0] == {"sql": "SELECT '慢查询'"}
+    result, error = by_index[3]
+    assert result is None and isinstance(error, ValueError)
+
+def test_batch_concurrency_must_be_positive():
+    with pytest.raises(ValidationError):
+        BatchQueryRequest(queries=[{"text": "查询用户"}], concurrency=-1)
+    with pytest.raises(ValidationError):
+        BatchQueryRequest(queries=[{"text": "查询用户"}], concurrency=0)
+
+class FakeLLM:
+    """按阶段返回固定响应的 LLM，记录每次调用的阶段"""
+
+    RESPONSES = {
+        "table": '["users"]',
+        "field": '{"users": ["username", "email"]}',
+        "constraint": '{"users": {"where": ["status = \'active\'"]}}',
+        "fused": '{"fields": {"users": ["username", "email"]}, "constraints": {"users": {"where": ["status = \'active\'"]}}}',
+        "sql": '{"sql": "SELECT username, email FROM users WHERE status = \'active\'", "description": "活跃用户"}',
+    }
+
+    def __init__(self):
+        self.stages = []
+
+    async def generate(self, prompt, stage=None, **kwargs):
+        self.stages.append(stage)
+        return self.RESPONSES[stage]
+
+def make_pipeline(pipeline_mode):
+    llm = FakeLLM()
+    registry = ResourceRegistry()
+    schema_store = SchemaStore(engine, registry)
+    generator = SQLGenerator(
+        llm_service=llm,
+        entity_service=EntityService(llm, schema_store, registry),
+        constraint_service=ConstraintService(llm, schema_store, registry),
+        prompt_service=PromptService(registry, schema_store),
+        schema_store=schema_store,
+        pipeline_mode=pipeline_mode
+    )
+    return generator, llm
+
+@pytest.mark.asyncio
+async def test_fused_mode_saves_one_llm_call():
+    split, split_llm = make_pipeline("split")
+    fused, fused_llm = make_pipeline("fused")
+    query = "查询所有活跃用户的用户名和邮箱"
+    split_result = await split.generate_sql(query)
+    fused_result = await fused.generate_sql(query)
+
+    assert split_llm.stages == ["table", "field", "constraint", "sql"]
+    assert fused_llm.stages == ["table", "fused", "sql"]
+    assert split_result.keys() == fused_result.keys()
+    for key in ("sql", "description", "entities", "constraints"):
+        assert split_result[key] == fused_result[key]
+    assert fused_result["constraints"]["users"]["limit"] is None
@@ -0,0 +1,7 @@
+import sys
+
+def test_importing_main_has_no_side_effects():
+    import app.main as app_main
+    # 服务实例在 lifespan 中创建，未启用的向量库不会被导入
+    assert app_main.sql_generator is None
+    assert "chromadb" not in sys.modules
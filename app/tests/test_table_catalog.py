@@ -0,0 +1,72 @@
+import pytest
+from app.database.table_catalog import TableCatalogIndex
+
+class FakeRegistry:
+    def __init__(self, descriptions):
+        self.descriptions = descriptions
+
+    def get_table_descriptions(self):
+        return {table: {"content": content} for table, content in self.descriptions.items()}
+
+    def get_table_ddl(self, table):
+        return None
+
+class FakeVectorStore:
+    def __init__(self, distances=None):
+        self.records = {}
+        self.upserted = []
+        self.deleted = []
+        self.distances = distances or {}
+
+    async def get_or_create_collection(self, name, metadata=None):
+        return name
+
+    async def get_metadatas(self, collection_name):
+        return {doc_id: record["metadata"] for doc_id, record in self.records.items()}
+
+    async def bulk_upsert(self, collection_name, documents, metadatas, ids, progress=None):
+        self.upserted.append(list(ids))
+        for doc_id, document, metadata in zip(ids, documents, metadatas):
+            self.records[doc_id] = {"document": document, "metadata": metadata}
+        if progress is not None:
+            progress(len(ids), len(ids))
+        return len(ids)
+
+    async def delete_documents(self, collection_name, ids):
+        self.deleted.append(list(ids))
+        for doc_id in ids:
+            self.records.pop(doc_id, None)
+
+    async def query_similar(self, collection_name, query_text, n_results=5):
+        ranked = sorted(self.distances.items(), key=lambda item: item[1])[:n_results]
+        return {"ids": [[table for table, _ in ranked]], "distances": [[distance for _, distance in ranked]]}
+
+@pytest.mark.asyncio
+async def test_sync_upserts_changed_tables_and_deletes_removed():
+    registry = FakeRegistry({"users": "用户信息表", "orders": "订单表"})
+    vector_store = FakeVectorStore()
+    catalog = TableCatalogIndex(vector_store, registry)
+    await catalog.sync()
+    assert sorted(vector_store.upserted[0]) == ["orders", "users"]
+
+    # 内容未变化的表不重复写入
+    await catalog.sync()
+    assert len(vector_store.upserted) == 1
+
+    registry.descriptions = {"users": "用户信息表，包含邮箱", "payments": "支付记录表"}
+    await catalog.sync()
+    assert sorted(vector_store.upserted[1]) == ["payments", "users"]
+    assert vector_store.deleted == [["orders"]]
+    assert sorted(vector_store.records) == ["payments", "users"]
+
+@pytest.mark.asyncio
+async def test_search_applies_min_similarity():
+    vector_store = FakeVectorStore(distances={"users": 0.1, "orders": 0.3, "payments": 0.8})
+    catalog = TableCatalogIndex(vector_store, FakeRegistry({}))
+    results = await catalog.search("用户的订单", top_k=3, min_similarity=0.5)
+    assert [r["table"] for r in results] == ["users", "orders"]
+    assert results[0]["similarity"] == pytest.approx(0.9)
+
+    # 没有表达到阈值时返回未过滤的 top-k
+    results = await catalog.search("天气", top_k=2, min_similarity=0.95)
+    assert [r["table"] for r in results] == ["users", "orders"]
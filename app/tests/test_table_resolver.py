@@ -0,0 +1,50 @@
+import json
+import pytest
+from app.database.resource_registry import ResourceRegistry
+from app.services.table_resolver import TableResolver
+
+@pytest.fixture
+def registry(tmp_path):
+    (tmp_path / "resources" / "prompts").mkdir(parents=True)
+    (tmp_path / "resources" / "schemas" / "ddl").mkdir(parents=True)
+    descriptions = tmp_path / "resources" / "schemas" / "descriptions"
+    descriptions.mkdir(parents=True)
+    (tmp_path / "config").mkdir()
+    (descriptions / "users.md").write_text("## users 表\n\n用户信息表 users，存储用户。\n", encoding="utf-8")
+    (descriptions / "orders.md").write_text("## orders 表\n\n订单表 orders，存储订单。\n", encoding="utf-8")
+    (descriptions / "user_logs.md").write_text("## user_logs 表\n\n登录日志 user_logs。\n", encoding="utf-8")
+    (tmp_path / "config" / "table_synonyms.json").write_text(json.dumps({
+        "users": ["用户", "会员"],
+        "user_logs": ["用户"],
+        "orders": ["订单", "下单"],
+        "missing": ["不存在"]
+    }, ensure_ascii=False), encoding="utf-8")
+    return ResourceRegistry(tmp_path / "resources", str(tmp_path / "config"))
+
+def test_resolve_synonyms_and_names(registry):
+    resolver = TableResolver(registry, threshold=0.9)
+    resolution = resolver.resolve("每个会员的订单数量")
+    assert resolution["tables"] == ["orders", "users"]
+    assert resolution["confidence"] == 0.95
+    assert resolver.resolve("select * from orders")["confidence"] == 1.0
+    # 英文词条要求完整单词
+    assert resolver.resolve("username 是什么")["tables"] == []
+
+def test_ambiguous_and_unmatched_fall_back(registry):
+    resolver = TableResolver(registry, threshold=0.9)
+    # "用户" 同时指向 users 与 user_logs，且没有其他词条消歧
+    assert resolver.resolve("用户的订单")["confidence"] < 0.9
+    assert resolver.try_resolve("用户的订单") is None
+    assert resolver.try_resolve("会员的订单") == ["orders", "users"]
+    assert resolver.try_resolve("今天天气如何") is None
+    stats = resolver.get_stats()
+    assert stats["fast_path"] == 1 and stats["fallback"] == 2
+
+def test_unmatched_nouns_fall_back(registry):
+    resolver = TableResolver(registry, threshold=0.9)
+    # "商品评价" 不在词典中，可能是未收录的表，不能只返回 users
+    resolution = resolver.resolve("每个会员的商品评价数量")
+    assert resolution["tables"] == ["users"]
+    assert resolution["uncovered"] == ["商品评价"]
+    assert resolver.try_resolve("每个会员的商品评价数量") is None
+    assert resolver.resolve("查询所有会员的订单")["uncovered"] == []
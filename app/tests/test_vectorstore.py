@@ -0,0 +1,63 @@
+import asyncio
+import pytest
+from app.database.vectorstore import VectorStore
+
+class FakeCollection:
+    def __init__(self):
+        self.queries = []
+        self.upserts = []
+
+    def query(self, query_texts, n_results):
+        self.queries.append(list(query_texts))
+        return {
+            "ids": [[f"id-{text}"] for text in query_texts],
+            "metadatas": [[{"question": text}] for text in query_texts],
+            "distances": [[0.1] for _ in query_texts],
+            "embeddings": None,
+            "included": ["metadatas", "distances"]
+        }
+
+    def upsert(self, documents, metadatas, ids):
+        self.upserts.append(list(ids))
+
+class FakeClient:
+    def __init__(self):
+        self.collection = FakeCollection()
+        self.get_calls = 0
+
+    def get_collection(self, name):
+        self.get_calls += 1
+        return self.collection
+
+    def get_max_batch_size(self):
+        return 100
+
+def make_store(**kwargs) -> VectorStore:
+    store = VectorStore(max_workers=2, **kwargs)
+    store._client = FakeClient()
+    return store
+
+@pytest.mark.asyncio
+async def test_concurrent_queries_are_batched_into_one_call():
+    store = make_store()
+    results = await asyncio.gather(*(store.query_similar("c", f"q{i}", n_results=1) for i in range(5)))
+    assert [r["ids"] for r in results] == [[[f"id-q{i}"]] for i in range(5)]
+    assert results[2]["metadatas"] == [[{"question": "q2"}]]
+    assert store.client.collection.queries == [[f"q{i}" for i in range(5)]]
+
+    await store.query_similar("c", "again", n_results=1)
+    # 集合句柄只获取一次
+    assert store.client.get_calls == 1
+    store.close()
+
+@pytest.mark.asyncio
+async def test_bulk_upsert_writes_in_chunks_with_progress():
+    store = make_store(batch_size=500)
+    progress = []
+    ids = [str(i) for i in range(250)]
+    written = await store.bulk_upsert("c", documents=ids, ids=ids, progress=lambda done, total: progress.append((done, total)))
+    assert written == 250
+    # 批大小受 Chroma 单次写入上限约束
+    assert [len(chunk) for chunk in store.client.collection.upserts] == [100, 100, 50]
+    assert progress == [(100, 250), (200, 250), (250, 250)]
+    store.close()
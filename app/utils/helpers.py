@@ -1,20 +1,114 @@
-import json
 import logging
-from typing import Any
+import re
+import unicodedata
+from typing import Any, Dict, List, Optional, Union
+from app.utils.logging_setup import sample_payload
 
 logger = logging.getLogger(__name__)
 
-__all__ = ['log_api_call']  # 明确指定导出的函数
+__all__ = ['log_api_call', 'normalize_query', 'normalize_sql', 'referenced_tables', 'process_memory']  # 明确指定导出的函数
+
+def _is_number_punct(text: str, i: int) -> bool:
+    """数字中的标点：小数点、时间/日期分隔符等两侧为数字的标点，以及数字前的负号和小数点"""
+    if i + 1 >= len(text) or not text[i + 1].isdigit():
+        return False
+    return text[i] in "-." or (i > 0 and text[i - 1].isdigit())
+
+# 两侧都是汉字的空白
+_CJK_SPACE_RE = re.compile(r"(?<=[\u4e00-\u9fff])\s+(?=[\u4e00-\u9fff])")
+
+def normalize_query(text: str) -> str:
+    """规范化用户问题：统一全角半角、去除标点（保留数字中的标点）、去掉汉字之间的空白、折叠空白并忽略大小写"""
+    text = unicodedata.normalize("NFKC", text).casefold()
+    chars = [
+        " " if ch.isspace() else ch
+        for i, ch in enumerate(text)
+        if not unicodedata.category(ch).startswith("P") or _is_number_punct(text, i)
+    ]
+    return " ".join(_CJK_SPACE_RE.sub("", "".join(chars)).split())
+
+# 字符串字面量、带引号的标识符、行注释与块注释
+_SQL_TOKEN_RE = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|--[^\n]*|/\*.*?\*/", re.S)
+
+def normalize_sql(sql: str) -> str:
+    """规范化SQL：去除注释、折叠字面量之外的空白并去掉末尾分号，字面量内容保持不变"""
+    parts = []
+    code = []
+    last = 0
+    for match in _SQL_TOKEN_RE.finditer(sql):
+        code.append(sql[last:match.start()])
+        token = match.group()
+        if token.startswith(("--", "/*")):
+            code.append(" ")
+        else:
+            parts.append(re.sub(r"\s+", " ", "".join(code)))
+            parts.append(token)
+            code = []
+        last = match.end()
+    code.append(sql[last:])
+    parts.append(re.sub(r"\s+", " ", "".join(code)))
+    return "".join(parts).strip().rstrip(";").strip()
+
+_IDENT = r'(?:"[^"]+"|[A-Za-z_][A-Za-z0-9_$]*)'
+_TABLE_REF = rf'{_IDENT}(?:\s*\.\s*{_IDENT})?'
+_FROM_RE = re.compile(
+    rf'\b(?:from|join)\s+({_TABLE_REF}(?:\s+(?:as\s+)?{_IDENT})?(?:\s*,\s*{_TABLE_REF}(?:\s+(?:as\s+)?{_IDENT})?)*)',
+    re.I
+)
+
+def referenced_tables(sql: str) -> List[str]:
+    """
+    从SQL的 FROM / JOIN 子句中提取表名（去掉 schema 前缀）
+
+    只做词法匹配，结果可能包含 CTE 名，也无法展开视图；有执行计划时应优先使用计划中的表。
+    """
+    # 字符串字面量替换为空串，避免把其中的 from xxx 当作表
+    code = _SQL_TOKEN_RE.sub(lambda m: "''" if m.group().startswith("'") else m.group(), normalize_sql(sql))
+    tables = set()
+    for match in _FROM_RE.finditer(code):
+        for ref in match.group(1).split(","):
+            name = re.match(_TABLE_REF, ref.strip()).group().split(".")[-1].strip()
+            tables.add(name[1:-1] if name.startswith('"') else name.lower())
+    return sorted(tables)
 
 def log_api_call(func_name: str, input_data: Any, output_data: Any = None, error: Exception = None):
-    """记录 API 调用的详细信息"""
+    """记录 API 调用信息，完整输出按采样记录，出错时总是记录"""
     try:
         log_data = {
             "function": func_name,
             "input": input_data,
-            "output": output_data,
             "error": str(error) if error else None
         }
-        logger.info(f"API调用详情: {json.dumps(log_data, ensure_ascii=False, indent=2)}")
+        if sample_payload(error is not None):
+            log_data["output"] = output_data
+        elif isinstance(output_data, dict) and "sql" in output_data:
+            log_data["sql"] = output_data["sql"]
+        logger.log(logging.ERROR if error else logging.INFO, "API调用详情", extra={"api_call": log_data})
     except Exception as e:
-        logger.error(f"记录API调用信息时发生错误: {str(e)}") 
\ No newline at end of file
+        logger.error(f"记录API调用信息时发生错误: {str(e)}")
+
+# /proc/<pid>/smaps_rollup 中关心的字段（单位 kB）
+_SMAPS_FIELDS = ("Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty")
+
+def process_memory(pid: Union[int, str] = "self") -> Optional[Dict[str, float]]:
+    """
+    读取进程内存占用（MB）：rss、pss、shared 与 private
+
+    多进程模式下 private 即工作进程相对主进程的额外开销（写时复制后被修改的页）。
+    非 Linux 或进程已退出时返回 None。
+    """
+    try:
+        with open(f"/proc/{pid}/smaps_rollup", "r") as f:
+            values = {}
+            for line in f:
+                key, _, rest = line.partition(":")
+                if key in _SMAPS_FIELDS:
+                    values[key] = int(rest.split()[0]) / 1024
+    except OSError:
+        return None
+    return {
+        "rss_mb": values.get("Rss", 0.0),
+        "pss_mb": values.get("Pss", 0.0),
+        "shared_mb": values.get("Shared_Clean", 0.0) + values.get("Shared_Dirty", 0.0),
+        "private_mb": values.get("Private_Clean", 0.0) + values.get("Private_Dirty", 0.0)
+    }
@@ -0,0 +1,142 @@
+from typing import Any, Dict, Optional
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+import random
+from app.config import settings
+from app.utils.metrics import record_log_dropped
+
+__all__ = ['JsonFormatter', 'TextFormatter', 'setup_logging', 'shutdown_logging', 'sample_payload', 'log_payload']
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - [%(filename)s:%(lineno)d] - %(message)s'
+
+# LogRecord 的标准属性，其余属性视为通过 extra 传入的字段
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "taskName"}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional[logging.Handler] = None
+
+def _extra_fields(record: logging.LogRecord) -> Dict[str, Any]:
+    return {key: value for key, value in vars(record).items() if key not in _RECORD_ATTRS}
+
+class JsonFormatter(logging.Formatter):
+    """单行 JSON 日志，extra 字段作为顶层字段输出"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "ts": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "loc": f"{record.filename}:{record.lineno}",
+            "msg": record.getMessage(),
+            **_extra_fields(record)
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data["exc"] = record.exc_text
+        return json.dumps(data, ensure_ascii=False, separators=(",", ":"), default=str)
+
+class TextFormatter(logging.Formatter):
+    """文本日志，extra 字段以单行 JSON 追加在消息之后"""
+
+    def __init__(self):
+        super().__init__(TEXT_FORMAT)
+
+    def formatMessage(self, record: logging.LogRecord) -> str:
+        message = super().formatMessage(record)
+        extra = _extra_fields(record)
+        if extra:
+            message += " " + json.dumps(extra, ensure_ascii=False, separators=(",", ":"), default=str)
+        return message
+
+class _BackgroundQueueHandler(logging.handlers.QueueHandler):
+    """
+    把日志记录放入队列，由后台线程格式化并写入
+
+    调用线程只合并消息参数并渲染异常堆栈；extra 中的对象在后台线程序列化，记录后不应再修改。
+    队列已满时丢弃记录并计数，不阻塞事件循环。
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            record_log_dropped()
+
+def setup_logging(
+    level: Optional[str] = None,
+    log_file: Optional[str] = None,
+    json_format: Optional[bool] = None
+) -> bool:
+    """
+    配置根日志：控制台与按大小滚动的文件，经队列由后台线程写出
+
+    根日志已有处理器时（如测试或基准脚本已配置）不做修改，返回 False。
+    """
+    global _listener, _queue_handler
+    root = logging.getLogger()
+    if root.handlers:
+        return False
+
+    level = level or settings.LOG_LEVEL
+    log_file = settings.LOG_FILE if log_file is None else log_file
+    json_format = settings.LOG_JSON if json_format is None else json_format
+    formatter = JsonFormatter() if json_format else TextFormatter()
+
+    handlers = [logging.StreamHandler()]
+    if log_file:
+        # 首次写日志时才创建文件
+        handlers.append(logging.handlers.RotatingFileHandler(
+            log_file,
+            maxBytes=settings.LOG_MAX_BYTES,
+            backupCount=settings.LOG_BACKUP_COUNT,
+            encoding="utf-8",
+            delay=True
+        ))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.Queue(maxsize=settings.LOG_QUEUE_SIZE)
+    _queue_handler = _BackgroundQueueHandler(log_queue)
+    root.addHandler(_queue_handler)
+    root.setLevel(level)
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+    return True
+
+def shutdown_logging():
+    """写出队列中剩余的日志并停止后台线程，之后可重新调用 setup_logging"""
+    global _listener, _queue_handler
+    if _queue_handler is not None:
+        logging.getLogger().removeHandler(_queue_handler)
+        _queue_handler = None
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+def sample_payload(error: bool = False) -> bool:
+    """是否记录完整的提示词/响应：出错时总是记录，否则按 LOG_PAYLOAD_SAMPLE_RATE 采样"""
+    return error or random.random() < settings.LOG_PAYLOAD_SAMPLE_RATE
+
+def log_payload(logger: logging.Logger, message: str, error: bool = False, **payload) -> bool:
+    """按采样记录完整的提示词/响应等大字段，返回是否已记录"""
+    if not sample_payload(error):
+        return False
+    logger.log(logging.ERROR if error else logging.INFO, message, extra={"payload": payload})
+    return True
@@ -0,0 +1,176 @@
+from typing import Dict, Any, Optional
+from contextlib import contextmanager
+import time
+from prometheus_client import Counter, Gauge, Histogram
+from app.utils.tokenizer import count_tokens
+
+__all__ = [
+    'STAGE_LATENCY', 'LLM_PROMPT_CHARS', 'LLM_RESPONSE_CHARS', 'LLM_TOKENS',
+    'LLM_BACKEND_DURATION', 'LLM_PROMPT_TOKENS_ESTIMATED', 'CACHE_REQUESTS', 'stage_timer', 'record_llm_call',
+    'record_cache_lookup', 'SINGLEFLIGHT_CALLS', 'record_singleflight',
+    'TABLE_RESOLUTIONS', 'TABLE_RESOLUTION_CONFIDENCE', 'record_table_resolution',
+    'COST_GUARD_VERDICTS', 'record_cost_guard', 'LLM_BACKEND_CALLS', 'record_backend_call',
+    'LLM_HEDGED_REQUESTS', 'record_hedged_request', 'LLM_FAILOVERS', 'record_backend_failover', 'LLM_CIRCUIT_STATE', 'record_circuit_state',
+    'LOG_RECORDS_DROPPED', 'record_log_dropped', 'EXAMPLE_LOOKUPS', 'record_example_lookup'
+]
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+SIZE_BUCKETS = (256, 1024, 2048, 4096, 8192, 16384, 32768, 65536, 131072)
+TOKEN_BUCKETS = (64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768)
+
+# 流水线各阶段耗时：table_extraction / field_extraction / constraint_analysis /
+# field_constraint_extraction / business_rules / prompt_build / sql_generation /
+# sql_explain / db_execution / total
+STAGE_LATENCY = Histogram(
+    "nl2sql_stage_duration_seconds",
+    "流水线各阶段耗时",
+    ["stage"],
+    buckets=LATENCY_BUCKETS
+)
+LLM_PROMPT_CHARS = Histogram(
+    "nl2sql_llm_prompt_chars",
+    "发送给LLM的提示词字符数",
+    ["stage"],
+    buckets=SIZE_BUCKETS
+)
+LLM_RESPONSE_CHARS = Histogram(
+    "nl2sql_llm_response_chars",
+    "LLM响应字符数",
+    ["stage"],
+    buckets=SIZE_BUCKETS
+)
+LLM_PROMPT_TOKENS_ESTIMATED = Histogram(
+    "nl2sql_llm_prompt_tokens_estimated",
+    "发送给LLM的提示词 token 数（本地估算）",
+    ["stage"],
+    buckets=TOKEN_BUCKETS
+)
+LLM_TOKENS = Counter(
+    "nl2sql_llm_tokens_total",
+    "LLM后端报告的 token 数（prompt_eval_count / eval_count）",
+    ["stage", "kind"]
+)
+LLM_BACKEND_DURATION = Histogram(
+    "nl2sql_llm_backend_duration_seconds",
+    "LLM后端报告的耗时（total / load / prompt_eval / eval）",
+    ["stage", "phase"],
+    buckets=LATENCY_BUCKETS
+)
+CACHE_REQUESTS = Counter(
+    "nl2sql_cache_requests_total",
+    "缓存查询次数",
+    ["cache", "result"]
+)
+SINGLEFLIGHT_CALLS = Counter(
+    "nl2sql_singleflight_calls_total",
+    "合并执行的调用次数，leader 为实际执行者，follower 为共享结果的等待者",
+    ["name", "role"]
+)
+TABLE_RESOLUTIONS = Counter(
+    "nl2sql_table_resolution_total",
+    "词典表识别结果，fast_path 为跳过 LLM 表识别，fallback 为回退到 LLM",
+    ["path"]
+)
+TABLE_RESOLUTION_CONFIDENCE = Histogram(
+    "nl2sql_table_resolution_confidence",
+    "词典表识别的置信度分布，用于调整阈值",
+    buckets=(0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.85, 0.9, 0.95, 1.0)
+)
+COST_GUARD_VERDICTS = Counter(
+    "nl2sql_cost_guard_verdicts_total",
+    "执行前代价检查的判定结果：allow / limit / reject",
+    ["action"]
+)
+LLM_BACKEND_CALLS = Counter(
+    "nl2sql_llm_backend_calls_total",
+    "各LLM后端的调用结果：success / error / cancelled（对冲请求中落败被取消）",
+    ["backend", "stage", "outcome"]
+)
+LLM_HEDGED_REQUESTS = Counter(
+    "nl2sql_llm_hedged_requests_total",
+    "发出对冲请求的调用次数，winner 为最终先返回的一方：primary / hedge / none",
+    ["stage", "winner"]
+)
+LLM_FAILOVERS = Counter(
+    "nl2sql_llm_failovers_total",
+    "已发出的请求全部失败后故障转移到下一个后端的次数",
+    ["backend", "stage"]
+)
+LLM_CIRCUIT_STATE = Gauge(
+    "nl2sql_llm_circuit_state",
+    "LLM后端熔断器状态：0 关闭，1 半开，2 打开",
+    ["backend"]
+)
+EXAMPLE_LOOKUPS = Counter(
+    "nl2sql_example_lookups_total",
+    "SQL示例检索结果：reuse 为直接复用跳过全部 LLM 阶段，fewshot 为加入提示词，miss 为无相似示例",
+    ["result"]
+)
+LOG_RECORDS_DROPPED = Counter(
+    "nl2sql_log_records_dropped_total",
+    "日志队列已满时丢弃的日志条数"
+)
+CIRCUIT_STATE_VALUES = {"closed": 0, "half_open": 1, "open": 2}
+
+@contextmanager
+def stage_timer(stage: str):
+    """记录代码块耗时到阶段耗时直方图"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_LATENCY.labels(stage=stage).observe(time.perf_counter() - start)
+
+def record_llm_call(
+    stage: Optional[str],
+    prompt: str,
+    response: str,
+    backend_stats: Optional[Dict[str, Any]] = None
+):
+    """记录一次LLM调用的提示词/响应大小及后端报告的 token 数与耗时"""
+    stage = stage or "unknown"
+    LLM_PROMPT_CHARS.labels(stage=stage).observe(len(prompt))
+    LLM_RESPONSE_CHARS.labels(stage=stage).observe(len(response))
+    LLM_PROMPT_TOKENS_ESTIMATED.labels(stage=stage).observe(count_tokens(prompt))
+    if not backend_stats:
+        return
+    if "prompt_eval_count" in backend_stats:
+        LLM_TOKENS.labels(stage=stage, kind="prompt").inc(backend_stats["prompt_eval_count"])
+    if "eval_count" in backend_stats:
+        LLM_TOKENS.labels(stage=stage, kind="completion").inc(backend_stats["eval_count"])
+    # Ollama 的耗时单位为纳秒
+    for phase in ("total", "load", "prompt_eval", "eval"):
+        duration = backend_stats.get(f"{phase}_duration")
+        if duration is not None:
+            LLM_BACKEND_DURATION.labels(stage=stage, phase=phase).observe(duration / 1e9)
+
+def record_cache_lookup(cache: str, hit: bool):
+    CACHE_REQUESTS.labels(cache=cache, result="hit" if hit else "miss").inc()
+
+def record_singleflight(name: str, role: str):
+    SINGLEFLIGHT_CALLS.labels(name=name, role=role).inc()
+
+def record_table_resolution(confidence: float, fast_path: bool):
+    TABLE_RESOLUTIONS.labels(path="fast_path" if fast_path else "fallback").inc()
+    TABLE_RESOLUTION_CONFIDENCE.observe(confidence)
+
+def record_cost_guard(action: str):
+    COST_GUARD_VERDICTS.labels(action=action).inc()
+
+def record_backend_call(backend: str, stage: Optional[str], outcome: str):
+    LLM_BACKEND_CALLS.labels(backend=backend, stage=stage or "unknown", outcome=outcome).inc()
+
+def record_hedged_request(stage: Optional[str], winner: str):
+    LLM_HEDGED_REQUESTS.labels(stage=stage or "unknown", winner=winner).inc()
+
+def record_backend_failover(backend: str, stage: Optional[str]):
+    LLM_FAILOVERS.labels(backend=backend, stage=stage or "unknown").inc()
+
+def record_circuit_state(backend: str, state: str):
+    LLM_CIRCUIT_STATE.labels(backend=backend).set(CIRCUIT_STATE_VALUES[state])
+
+def record_log_dropped():
+    LOG_RECORDS_DROPPED.inc()
+
+def record_example_lookup(result: str):
+    EXAMPLE_LOOKUPS.labels(result=result).inc()
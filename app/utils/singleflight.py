@@ -0,0 +1,60 @@
+from typing import Dict, Any, Awaitable, Callable, Hashable, Optional
+import asyncio
+import logging
+from app.utils.metrics import record_singleflight
+
+logger = logging.getLogger(__name__)
+
+__all__ = ['SingleFlight']
+
+class SingleFlight:
+    """
+    合并相同 key 的并发调用
+
+    同一 key 在执行期间到达的调用共享同一个任务，全部拿到相同的结果或异常。
+    单个等待者被取消不会影响共享任务；只有所有等待者都取消时才取消任务。
+    """
+
+    def __init__(self, name: Optional[str] = None):
+        self.name = name
+        self._tasks: Dict[Hashable, asyncio.Task] = {}
+        self._waiters: Dict[Hashable, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._tasks)
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._tasks.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._tasks[key] = task
+            self._waiters[key] = 0
+            task.add_done_callback(lambda t: self._on_done(key, t))
+            role = "leader"
+        else:
+            role = "follower"
+        if self.name:
+            record_singleflight(self.name, role)
+
+        self._waiters[key] += 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if self._tasks.get(key) is task and self._waiters[key] == 1 and not task.done():
+                logger.debug(f"所有等待者均已取消，取消共享任务: {key}")
+                # 立即移除，之后到达的调用启动新任务，而不是加入正在取消的任务
+                del self._tasks[key]
+                del self._waiters[key]
+                task.cancel()
+            raise
+        finally:
+            if self._tasks.get(key) is task:
+                self._waiters[key] -= 1
+
+    def _on_done(self, key: Hashable, task: asyncio.Task):
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+            del self._waiters[key]
+        # 取出异常，避免无人等待时出现 "exception was never retrieved" 警告
+        if not task.cancelled():
+            task.exception()
@@ -0,0 +1,138 @@
+"""
+本地模拟 Ollama /api/generate 服务，用于基准测试
+
+根据提示词内容识别流水线阶段并返回预置的 JSON 响应，支持注入延迟、
+流式（NDJSON）响应，并统计每个阶段收到的调用次数。
+
+单独运行：
+    python -m benchmarks.mock_ollama --port 11435 --latency 0.2
+"""
+from typing import Dict, Optional
+import argparse
+import asyncio
+import json
+import random
+from aiohttp import web
+
+STAGE_MARKERS = [
+    ("table", "可用的表以及表描述信息"),
+    ("fused", "数据建模与SQL查询优化专家"),
+    ("field", "数据建模专家"),
+    ("constraint", "SQL查询优化专家"),
+    ("sql", "PostgreSQL 数据库专家"),
+]
+
+CANNED_RESPONSES = {
+    "table": ["users"],
+    "field": {"users": ["id", "username", "email"]},
+    "constraint": {
+        "users": {
+            "where": ["status = 'active'"],
+            "group_by": [],
+            "having": [],
+            "order_by": ["created_at DESC"],
+            "limit": 10
+        }
+    },
+    "sql": {
+        "sql": "SELECT u.id, u.username, u.email FROM users u WHERE u.status = 'active' ORDER BY u.created_at DESC LIMIT 10",
+        "description": "查询最近创建的活跃用户"
+    },
+}
+CANNED_RESPONSES["fused"] = {
+    "fields": CANNED_RESPONSES["field"],
+    "constraints": CANNED_RESPONSES["constraint"],
+}
+
+def detect_stage(prompt: str) -> str:
+    for stage, marker in STAGE_MARKERS:
+        if marker in prompt:
+            return stage
+    return "unknown"
+
+class MockOllama:
+    def __init__(
+        self,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        stage_latency: Optional[Dict[str, float]] = None,
+        chunk_size: int = 8
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.stage_latency = stage_latency or {}
+        self.chunk_size = chunk_size
+        self.calls: Dict[str, int] = {}
+
+    @property
+    def total_calls(self) -> int:
+        return sum(self.calls.values())
+
+    def reset(self):
+        self.calls.clear()
+
+    def _delay(self, stage: str) -> float:
+        base = self.stage_latency.get(stage, self.latency)
+        return max(0.0, base + random.uniform(-self.jitter, self.jitter))
+
+    async def handle_generate(self, request: web.Request) -> web.StreamResponse:
+        payload = await request.json()
+        prompt = payload.get("prompt", "")
+        stage = detect_stage(prompt)
+        self.calls[stage] = self.calls.get(stage, 0) + 1
+        text = json.dumps(CANNED_RESPONSES.get(stage, {}), ensure_ascii=False)
+        stats = {
+            "model": payload.get("model"),
+            "done": True,
+            "prompt_eval_count": len(prompt) // 2,
+            "eval_count": len(text) // 2,
+        }
+        delay = self._delay(stage)
+
+        if not payload.get("stream"):
+            await asyncio.sleep(delay)
+            stats["total_duration"] = int(delay * 1e9)
+            stats["eval_duration"] = int(delay * 0.8 * 1e9)
+            stats["prompt_eval_duration"] = int(delay * 0.2 * 1e9)
+            return web.json_response({"response": text, **stats})
+
+        # 流式响应：先等待首 token 延迟，再逐段输出
+        response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+        await response.prepare(request)
+        chunks = [text[i:i + self.chunk_size] for i in range(0, len(text), self.chunk_size)]
+        await asyncio.sleep(delay * 0.2)
+        for chunk in chunks:
+            await asyncio.sleep(delay * 0.8 / max(len(chunks), 1))
+            line = json.dumps({"response": chunk, "done": False}, ensure_ascii=False)
+            await response.write((line + "\n").encode("utf-8"))
+        stats["total_duration"] = int(delay * 1e9)
+        stats["response"] = ""
+        await response.write((json.dumps(stats) + "\n").encode("utf-8"))
+        await response.write_eof()
+        return response
+
+    def create_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/api/generate", self.handle_generate)
+        return app
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> web.AppRunner:
+        """在当前事件循环中启动服务，返回 runner 与实际端口"""
+        runner = web.AppRunner(self.create_app())
+        await runner.setup()
+        site = web.TCPSite(runner, host, port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        return runner
+
+def main():
+    parser = argparse.ArgumentParser(description="模拟 Ollama /api/generate 服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--latency", type=float, default=0.0, help="每次调用注入的延迟（秒）")
+    parser.add_argument("--jitter", type=float, default=0.0, help="延迟的随机抖动范围（秒）")
+    args = parser.parse_args()
+    web.run_app(MockOllama(args.latency, args.jitter).create_app(), host=args.host, port=args.port)
+
+if __name__ == "__main__":
+    main()
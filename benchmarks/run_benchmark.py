@@ -0,0 +1,265 @@
+"""
+端到端延迟/吞吐基准测试
+
+启动本地模拟 Ollama 服务（见 mock_ollama.py），在给定并发下分别驱动
+SQLGenerator.generate_sql（pipeline 模式）和 FastAPI 应用的 /generate-sql
+（api 模式），输出各阶段 p50/p95/p99、每秒请求数、每个请求的 LLM 调用次数
+以及进程峰值 RSS，并可写出 JSON 结果用于跨提交对比。
+
+示例：
+    python -m benchmarks.run_benchmark --requests 200 --concurrency 20 --latency 0.05
+    python -m benchmarks.run_benchmark --target both --output bench/$(git rev-parse --short HEAD).json
+"""
+from typing import Dict, List, Any, Optional
+import argparse
+import asyncio
+import json
+import logging
+import os
+import resource
+import socket
+import subprocess
+import time
+from collections import defaultdict
+
+from benchmarks.mock_ollama import MockOllama
+
+DEFAULT_QUERIES = [
+    "查询所有用户的用户名和邮箱",
+    "统计每种状态的用户数量",
+    "找出最近30天注册的活跃用户",
+    "查询最近创建的10个用户",
+    "列出邮箱以 example.com 结尾的用户",
+]
+
+STAGE_ORDER = ["tables", "fields", "constraints", "prompt", "sql", "total"]
+
+def percentile(samples: List[float], pct: float) -> float:
+    """最近秩法计算百分位数"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    return {
+        "count": len(samples),
+        "mean_ms": sum(samples) / len(samples) * 1000 if samples else 0.0,
+        "p50_ms": percentile(samples, 50) * 1000,
+        "p95_ms": percentile(samples, 95) * 1000,
+        "p99_ms": percentile(samples, 99) * 1000,
+    }
+
+def peak_rss_mb() -> float:
+    # Linux 下 ru_maxrss 单位为 KB
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except Exception:
+        return None
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+class StageRecorder:
+    """包装 SQLGenerator 的阶段迭代与 SQL 生成调用，记录每个阶段的耗时"""
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+
+    def reset(self):
+        self.samples.clear()
+
+    def instrument(self, generator):
+        recorder = self
+        iter_stages = generator._iter_stages
+        llm_generate = generator.llm.generate
+
+        async def timed_iter_stages(query, *args, **kwargs):
+            last = time.perf_counter()
+            async for stage, data in iter_stages(query, *args, **kwargs):
+                recorder.samples[stage].append(time.perf_counter() - last)
+                yield stage, data
+                last = time.perf_counter()
+
+        async def timed_generate(prompt, stage=None, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await llm_generate(prompt, stage=stage, **kwargs)
+            finally:
+                if stage == "sql":
+                    recorder.samples["sql"].append(time.perf_counter() - start)
+
+        generator._iter_stages = timed_iter_stages
+        generator.llm.generate = timed_generate
+
+async def drive(
+    call,
+    queries: List[str],
+    total: int,
+    concurrency: int,
+    recorder: StageRecorder,
+    mock: MockOllama
+) -> Dict[str, Any]:
+    """以给定并发执行 total 次请求并汇总结果"""
+    recorder.reset()
+    mock.reset()
+    semaphore = asyncio.Semaphore(concurrency)
+    errors: List[str] = []
+
+    async def one(i: int):
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await call(queries[i % len(queries)])
+                recorder.samples["total"].append(time.perf_counter() - start)
+            except Exception as e:
+                errors.append(str(e))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    elapsed = time.perf_counter() - started
+
+    return {
+        "requests": total,
+        "errors": len(errors),
+        "error_samples": errors[:5],
+        "duration_s": elapsed,
+        "requests_per_s": total / elapsed if elapsed else 0.0,
+        "llm_calls_per_request": mock.total_calls / total if total else 0.0,
+        "llm_calls_by_stage": dict(mock.calls),
+        "stages": {
+            stage: summarize(recorder.samples[stage])
+            for stage in STAGE_ORDER if recorder.samples.get(stage)
+        },
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+async def bench_pipeline(args, queries, mock) -> Dict[str, Any]:
+    from app.services.factory import create_services
+
+    generator = create_services()
+    recorder = StageRecorder()
+    recorder.instrument(generator)
+    try:
+        # 预热，排除首次建立连接的开销
+        await generator.generate_sql(queries[0])
+        return await drive(generator.generate_sql, queries, args.requests, args.concurrency, recorder, mock)
+    finally:
+        await generator.llm.close()
+
+async def bench_api(args, queries, mock) -> Dict[str, Any]:
+    import aiohttp
+    import uvicorn
+    from app import main as app_main
+
+    recorder = StageRecorder()
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(app_main.app, host="127.0.0.1", port=port, log_level="warning"))
+    server_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+    # 服务实例在应用启动时创建
+    recorder.instrument(app_main.sql_generator)
+
+    connector = aiohttp.TCPConnector(limit=args.concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        async def call(query: str):
+            async with session.post(f"http://127.0.0.1:{port}/generate-sql", json={"text": query}) as resp:
+                body = await resp.text()
+                if resp.status != 200:
+                    raise Exception(f"HTTP {resp.status}: {body[:200]}")
+
+        try:
+            await call(queries[0])
+            return await drive(call, queries, args.requests, args.concurrency, recorder, mock)
+        finally:
+            server.should_exit = True
+            await server_task
+
+def print_report(report: Dict[str, Any]):
+    for target, result in report["results"].items():
+        print(f"\n== {target} ==")
+        print(
+            f"requests={result['requests']} errors={result['errors']} "
+            f"rps={result['requests_per_s']:.1f} llm_calls/req={result['llm_calls_per_request']:.2f} "
+            f"peak_rss={result['peak_rss_mb']:.1f}MB"
+        )
+        print(f"{'stage':<12}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}")
+        for stage, stats in result["stages"].items():
+            print(f"{stage:<12}{stats['p50_ms']:>10.2f}{stats['p95_ms']:>10.2f}{stats['p99_ms']:>10.2f}")
+
+async def main_async(args):
+    queries = DEFAULT_QUERIES
+    if args.queries:
+        with open(args.queries, "r", encoding="utf-8") as f:
+            queries = [line.strip() for line in f if line.strip()]
+
+    mock = MockOllama(latency=args.latency, jitter=args.jitter)
+    runner = await mock.start()
+
+    # 配置需在导入 app 模块前写入环境变量
+    os.environ["OLLAMA_BASE_URL"] = f"http://127.0.0.1:{mock.port}"
+    os.environ["PIPELINE_MODE"] = args.pipeline_mode
+    os.environ["RESOURCE_WATCH_ENABLED"] = "false"
+    if not args.with_cache:
+        os.environ["RESULT_CACHE_ENABLED"] = "false"
+        os.environ["LLM_MEMO_ENABLED"] = "false"
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "config": {
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "latency_s": args.latency,
+            "jitter_s": args.jitter,
+            "pipeline_mode": args.pipeline_mode,
+            "with_cache": args.with_cache,
+            "queries": len(queries),
+        },
+        "results": {},
+    }
+    try:
+        if args.target in ("pipeline", "both"):
+            report["results"]["pipeline"] = await bench_pipeline(args, queries, mock)
+        if args.target in ("api", "both"):
+            report["results"]["api"] = await bench_api(args, queries, mock)
+    finally:
+        await runner.cleanup()
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="NL2SQL 流水线基准测试")
+    parser.add_argument("--target", choices=["pipeline", "api", "both"], default="pipeline")
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.05, help="模拟 LLM 每次调用的延迟（秒）")
+    parser.add_argument("--jitter", type=float, default=0.0, help="模拟延迟的随机抖动（秒）")
+    parser.add_argument("--pipeline-mode", choices=["split", "fused"], default="split")
+    parser.add_argument("--with-cache", action="store_true", help="启用结果缓存与LLM响应缓存")
+    parser.add_argument("--queries", help="问题文件，每行一个问题")
+    parser.add_argument("--output", help="JSON 结果输出路径")
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args()
+
+    # 在导入 app.main 之前配置日志，避免写入 app.log
+    logging.basicConfig(level=args.log_level)
+
+    report = asyncio.run(main_async(args))
+    print_report(report)
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已写入 {args.output}")
+
+if __name__ == "__main__":
+    main()
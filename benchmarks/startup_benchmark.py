@@ -0,0 +1,83 @@
+"""
+工作进程冷启动基准测试
+
+每轮在新的子进程中分别计时 import app.main 与 FastAPI lifespan 启动（创建服务实例、
+启动后台任务），输出 p50/max，并可写出 JSON 结果用于跨提交对比。
+启动阶段不连接数据库：关闭表结构索引与资源热加载。
+
+示例：
+    python -m benchmarks.startup_benchmark --runs 10
+    python -m benchmarks.startup_benchmark --output bench/startup-$(git rev-parse --short HEAD).json
+"""
+from typing import Dict, List
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+from benchmarks.run_benchmark import percentile, git_commit
+
+CHILD_SCRIPT = """
+import asyncio, json, logging, time
+logging.basicConfig(level=logging.WARNING)
+start = time.perf_counter()
+import app.main as app_main
+imported = time.perf_counter()
+
+async def run_lifespan():
+    async with app_main.app.router.lifespan_context(app_main.app):
+        return time.perf_counter()
+
+started = asyncio.run(run_lifespan())
+print(json.dumps({"import_s": imported - start, "startup_s": started - imported}))
+"""
+
+def run_once(env: Dict[str, str]) -> Dict[str, float]:
+    start = time.perf_counter()
+    output = subprocess.check_output([sys.executable, "-c", CHILD_SCRIPT], env=env, text=True)
+    result = json.loads(output.strip().splitlines()[-1])
+    result["process_s"] = time.perf_counter() - start
+    return result
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    return {
+        "p50_ms": percentile(samples, 50) * 1000,
+        "max_ms": max(samples) * 1000 if samples else 0.0,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="工作进程冷启动基准测试")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--output", help="JSON 结果输出路径")
+    args = parser.parse_args()
+
+    env = {
+        **os.environ,
+        "SCHEMA_CATALOG_ENABLED": "false",
+        "RESOURCE_WATCH_ENABLED": "false",
+        "QUERY_CACHE_ENABLED": "false",
+    }
+    runs = [run_once(env) for _ in range(args.runs)]
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "runs": args.runs,
+        "results": {
+            phase: summarize([run[phase] for run in runs])
+            for phase in ("import_s", "startup_s", "process_s")
+        },
+    }
+
+    print(f"{'phase':<12}{'p50(ms)':>10}{'max(ms)':>10}")
+    for phase, stats in report["results"].items():
+        print(f"{phase[:-2]:<12}{stats['p50_ms']:>10.1f}{stats['max_ms']:>10.1f}")
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已写入 {args.output}")
+
+if __name__ == "__main__":
+    main()